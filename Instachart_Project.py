@@ -31,12 +31,31 @@
 
 import pandas as pd
 
+from instacart.aggregates import reorder_metrics
+from instacart.baskets import BasketLayout
+from instacart.catalog import find_duplicates
+from instacart.charts import histogram, plot_histogram
+from instacart.cooccurrence import analyze_baskets
+from instacart.cube import OrderCube
+from instacart.dimensions import DimensionStore
+from instacart.features import build_features
+from instacart.joins import OrderIndex, attach_order_columns
+from instacart.loader import DEFAULT_DATA_DIR, load_table
+from instacart.normalize import strip_whitespace
+from instacart.profiling import step
+from instacart.quality import check_table
+from instacart.repair import repair_cart_positions
+from instacart.store import OrderProductsStore
+from instacart.topn import top_n_products
+
 
 # In[3]:
 
 
-#reading the orders Data
-orders = pd.read_csv('C:/Users/kwame/Downloads/instacart_orders.csv', sep=';')
+with step('load orders') as s:
+    #reading the orders Data
+    # Ids are read as int32, day/hour as uint8 and names as categories to keep memory low
+    orders = s.output(load_table('orders', DEFAULT_DATA_DIR))
 
 
 # In[4]:
@@ -48,8 +67,9 @@ orders.head()
 # In[5]:
 
 
-#reading the orders_products data
-order_products = pd.read_csv('C:/Users/kwame/Downloads/order_products.csv',sep=';')
+with step('load order_products') as s:
+    #reading the orders_products data
+    order_products = s.output(load_table('order_products', DEFAULT_DATA_DIR))
 
 
 # In[6]:
@@ -61,7 +81,8 @@ order_products.head()
 # In[7]:
 
 
-products = pd.read_csv('C:/Users/kwame/Downloads/products.csv',sep=';')
+with step('load products') as s:
+    products = s.output(load_table('products', DEFAULT_DATA_DIR))
 
 
 # In[8]:
@@ -73,7 +94,8 @@ products.head()
 # In[9]:
 
 
-aisles = pd.read_csv('C:/Users/kwame/Downloads/aisles.csv',sep=';')
+with step('load aisles') as s:
+    aisles = s.output(load_table('aisles', DEFAULT_DATA_DIR))
 
 
 # In[10]:
@@ -85,7 +107,8 @@ aisles.head()
 # In[11]:
 
 
-departments = pd.read_csv('C:/Users/kwame/Downloads/departments.csv',sep=';')
+with step('load departments') as s:
+    departments = s.output(load_table('departments', DEFAULT_DATA_DIR))
 
 
 # In[12]:
@@ -103,44 +126,55 @@ departments.head()
 # In[13]:
 
 
-# Check for duplicated in orders dataframe
-duplicate_orders = orders[orders.duplicated()]
-print(f"Number of duplicate rows in orders: {duplicate_orders.shape[0]}")
+with step('check orders'):
+    # Run every duplicate, missing-value and range check on orders in one pass
+    orders_quality = check_table('orders', orders)
+
+    # Check for duplicated in orders dataframe
+    duplicate_orders = orders[orders_quality.duplicated('rows')]
+    print(f"Number of duplicate rows in orders: {duplicate_orders.shape[0]}")
 
 
 # In[14]:
 
 
-# Check for all orders placed Wednesday at 2:00 AM
-wednesday_2am_orders = orders[(orders['order_dow'] == 3) & (orders['order_hour_of_day'] == 2)]
+with step('wednesday 2am orders'):
+    # Count orders into a day x hour x days-since cube once; the Wednesday
+    # 2:00 AM orders and the charts below are slices of it, not table scans
+    order_cube = OrderCube.build(orders)
 
-print(f"Number of orders placed on Wednesday at 2:00 AM: {wednesday_2am_orders.shape[0]}")
-print(wednesday_2am_orders.head())
+    print(f"Number of orders placed on Wednesday at 2:00 AM: {order_cube.count(order_dow=3, order_hour_of_day=2)}")
+
+    # The cube only holds counts; show a few of the orders themselves
+    wednesday_2am_orders = orders[(orders['order_dow'] == 3) & (orders['order_hour_of_day'] == 2)]
+    print(wednesday_2am_orders.head())
 
 
 # In[15]:
 
 
-# Remove duplicate orders
+with step('drop duplicate orders', rows_in=orders) as s:
+    # Remove duplicate orders
 
-# Check for duplicate order IDs
-duplicate_orders = orders[orders.duplicated(subset=['order_id'], keep=False)]
-print(f"Number of duplicate orders: {duplicate_orders.shape[0]}")
+    # Check for duplicate order IDs
+    duplicate_orders = orders[orders_quality.duplicated('order_id', keep=False)]
+    print(f"Number of duplicate orders: {duplicate_orders.shape[0]}")
 
-# Remove duplicate orders while keeping the first occurrence
-orders_cleaned = orders.drop_duplicates(subset=['order_id'], keep='first')
+    # Remove duplicate orders while keeping the first occurrence
+    orders_cleaned = s.output(orders_quality.drop_duplicates(orders, 'order_id'))
 
-# Verify duplicates are removed
-print(f"Number of unique orders after cleaning: {orders_cleaned.shape[0]}")
+    # Verify duplicates are removed
+    print(f"Number of unique orders after cleaning: {orders_cleaned.shape[0]}")
 
 
 # In[16]:
 
 
-# Double check for duplicate order IDs only
-duplicate_rows = orders_cleaned[orders_cleaned.duplicated(keep=False)]
+with step('recheck orders'):
+    # Double check for duplicate order IDs only
+    duplicate_rows = orders_cleaned[check_table('orders', orders_cleaned).duplicated('rows', keep=False)]
 
-print(f"Number of fully duplicate rows: {duplicate_rows.shape[0]}")
+    print(f"Number of fully duplicate rows: {duplicate_rows.shape[0]}")
 
 
 # ## Find and remove duplicate values in the order_products dataframe
@@ -148,28 +182,33 @@ print(f"Number of fully duplicate rows: {duplicate_rows.shape[0]}")
 # In[17]:
 
 
-# Check for fullly duplicate rows
+with step('check order_products'):
+    # Check for fullly duplicate rows
+    order_products_quality = check_table('order_products', order_products)
 
-duplicate_rows = order_products[order_products.duplicated(keep=False)]
+    duplicate_rows = order_products[order_products_quality.duplicated('rows', keep=False)]
 
-print(f"Number of fully duplicate rows: {duplicate_rows.shape[0]}")
+    print(f"Number of fully duplicate rows: {duplicate_rows.shape[0]}")
 
 
 # In[18]:
 
 
-# Check for duplicate order_id and product_id pairs
-duplicate_order_product_pairs = order_products[order_products.duplicated(subset=['order_id', 'product_id'], keep=False)]
-print(f"Number of duplicate order-product pairs: {duplicate_order_product_pairs.shape[0]}")
+with step('strip and dedupe order_products', rows_in=order_products) as s:
+    # Check for duplicate order_id and product_id pairs
+    duplicate_order_product_pairs = order_products[order_products_quality.duplicated('order_product', keep=False)]
+    print(f"Number of duplicate order-product pairs: {duplicate_order_product_pairs.shape[0]}")
 
-# Check for any duplicate rows with slight variations (e.g., whitespace issues)
-stripped_order_products = order_products.map(lambda x: x.strip() if isinstance(x, str) else x)
-duplicate_rows_stripped = stripped_order_products[stripped_order_products.duplicated(keep=False)]
-print(f"Number of duplicate rows after stripping whitespace: {duplicate_rows_stripped.shape[0]}")
+    # Check for any duplicate rows with slight variations (e.g., whitespace issues)
+    # Only text columns are stripped, once per distinct value; numeric columns are left as they are
+    stripped_order_products = strip_whitespace(order_products)
+    stripped_quality = check_table('order_products', stripped_order_products)
+    duplicate_rows_stripped = stripped_order_products[stripped_quality.duplicated('rows', keep=False)]
+    print(f"Number of duplicate rows after stripping whitespace: {duplicate_rows_stripped.shape[0]}")
 
-# If any tricky duplicates are found, we can drop them
-order_products_cleaned = stripped_order_products.drop_duplicates()
-print(f"Number of rows after removing tricky duplicates: {order_products_cleaned.shape[0]}")
+    # If any tricky duplicates are found, we can drop them
+    order_products_cleaned = s.output(stripped_quality.drop_duplicates(stripped_order_products))
+    print(f"Number of rows after removing tricky duplicates: {order_products_cleaned.shape[0]}")
 
 
 # ## Find and remove duplicate values in the products dataframe
@@ -182,17 +221,19 @@ print(f"Number of rows after removing tricky duplicates: {order_products_cleaned
 # In[19]:
 
 
-# Check for fully duplicate rows
-duplicate_products = products[products.duplicated(keep=False)]
+with step('check products'):
+    # Check for fully duplicate rows
+    products_quality = check_table('products', products)
+    duplicate_products = products[products_quality.duplicated('rows', keep=False)]
 
-print(f"Number of fully duplicate rows in Products DataFrame: {duplicate_products.shape[0]}")
+    print(f"Number of fully duplicate rows in Products DataFrame: {duplicate_products.shape[0]}")
 
 
 # In[20]:
 
 
  #Check for just duplicate product IDs
-duplicate_product_ids = products[products.duplicated(subset=['product_id'], keep=False)]
+duplicate_product_ids = products[products_quality.duplicated('product_id', keep=False)]
 
 print(f"Number of duplicate product IDs: {duplicate_product_ids.shape[0]}")
 
@@ -203,15 +244,13 @@ print(f"Number of duplicate product IDs: {duplicate_product_ids.shape[0]}")
 # Check for just duplicate product names (convert names to lowercase to compare better)
 
 # Convert product names to lowercase and check for duplicates
-duplicate_product_names = products[products.duplicated(subset=['product_name'], keep=False)]
+duplicate_product_names = products[products_quality.duplicated('product_name', keep=False)]
 
 print(f"Number of duplicate product names (case-sensitive): {duplicate_product_names.shape[0]}")
 
-# Convert product names to lowercase for better comparison
-products['product_name_lower'] = products['product_name'].str.lower()
-
-# Check for duplicate product names (case-insensitive)
-duplicate_product_names_lower = products[products.duplicated(subset=['product_name_lower'], keep=False)]
+# Check for duplicate product names (case-insensitive); the check lowercases
+# each distinct name once instead of adding a lowercased column
+duplicate_product_names_lower = products[products_quality.duplicated('product_name_lower', keep=False)]
 
 print(f"Number of duplicate product names (case-insensitive): {duplicate_product_names_lower.shape[0]}")
 
@@ -220,17 +259,22 @@ print(f"Number of duplicate product names (case-insensitive): {duplicate_product
 
 
 # Check for duplicate product names that aren't missing
-# Drop missing values in 'product_name'
-non_missing_products = products.dropna(subset=['product_name']).copy()
-
-# Convert product names to lowercase for better comparison
-non_missing_products.loc[:, 'product_name_lower'] = non_missing_products['product_name'].str.lower()
+# Rows with a missing 'product_name' are left out of this check
 
 # Find duplicate product names (ignoring case)
-duplicate_product_names = non_missing_products[non_missing_products.duplicated(subset=['product_name_lower'], keep=False)]
+duplicate_product_names = products[products_quality.duplicated('product_name_lower_non_missing', keep=False)]
 
 print(f"Number of duplicate product names (excluding missing values): {duplicate_product_names.shape[0]}")
 
+with step('near-duplicate product names'):
+    # Names that differ only in punctuation, spacing, unit spelling or word
+    # order; candidates come from MinHash-LSH buckets instead of comparing all pairs
+    product_catalog = find_duplicates(products)
+    near_duplicates = product_catalog.clusters
+
+    print(f"Number of near-duplicate product names: {near_duplicates.shape[0]} "
+          f"in {near_duplicates['canonical_id'].nunique()} groups")
+
 
 # ## Find and remove duplicate values in the aisle dataframe
 
@@ -243,7 +287,8 @@ print(f"Number of duplicate product names (excluding missing values): {duplicate
 
 
 # Check for fully duplicate rows in the aisles dataframe
-duplicate_aisles = aisles[aisles.duplicated(keep=False)]
+aisles_quality = check_table('aisles', aisles)
+duplicate_aisles = aisles[aisles_quality.duplicated('rows', keep=False)]
 
 # Print the number of fully duplicate rows
 print(f"Number of fully duplicate rows: {duplicate_aisles.shape[0]}")
@@ -256,7 +301,7 @@ duplicate_aisles
 
 
 # Remove fully duplicate rows from the aisles dataframe
-aisles = aisles.drop_duplicates()
+aisles = aisles_quality.drop_duplicates(aisles)
 
 # Print confirmation
 print(f"Number of rows after removing duplicates: {aisles.shape[0]}")
@@ -274,7 +319,8 @@ print(f"Number of rows after removing duplicates: {aisles.shape[0]}")
 
 
 # Check for fully duplicate rows in the department dataframe
-duplicate_departments = departments[departments.duplicated(keep=False)]
+departments_quality = check_table('departments', departments)
+duplicate_departments = departments[departments_quality.duplicated('rows', keep=False)]
 
 # Print the number of fully duplicate rows
 print(f"Number of fully duplicate rows: {duplicate_departments.shape[0]}")
@@ -287,7 +333,7 @@ duplicate_departments
 
 
 # Remove fully duplicate rows from the department dataframe
-departments = departments.drop_duplicates()
+departments = departments_quality.drop_duplicates(departments)
 
 # Print confirmation
 print(f"Number of rows after removing duplicates: {departments.shape[0]}")
@@ -302,18 +348,19 @@ print(f"Number of rows after removing duplicates: {departments.shape[0]}")
 # In[27]:
 
 
-# Check for missing values in the products DataFrame
-missing_values = products.isnull().sum()
-print("Missing values per column:\n", missing_values)
+with step('clean products'):
+    # Check for missing values in the products DataFrame
+    missing_values = pd.Series(products_quality.nulls)
+    print("Missing values per column:\n", missing_values)
 
-# Drop rows where product_name is missing and create a copy to avoid SettingWithCopyWarning
-products_cleaned = products.dropna(subset=['product_name']).copy()
+    # Drop rows where product_name is missing and create a copy to avoid SettingWithCopyWarning
+    products_cleaned = products.dropna(subset=['product_name']).copy()
 
-# Fill missing aisle_id and department_id safely
-products_cleaned.loc[:, ['aisle_id', 'department_id']] = products_cleaned[['aisle_id', 'department_id']].fillna(-1)
+    # Fill missing aisle_id and department_id safely
+    products_cleaned.loc[:, ['aisle_id', 'department_id']] = products_cleaned[['aisle_id', 'department_id']].fillna(-1)
 
-# Check if missing values are removed
-print("Missing values after cleaning:\n", products_cleaned.isnull().sum())
+    # Check if missing values are removed
+    print("Missing values after cleaning:\n", products_cleaned.isnull().sum())
 
 
 # In[28]:
@@ -343,11 +390,14 @@ print(f"Are all missing product names associated with department ID 21? {all_dep
 
 
 # What is this ailse and department?
+# Lay the aisle and department names out in arrays indexed by id
+dimensions = DimensionStore.from_tables(aisles=aisles, departments=departments)
+
 # Get the aisle name for ID 100
-aisle_name = aisles.loc[aisles['aisle_id'] == 100, 'aisle'].values[0]
+aisle_name = dimensions.get(100, 'aisle')
 
 # Get the department name for ID 21
-department_name = departments.loc[departments['department_id'] == 21, 'department'].values[0]
+department_name = dimensions.get(21, 'department')
 
 print(f"Aisle ID 100 corresponds to: {aisle_name}")
 print(f"Department ID 21 corresponds to: {department_name}")
@@ -357,13 +407,16 @@ print(f"Department ID 21 corresponds to: {department_name}")
 
 
 # Fill missing product names with 'Unknown'
-# Fill missing product names with 'Unknown'
-products['product_name'].fillna('Unknown', inplace=True)
+# product_name is categorical, so 'Unknown' has to be added as a category first
+products['product_name'] = products['product_name'].cat.add_categories('Unknown').fillna('Unknown')
 
 # Verify that there are no missing values left
 missing_count = products['product_name'].isna().sum()
 print(f"Number of missing product names after filling: {missing_count}")
 
+# Id -> name lookups for the rest of the analysis, built once from the final products table
+dimensions = DimensionStore.from_tables(products, aisles, departments)
+
 
 # ## orders data frame
 
@@ -371,17 +424,18 @@ print(f"Number of missing product names after filling: {missing_count}")
 
 
 # Check for missing values in the orders DataFrame
-missing_values = orders.isnull().sum()
+missing_values = pd.Series(orders_quality.nulls)
 print("Missing values in each column:\n", missing_values)
 
 
 # In[33]:
 
 
-# Are there any missing values where it's not a customer's first order?
-# Check for missing values in 'days_since_prior_order'
-missing_orders = orders[orders['days_since_prior_order'].isnull()]
-print(f"Total missing values in 'days_since_prior_order': {missing_orders.shape[0]}")
+with step('missing days_since_prior_order'):
+    # Are there any missing values where it's not a customer's first order?
+    # Check for missing values in 'days_since_prior_order'
+    missing_orders = orders[orders['days_since_prior_order'].isnull()]
+    print(f"Total missing values in 'days_since_prior_order': {missing_orders.shape[0]}")
 
 
 # Check if all missing values belong to first orders (order_number == 1)
@@ -403,64 +457,75 @@ else:
 
 
 # Check for missing values in order_products dataframe
-missing_values = order_products.isnull().sum()
+missing_values = pd.Series(order_products_quality.nulls)
 print("Missing values in order_products dataframe:\n", missing_values)
 
 
 # In[35]:
 
 
-# What are the min and max values in this column?
+with step('add_to_cart_order range'):
+    # What are the min and max values in this column?
 
-min_value = order_products['add_to_cart_order'].min()
-max_value = order_products['add_to_cart_order'].max()
+    min_value = order_products['add_to_cart_order'].min()
+    max_value = order_products['add_to_cart_order'].max()
 
-print(f"Minimum add_to_cart_order: {min_value}")
-print(f"Maximum add_to_cart_order: {max_value}")
+    print(f"Minimum add_to_cart_order: {min_value}")
+    print(f"Maximum add_to_cart_order: {max_value}")
 
 
 # In[36]:
 
 
-# Save all order IDs with at least one missing value in 'add_to_cart_order'
+with step('repair missing add_to_cart_order'):
+    # Group the lines of each order into one run (sorted once by order_id);
+    # every per-order count below is an array operation over those runs
+    basket_layout = BasketLayout.from_frame(order_products)
+    missing_per_order = basket_layout.missing_cart_positions(order_products['add_to_cart_order'])
 
-# Find order_ids with missing values in 'add_to_cart_order'
-orders_with_missing = order_products[order_products['add_to_cart_order'].isna()]['order_id'].unique()
+    # Positions past 64 are missing: give them 65..n within each order, in row order,
+    # then check that every order holds exactly the positions 1..size
+    cart_repair = repair_cart_positions(order_products, layout=basket_layout)
 
-# Save to a CSV file
-pd.DataFrame(orders_with_missing, columns=['order_id']).to_csv("orders_with_missing_add_to_cart_order.csv", index=False)
-
-print(f"Saved {len(orders_with_missing)} orders with missing 'add_to_cart_order' values.")
+    print(f"Repaired {cart_repair.repaired_lines} missing 'add_to_cart_order' values "
+          f"in {cart_repair.repaired_orders} orders.")
+    print(f"Orders whose cart positions are not exactly 1..size (duplicate lines): "
+          f"{len(cart_repair.invalid_orders)}")
 
 
 # In[37]:
 
 
-# Do all orders with missing values have more than 64 products?
+with step('orders over 64 products'):
+    # Do all orders with missing values have more than 64 products?
 
-# Count the number of products per order
-order_counts = order_products.groupby('order_id')['product_id'].count()
+    # Check if all orders with missing values have more than 64 products
+    all_above_64 = (basket_layout.sizes[missing_per_order > 0] > 64).all()
 
-# Get orders with missing 'add_to_cart_order' values
-orders_with_missing = order_products[order_products['add_to_cart_order'].isna()]['order_id'].unique()
+    print(f"Do all orders with missing values have more than 64 products? {all_above_64}")
 
-# Check if all these orders have more than 64 products
-all_above_64 = (order_counts[orders_with_missing] > 64).all()
 
-print(f"Do all orders with missing values have more than 64 products? {all_above_64}")
+# In[38]:
 
 
-# In[38]:
+with step('add_to_cart_order to Int64'):
+    # Fill in the repaired positions and convert column to integer type
+    order_products = cart_repair.apply(order_products)
 
+    # Convert to nullable integer type; no values are missing after the repair
+    order_products['add_to_cart_order'] = order_products['add_to_cart_order'].astype('Int64')
 
-# Replace missing values with 999 and convert column to integer type
+    # Verify changes
+    print(order_products['add_to_cart_order'].dtype)  # Should print 'Int64'
+    print(order_products['add_to_cart_order'].isna().sum())  # This will show the count of missing values
 
-# Convert to nullable integer type (allows missing values to remain as NaN)
-order_products['add_to_cart_order'] = order_products['add_to_cart_order'].astype('Int64')
 
-# Verify changes
-print(order_products['add_to_cart_order'].dtype)  # Should print 'Int64'
-print(order_products['add_to_cart_order'].isna().sum())  # This will show the count of missing values
+with step('compact order_products'):
+    # The same lines as int32 ids, a uint8 cart position and one bit per reordered flag
+    order_products_store = OrderProductsStore.from_frame(order_products)
+    frame_bytes = order_products.memory_usage(deep=True).sum() / len(order_products)
+    print(f"order_products: {frame_bytes:.1f} bytes per row as a DataFrame, "
+          f"{order_products_store.nbytes / len(order_products_store):.3f} in the compact store")
 
 
 # 
@@ -472,30 +537,26 @@ print(order_products['add_to_cart_order'].isna().sum())  # This will show the co
 # In[39]:
 
 
-# Check the range of order_hour_of_day
-min_hour = orders['order_hour_of_day'].min()
-max_hour = orders['order_hour_of_day'].max()
+# Check the range of order_hour_of_day (computed by the quality checks above)
+min_hour = orders_quality.ranges['order_hour_of_day'].min
+max_hour = orders_quality.ranges['order_hour_of_day'].max
 
 # Check the range of order_dow
-min_dow = orders['order_dow'].min()
-max_dow = orders['order_dow'].max()
+min_dow = orders_quality.ranges['order_dow'].min
+max_dow = orders_quality.ranges['order_dow'].max
 
 # Print results
 print(f"order_hour_of_day ranges from {min_hour} to {max_hour}")
 print(f"order_dow ranges from {min_dow} to {max_dow}")
 
-# Check for unexpected values
-unexpected_hours = orders[~orders['order_hour_of_day'].between(0, 23)]
-unexpected_dow = orders[~orders['order_dow'].between(0, 6)]
-
-# Display any problematic rows
-if not unexpected_hours.empty:
+# Check for unexpected values and display any problematic rows
+if orders_quality.ranges['order_hour_of_day'].violations:
     print("Unexpected values found in order_hour_of_day:")
-    print(unexpected_hours)
+    print(orders[~orders['order_hour_of_day'].between(0, 23)])
 
-if not unexpected_dow.empty:
+if orders_quality.ranges['order_dow'].violations:
     print("Unexpected values found in order_dow:")
-    print(unexpected_dow)
+    print(orders[~orders['order_dow'].between(0, 6)])
 
 
 # 
@@ -505,21 +566,22 @@ if not unexpected_dow.empty:
 # In[40]:
 
 
-import matplotlib.pyplot as plt
-import seaborn as sns
+with step('hour of day chart'):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
-# Count orders by hour of the day
-order_hour_counts = orders['order_hour_of_day'].value_counts().sort_index()
+    # Count orders by hour of the day
+    order_hour_counts = order_cube.marginal('order_hour_of_day')
 
-# Plot the distribution
-plt.figure(figsize=(10, 5))
-sns.barplot(x=order_hour_counts.index, y=order_hour_counts.values, color="royalblue")
-plt.xlabel("Hour of Day")
-plt.ylabel("Number of Orders")
-plt.title("Grocery Shopping Trends by Hour of Day")
-plt.xticks(range(0, 24))
-plt.grid(axis='y', linestyle='--', alpha=0.7)
-plt.show()
+    # Plot the distribution
+    plt.figure(figsize=(10, 5))
+    sns.barplot(x=order_hour_counts.index, y=order_hour_counts.values, color="royalblue")
+    plt.xlabel("Hour of Day")
+    plt.ylabel("Number of Orders")
+    plt.title("Grocery Shopping Trends by Hour of Day")
+    plt.xticks(range(0, 24))
+    plt.grid(axis='y', linestyle='--', alpha=0.7)
+    plt.show()
 
 
 # ### Insights from Grocery Shopping Trends by Hour of Day
@@ -539,18 +601,19 @@ plt.show()
 # In[41]:
 
 
-# Count orders by day of the week
-order_dow_counts = orders['order_dow'].value_counts().sort_index()
+with step('day of week chart'):
+    # Count orders by day of the week
+    order_dow_counts = order_cube.marginal('order_dow')
 
-# Plot the distribution
-plt.figure(figsize=(8, 5))
-sns.barplot(x=order_dow_counts.index, y=order_dow_counts.values, color="royalblue")
-plt.xlabel("Day of the Week (0 = Sunday, 6 = Saturday)")
-plt.ylabel("Number of Orders")
-plt.title("Grocery Shopping Trends by Day of the Week")
-plt.xticks(range(0, 7), ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"])
-plt.grid(axis='y', linestyle='--', alpha=0.7)
-plt.show()
+    # Plot the distribution
+    plt.figure(figsize=(8, 5))
+    sns.barplot(x=order_dow_counts.index, y=order_dow_counts.values, color="royalblue")
+    plt.xlabel("Day of the Week (0 = Sunday, 6 = Saturday)")
+    plt.ylabel("Number of Orders")
+    plt.title("Grocery Shopping Trends by Day of the Week")
+    plt.xticks(range(0, 7), ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"])
+    plt.grid(axis='y', linestyle='--', alpha=0.7)
+    plt.show()
 
 
 # ## Insights from Grocery Shopping Trends by Day of the Week
@@ -569,18 +632,29 @@ plt.show()
 # In[42]:
 
 
-# Count occurrences of each unique value in 'days_since_prior_order'
-days_counts = orders['days_since_prior_order'].value_counts().sort_index()
+with step('days since prior order chart'):
+    # Count occurrences of each unique value in 'days_since_prior_order'
+    days_counts = order_cube.marginal('days_since_prior_order')
+
+    # Plot the distribution
+    plt.figure(figsize=(10, 5))
+    sns.barplot(x=days_counts.index, y=days_counts.values, color="royalblue")
+    plt.xlabel("Days Since Prior Order")
+    plt.ylabel("Number of Orders")
+    plt.title("Time Between Grocery Orders")
+    plt.xticks(rotation=45)
+    plt.grid(axis='y', linestyle='--', alpha=0.7)
+    plt.show()
 
-# Plot the distribution
-plt.figure(figsize=(10, 5))
-sns.barplot(x=days_counts.index, y=days_counts.values, color="royalblue")
-plt.xlabel("Days Since Prior Order")
-plt.ylabel("Number of Orders")
-plt.title("Time Between Grocery Orders")
-plt.xticks(rotation=45)
-plt.grid(axis='y', linestyle='--', alpha=0.7)
-plt.show()
+
+with step('department orders by day'):
+    # Add the order lines to the same cube: each order counts once per department
+    order_cube.update(order_products=order_products, dimensions=dimensions)
+    # Department 0 holds lines of unknown products
+    department_by_day = order_cube.marginal('department_id', 'order_dow', measure='department_orders',
+                                            department_id=range(1, order_cube.departments)).unstack()
+    department_by_day.index = dimensions.lookup(department_by_day.index, 'department').astype(str)
+    print(department_by_day)
 
 
 # ## Insights from Time Between Grocery Orders
@@ -599,28 +673,31 @@ plt.show()
 # In[43]:
 
 
-import matplotlib.pyplot as plt
-import seaborn as sns
+with step('wednesday vs saturday histogram'):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
-# Filter data for Wednesday (3) and Saturday (6)
-wednesday_orders = orders[orders['order_dow'] == 3]['order_hour_of_day']
-saturday_orders = orders[orders['order_dow'] == 6]['order_hour_of_day']
+    # Filter data for Wednesday (3) and Saturday (6)
+    wednesday_orders = orders[orders['order_dow'] == 3]['order_hour_of_day']
+    saturday_orders = orders[orders['order_dow'] == 6]['order_hour_of_day']
 
-# Plot histograms
-plt.figure(figsize=(12, 6))
-sns.histplot(wednesday_orders, bins=24, color='blue', label='Wednesday', kde=True, alpha=0.6)
-sns.histplot(saturday_orders, bins=24, color='orange', label='Saturday', kde=True, alpha=0.6)
+    # Plot histograms: the hours are counted once (one bin per hour) and the
+    # KDE is smoothed from those 24 counts, so no raw rows reach the plot
+    plt.figure(figsize=(12, 6))
+    ax = plt.gca()
+    plot_histogram(ax, histogram(wednesday_orders, discrete=True), color='blue', label='Wednesday', kde=True)
+    plot_histogram(ax, histogram(saturday_orders, discrete=True), color='orange', label='Saturday', kde=True)
 
-# Labels and title
-plt.xlabel("Hour of Day")
-plt.ylabel("Number of Orders")
-plt.title("Distribution of Orders by Hour on Wednesday vs. Saturday")
-plt.legend()
-plt.xticks(range(0, 24))
-plt.grid(axis='y', linestyle='--', alpha=0.7)
+    # Labels and title
+    plt.xlabel("Hour of Day")
+    plt.ylabel("Number of Orders")
+    plt.title("Distribution of Orders by Hour on Wednesday vs. Saturday")
+    plt.legend()
+    plt.xticks(range(0, 24))
+    plt.grid(axis='y', linestyle='--', alpha=0.7)
 
-# Show plot
-plt.show()
+    # Show plot
+    plt.show()
 
 
 # ## Insights from Order Distribution on Wednesday vs. Saturday
@@ -648,24 +725,25 @@ plt.show()
 # In[44]:
 
 
-import matplotlib.pyplot as plt
-import seaborn as sns
+with step('orders per customer chart'):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
-# Count number of orders per customer
-customer_order_counts = orders.groupby('user_id')['order_number'].max()
+    # Count number of orders per customer
+    customer_order_counts = orders.groupby('user_id')['order_number'].max()
 
-# Plot the distribution
-plt.figure(figsize=(12, 6))
-sns.histplot(customer_order_counts, bins=50, kde=True, color="purple", alpha=0.7)
+    # Plot the distribution from 50 pre-computed bins and their smoothed curve
+    plt.figure(figsize=(12, 6))
+    plot_histogram(plt.gca(), histogram(customer_order_counts, bins=50), color="purple", alpha=0.7, kde=True)
 
-# Labels and title
-plt.xlabel("Number of Orders per Customer")
-plt.ylabel("Number of Customers")
-plt.title("Distribution of Orders per Customer")
-plt.grid(axis='y', linestyle='--', alpha=0.7)
+    # Labels and title
+    plt.xlabel("Number of Orders per Customer")
+    plt.ylabel("Number of Customers")
+    plt.title("Distribution of Orders per Customer")
+    plt.grid(axis='y', linestyle='--', alpha=0.7)
 
-# Show plot
-plt.show()
+    # Show plot
+    plt.show()
 
 
 # ## Insights from the Distribution of Orders per Customer
@@ -685,16 +763,13 @@ plt.show()
 # In[45]:
 
 
-# Count the number of times each product appears in orders
-top_products = order_products['product_id'].value_counts().reset_index()
-top_products.columns = ['product_id', 'order_count']
-
-# Merge with product names
-top_products = top_products.merge(products[['product_id', 'product_name']], on='product_id', how='left')
+with step('top 20 products'):
+    # Count the number of times each product appears in orders in a dense
+    # per-product array, then attach names to the 20 winners only
+    top_20_products = top_n_products(order_products, 20, products=dimensions, count_name='order_count')
 
-# Display the top 20 products
-top_20_products = top_products.head(20)
-print(top_20_products)
+    # Display the top 20 products
+    print(top_20_products)
 
 
 # 
@@ -704,25 +779,27 @@ print(top_20_products)
 # In[46]:
 
 
-# Count the number of products per order
-order_sizes = order_products.groupby('order_id')['product_id'].count()
+with step('order sizes'):
+    # Count the number of products per order from the order runs
+    order_sizes = basket_layout.order_sizes()
 
-# Summary statistics
-print(order_sizes.describe())
+    # Summary statistics
+    print(order_sizes.describe())
 
 
 # In[47]:
 
 
-# Plot histogram
-plt.figure(figsize=(10, 5))
-plt.hist(order_sizes, bins=50, edgecolor='black')
-plt.xlabel("Number of Items in an Order")
-plt.ylabel("Frequency")
-plt.title("Distribution of Items per Order")
-plt.xlim(0, 100)  # Limit x-axis for readability
-plt.yscale('log')  # Log scale for better visualization of distribution
-plt.show()
+with step('order size chart'):
+    # Plot histogram from pre-computed bins
+    plt.figure(figsize=(10, 5))
+    plot_histogram(plt.gca(), histogram(order_sizes, bins=50), alpha=1.0, edgecolor='black')
+    plt.xlabel("Number of Items in an Order")
+    plt.ylabel("Frequency")
+    plt.title("Distribution of Items per Order")
+    plt.xlim(0, 100)  # Limit x-axis for readability
+    plt.yscale('log')  # Log scale for better visualization of distribution
+    plt.show()
 
 
 # ## Insights from the Distribution of Items per Order
@@ -742,20 +819,13 @@ plt.show()
 # In[48]:
 
 
-# Count reorders for each product_id
-reorder_counts = order_products[order_products['reordered'] == 1] \
-    .groupby('product_id')['reordered'].count() \
-    .reset_index() \
-    .rename(columns={'reordered': 'reorder_count'})
-
-# Merge with products dataframe to get product names
-top_reordered_products = reorder_counts.merge(products, on='product_id')
-
-# Sort by reorder count and select top 20
-top_20_reordered = top_reordered_products.sort_values(by='reorder_count', ascending=False).head(20)
+with step('top 20 reordered'):
+    # Count reorders for each product_id and keep the top 20, with names
+    top_20_reordered = top_n_products(order_products, 20, where='reordered', products=dimensions,
+                                      count_name='reorder_count')
 
-# Display results
-print(top_20_reordered[['product_id', 'product_name', 'reorder_count']])
+    # Display results
+    print(top_20_reordered[['product_id', 'product_name', 'reorder_count']])
 
 
 # 
@@ -765,27 +835,20 @@ print(top_20_reordered[['product_id', 'product_name', 'reorder_count']])
 # In[49]:
 
 
-# Total orders per product
-total_orders = order_products.groupby('product_id').size().reset_index(name='total_orders')
+with step('product reorder proportion'):
+    # Count orders, reorders and cart positions for every product in one pass
+    product_metrics = reorder_metrics(order_products, 'product_id')
 
-# Total reorders per product
-reorder_counts = order_products[order_products['reordered'] == 1] \
-    .groupby('product_id').size().reset_index(name='total_reorders')
+    # Total orders, total reorders and their proportion per product
+    reorder_proportion = product_metrics[['items', 'reorders', 'reorder_proportion']] \
+        .rename(columns={'items': 'total_orders', 'reorders': 'total_reorders'}) \
+        .reset_index()
 
-# Merge both datasets on product_id
-reorder_proportion = total_orders.merge(reorder_counts, on='product_id', how='left')
+    # Attach product names by indexing the dense product_id -> name array
+    reorder_proportion = dimensions.attach(reorder_proportion, ['product_name'])
 
-# Fill missing values (some products may have zero reorders)
-reorder_proportion['total_reorders'] = reorder_proportion['total_reorders'].fillna(0)
-
-# Compute reorder proportion
-reorder_proportion['reorder_proportion'] = reorder_proportion['total_reorders'] / reorder_proportion['total_orders']
-
-# Merge with product names
-reorder_proportion = reorder_proportion.merge(products[['product_id', 'product_name']], on='product_id')
-
-# Display results sorted by reorder proportion
-print(reorder_proportion[['product_id', 'product_name', 'reorder_proportion']].sort_values(by='reorder_proportion', ascending=False))
+    # Display results sorted by reorder proportion
+    print(reorder_proportion[['product_id', 'product_name', 'reorder_proportion']].sort_values(by='reorder_proportion', ascending=False))
 
 
 # 
@@ -795,27 +858,27 @@ print(reorder_proportion[['product_id', 'product_name', 'reorder_proportion']].s
 # In[50]:
 
 
-# Merge orders with order_products to get user_id
-orders_merged = order_products.merge(orders[['order_id', 'user_id']], on='order_id')
-
-# Total products ordered per customer
-total_products_per_user = orders_merged.groupby('user_id').size().reset_index(name='total_products')
+with step('user reorder proportion'):
+    # Look up the user_id of every order_products row from a dense order_id index
+    # instead of merging orders into order_products
+    order_index = OrderIndex.from_orders(orders)
+    orders_merged = attach_order_columns(order_products, order_index, ['user_id'])
 
-# Total reorders per customer
-reordered_products_per_user = orders_merged[orders_merged['reordered'] == 1] \
-    .groupby('user_id').size().reset_index(name='total_reorders')
+    # Total products, total reorders and their proportion per customer in one pass
+    reorder_proportion_per_user = reorder_metrics(orders_merged, 'user_id') \
+        [['items', 'reorders', 'reorder_proportion']] \
+        .rename(columns={'items': 'total_products', 'reorders': 'total_reorders'}) \
+        .reset_index()
 
-# Merge both datasets
-reorder_proportion_per_user = total_products_per_user.merge(reordered_products_per_user, on='user_id', how='left')
+    # Display results
+    print(reorder_proportion_per_user.sort_values(by='reorder_proportion', ascending=False))
 
-# Fill missing values (some users may have zero reorders)
-reorder_proportion_per_user['total_reorders'] = reorder_proportion_per_user['total_reorders'].fillna(0)
 
-# Compute reorder proportion
-reorder_proportion_per_user['reorder_proportion'] = reorder_proportion_per_user['total_reorders'] / reorder_proportion_per_user['total_products']
-
-# Display results
-print(reorder_proportion_per_user.sort_values(by='reorder_proportion', ascending=False))
+with step('user features'):
+    # Keep the user-level numbers for reorder modeling: every per-user and
+    # per-user x product feature in one pass (save with user_features.save(path))
+    user_features = build_features(orders_cleaned, order_products_cleaned)
+    print(user_features.users.describe().T)
 
 
 # 
@@ -825,18 +888,34 @@ print(reorder_proportion_per_user.sort_values(by='reorder_proportion', ascending
 # In[51]:
 
 
-# Filter for first item added to the cart
-first_added = order_products[order_products['add_to_cart_order'] == 1]
+with step('top 20 first added'):
+    # Count how often each product was the first item added to the cart
+    top_20_first_added = top_n_products(order_products, 20, where='first_in_cart', products=dimensions,
+                                        count_name='first_added_count')
+
+    # Display top 20 products
+    top_20_first_added
+
+
+# 
+
+# ## Which products are bought together?
+
+# In[52]:
 
-# Count occurrences of each product
-first_added_counts = first_added['product_id'].value_counts().reset_index()
-first_added_counts.columns = ['product_id', 'first_added_count']
 
-# Merge with product names
-top_20_first_added = first_added_counts.merge(products[['product_id', 'product_name']], on='product_id')
+with step('products bought together'):
+    # Pair counts come from a sparse order x product matrix (X.T @ X); products
+    # in fewer than 1% of orders are pruned first, and FP-growth finds the
+    # frequent itemsets of up to three products
+    baskets = analyze_baskets(order_products, min_support=0.01, itemsets=True, max_len=3)
+    product_pairs = baskets.pairs
+    for side in ('a', 'b'):
+        product_pairs[f'product_{side}_name'] = dimensions.lookup(product_pairs[f'product_{side}'], 'product_name')
 
-# Display top 20 products
-top_20_first_added.head(20)
+    # Display the top 20 pairs by number of orders, with confidence and lift
+    print(product_pairs.head(20)[['product_a_name', 'product_b_name', 'orders', 'confidence_a_b', 'lift']])
+    print(baskets.itemsets[baskets.itemsets['size'] == 3].head(10))
 
 
 # 
@@ -0,0 +1,88 @@
+"""Wall time and peak memory of each :mod:`instacart.analysis` backend.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_backends --data-dir /path/to/csvs
+    python -m benchmarks.bench_backends --data-dir /path/to/csvs --backends pandas polars
+
+Each backend runs all analyses in a fresh process, so the peak resident
+set size of that process is the backend's own.
+"""
+
+import argparse
+import multiprocessing
+import sys
+import time
+from queue import Empty
+
+import pandas as pd
+
+from instacart.analysis import BACKENDS, run_analyses
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+
+def _peak_rss_mb():
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    import psutil
+    return psutil.Process().memory_info().peak_wset / 2**20
+
+
+def _run(backend, data_dir, queue):
+    start = time.perf_counter()
+    run_analyses(data_dir=data_dir, backend=backend)
+    queue.put((time.perf_counter() - start, _peak_rss_mb()))
+
+
+def measure(backend, data_dir, poll=1.0):
+    """Return ``(seconds, peak_rss_mb)`` of one run of every analysis on ``backend``.
+
+    Raises ``RuntimeError`` when the worker process exits without a result,
+    e.g. because the backend raised; its traceback is on stderr.
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_run, args=(backend, data_dir, queue))
+    process.start()
+    try:
+        while True:
+            try:
+                seconds, peak = queue.get(timeout=poll)
+                break
+            except Empty:
+                if process.exitcode is not None:
+                    raise RuntimeError(f'{backend} run exited with code {process.exitcode} '
+                                       'before reporting a result') from None
+    finally:
+        process.join()
+    return seconds, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', required=True)
+    parser.add_argument('--backends', nargs='*', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    results = []
+    for backend in args.backends:
+        try:
+            runs = [measure(backend, args.data_dir) for _ in range(args.repeat)]
+        except RuntimeError as error:
+            print(f'Skipping {backend}: {error}', file=sys.stderr)
+            continue
+        results.append({'backend': backend,
+                        'seconds': min(seconds for seconds, _ in runs),
+                        'peak_rss_mb': max(peak for _, peak in runs)})
+    if results:
+        print(pd.DataFrame(results).to_string(index=False, float_format='{:.2f}'.format))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Compare the notebook's ``DataFrame.map`` strip with :func:`strip_whitespace`.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_normalize --rows 2000000
+
+Two frames are timed: an all-numeric frame shaped like ``order_products``
+(what the notebook actually strips) and a products-like frame with a text
+column padded with stray spaces.
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from instacart.normalize import strip_whitespace
+
+
+def old_strip(frame):
+    return frame.map(lambda x: x.strip() if isinstance(x, str) else x)
+
+
+def make_order_products(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    add_to_cart = pd.array(rng.integers(1, 65, rows), dtype='Int16')
+    add_to_cart[rng.random(rows) < 0.01] = pd.NA
+    return pd.DataFrame({
+        'order_id': rng.integers(1, rows // 10 + 2, rows).astype('int32'),
+        'product_id': rng.integers(1, 49_695, rows).astype('int32'),
+        'add_to_cart_order': add_to_cart,
+        'reordered': rng.integers(0, 2, rows).astype('uint8'),
+    })
+
+
+def make_products(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    names = np.array([f'product {i}' for i in range(50_000)], dtype=object)
+    picked = names[rng.integers(0, len(names), rows)]
+    padded = np.where(rng.random(rows) < 0.1, ' ' + picked + '  ', picked)
+    return pd.DataFrame({
+        'product_id': np.arange(1, rows + 1, dtype='int32'),
+        'product_name': padded,
+        'aisle_id': rng.integers(1, 135, rows).astype('int16'),
+    })
+
+
+def best_of(func, frame, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(frame)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    cases = {
+        'order_products (numeric)': make_order_products(args.rows),
+        'products (text)': make_products(args.rows),
+        'products (categorical text)': make_products(args.rows).astype({'product_name': 'category'}),
+    }
+    results = []
+    for name, frame in cases.items():
+        old = best_of(old_strip, frame, args.repeat)
+        new = best_of(strip_whitespace, frame, args.repeat)
+        results.append({'frame': name, 'rows': len(frame), 'map_seconds': old,
+                        'vectorized_seconds': new, 'speedup': old / new})
+    print(pd.DataFrame(results).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Scaling of :func:`~instacart.parallel.run_partitioned` across worker counts.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_parallel --orders 1000000 --max-workers 8
+    python -m benchmarks.bench_parallel --data-dir /path/to/csvs
+
+Without ``--data-dir`` random orders with about ten lines each are
+generated in memory.
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from instacart.loader import load_table
+from instacart.parallel import run_partitioned
+
+
+def make_orders(orders, seed=0):
+    rng = np.random.default_rng(seed)
+    order_ids = np.arange(1, orders + 1, dtype='int32')
+    frame = pd.DataFrame({
+        'order_id': order_ids,
+        'user_id': rng.integers(1, orders // 16 + 2, orders).astype('int32'),
+        'order_number': rng.integers(1, 101, orders).astype('int16'),
+        'order_dow': rng.integers(0, 7, orders).astype('uint8'),
+        'order_hour_of_day': rng.integers(0, 24, orders).astype('uint8'),
+        'days_since_prior_order': rng.integers(0, 31, orders).astype('float32'),
+    })
+    sizes = rng.geometric(0.1, orders)
+    lines = pd.DataFrame({
+        'order_id': np.repeat(order_ids, sizes),
+        'product_id': rng.integers(1, 49_695, sizes.sum()).astype('int32'),
+        'add_to_cart_order': pd.array(np.concatenate([np.arange(1, s + 1) for s in sizes]),
+                                      dtype='Int16'),
+        'reordered': rng.integers(0, 2, sizes.sum()).astype('uint8'),
+    })
+    return frame, lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=300_000)
+    parser.add_argument('--data-dir')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    if args.data_dir:
+        orders = load_table('orders', args.data_dir)
+        order_products = load_table('order_products', args.data_dir)
+    else:
+        orders, order_products = make_orders(args.orders)
+
+    workers = 1
+    counts = []
+    while workers < args.max_workers:
+        counts.append(workers)
+        workers *= 2
+    counts.append(args.max_workers)
+
+    results = []
+    for workers in counts:
+        start = time.perf_counter()
+        run_partitioned(orders, order_products, workers=workers)
+        results.append({'workers': workers, 'seconds': time.perf_counter() - start})
+    report = pd.DataFrame(results)
+    report['speedup'] = report['seconds'].iloc[0] / report['seconds']
+    report['efficiency'] = report['speedup'] / report['workers']
+    print(f'{len(order_products):,} order_products rows, {len(orders):,} orders')
+    print(report.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Accuracy and speed of the sketch backend against the exact pandas path.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_sketches --rows 5000000
+    python -m benchmarks.bench_sketches --data-dir /path/to/csvs
+
+Without ``--data-dir`` an order log with Zipf-distributed product
+popularity is generated in memory. The exact path is ``value_counts`` /
+``nunique`` / ``groupby().max()`` as in the notebook. The sketch path feeds
+the same rows through :class:`~instacart.sketches.OrderLogSketch` in chunks.
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from instacart.loader import load_table
+from instacart.sketches import OrderLogSketch
+
+
+def make_order_log(rows, products=49_694, zipf=1.1, seed=0):
+    rng = np.random.default_rng(seed)
+    ranks = np.arange(1, products + 1)
+    weights = ranks ** -zipf
+    product_ids = rng.permutation(products)[
+        rng.choice(products, size=rows, p=weights / weights.sum())] + 1
+    order_products = pd.DataFrame({'product_id': product_ids.astype('int32')})
+
+    users = max(1, rows // 150)
+    orders_per_user = rng.integers(4, 101, users)
+    user_id = np.repeat(np.arange(1, users + 1), orders_per_user)
+    starts = np.repeat(np.cumsum(orders_per_user) - orders_per_user, orders_per_user)
+    # Histories start mid-way for some users, as when the log is a time window,
+    # so order numbers are not always 1..k
+    first = np.repeat(np.where(rng.random(users) < 0.3, rng.integers(2, 50, users), 1), orders_per_user)
+    orders = pd.DataFrame({
+        'order_id': np.arange(1, len(user_id) + 1, dtype='int32'),
+        'user_id': user_id.astype('int32'),
+        'order_number': (np.arange(len(user_id)) - starts + first).astype('int16'),
+    })
+    # Rows arrive in time order, not grouped by user
+    orders = orders.iloc[rng.permutation(len(orders))].reset_index(drop=True)
+    return orders, order_products
+
+
+def exact(orders, order_products, n):
+    start = time.perf_counter()
+    top = order_products['product_id'].value_counts().head(n)
+    users = orders['user_id'].nunique()
+    order_count = orders['order_id'].nunique()
+    per_customer = orders.groupby('user_id')['order_number'].max().value_counts().sort_index()
+    return time.perf_counter() - start, top, users, order_count, per_customer
+
+
+def sketched(orders, order_products, n, chunksize):
+    start = time.perf_counter()
+    sketch = OrderLogSketch()
+    for i in range(0, len(orders), chunksize):
+        sketch.update_orders(orders.iloc[i:i + chunksize])
+    for i in range(0, len(order_products), chunksize):
+        sketch.update_order_products(order_products.iloc[i:i + chunksize])
+    top = sketch.top_products(n)
+    result = (top, sketch.distinct_users(), sketch.distinct_orders(), sketch.orders_per_customer())
+    return (time.perf_counter() - start,) + result + (sketch,)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--data-dir')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--chunksize', type=int, default=500_000)
+    args = parser.parse_args(argv)
+
+    if args.data_dir:
+        orders = load_table('orders', args.data_dir).drop_duplicates()
+        order_products = load_table('order_products', args.data_dir)
+    else:
+        orders, order_products = make_order_log(args.rows)
+
+    exact_seconds, exact_top, users, order_count, per_customer = exact(orders, order_products, args.top)
+    sketch_seconds, top, est_users, est_orders, est_per_customer, sketch = sketched(
+        orders, order_products, args.top, args.chunksize)
+
+    true_counts = exact_top.reindex(top['product_id']).fillna(
+        order_products['product_id'].value_counts().reindex(top['product_id'])).to_numpy()
+    recall = len(set(top['product_id']) & set(exact_top.index)) / args.top
+    report = pd.Series({
+        'order_products rows': len(order_products),
+        'exact seconds': exact_seconds,
+        'sketch seconds': sketch_seconds,
+        f'top-{args.top} recall': recall,
+        'top-N max abs count error': np.abs(top['order_count'].to_numpy() - true_counts).max(),
+        'distinct users relative error': abs(est_users - users) / users,
+        'distinct orders relative error': abs(est_orders - order_count) / order_count,
+        'orders per customer mismatches': int(
+            (est_per_customer.reindex(per_customer.index, fill_value=0) != per_customer).sum()),
+    })
+    print(report.map('{:.6g}'.format).to_string())
+    print('\nStated bounds:')
+    for name, value in sketch.error_bounds().items():
+        print(f'  {name}: {value:.4g}')
+
+
+if __name__ == '__main__':
+    main()
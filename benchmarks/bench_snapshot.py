@@ -0,0 +1,73 @@
+"""Start-up time of the csv files, the Feather cache and a snapshot.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_snapshot --data-dir /path/to/csvs --work-dir /tmp/snapshot_bench
+
+Each way of getting the five cleaned tables is timed from a cold Python
+object (the operating system may still cache the files). The last rows
+time ``--workers`` processes that each sum ``order_products`` from the
+same snapshot, sharing its pages.
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from instacart.cache import load_cleaned_tables
+from instacart.cleaning import clean_tables
+from instacart.loader import DEFAULT_DATA_DIR, load_tables
+from instacart.snapshot import Snapshot, write_snapshot
+
+
+def _timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def _sum_products(snapshot):
+    return int(snapshot.array('order_products', 'product_id').sum(dtype='int64'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--work-dir', default='snapshot_bench')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    results = []
+    frames, seconds = _timed(lambda: clean_tables(load_tables(args.data_dir, track_memory=False)[0]))
+    results.append({'source': 'parse and clean csv', 'seconds': seconds})
+    snapshot_dir = os.path.join(args.work_dir, 'snapshot')
+    _, seconds = _timed(lambda: write_snapshot(frames, snapshot_dir))
+    results.append({'source': 'write snapshot', 'seconds': seconds})
+    cache_dir = os.path.join(args.work_dir, 'cache')
+    try:
+        load_cleaned_tables(args.data_dir, cache_dir=cache_dir)
+    except ImportError:
+        pass  # no pyarrow, so no Feather cache to compare with
+    else:
+        _, seconds = _timed(lambda: load_cleaned_tables(args.data_dir, cache_dir=cache_dir))
+        results.append({'source': 'feather cache (warm)', 'seconds': seconds})
+    snapshot, seconds = _timed(lambda: Snapshot(snapshot_dir))
+    results.append({'source': 'open snapshot', 'seconds': seconds})
+    _, seconds = _timed(snapshot.load)
+    results.append({'source': 'snapshot as DataFrames', 'seconds': seconds})
+
+    _, seconds = _timed(lambda: _sum_products(snapshot))
+    results.append({'source': 'scan product_id, 1 process', 'seconds': seconds})
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        _, seconds = _timed(lambda: list(pool.map(_sum_products, [snapshot] * args.workers)))
+    results.append({'source': f'scan product_id, {args.workers} processes', 'seconds': seconds})
+
+    print(f"{len(frames['order_products']):,} order_products rows")
+    print(pd.DataFrame(results).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Time every pipeline stage on synthetic data at several scales.
+
+Run from the repository root::
+
+    python -m benchmarks.run_benchmarks --scales 1 10 --work-dir /tmp/instacart_bench
+
+For each scale the synthetic csv files (see :mod:`instacart.synthetic`)
+are written to ``<work-dir>/scale_<n>`` unless they are already there with
+the same seed. Then every stage of :mod:`instacart.stages` runs once from
+an empty cache. The output has one row per stage and one column of seconds
+per scale, and is also written as csv next to the data.
+
+The stages hold whole tables in pandas, so a run peaks at roughly
+``PEAK_BYTES_PER_SCALE`` times the scale. Scales whose estimate exceeds the
+available memory are skipped unless ``--force`` is given.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from instacart.stages import build_pipeline, default_sources
+from instacart.synthetic import generate
+
+try:
+    import psutil
+except ImportError:  # pragma: no cover - optional dependency
+    psutil = None
+
+# Peak RSS of a full pipeline run per unit of scale (measured: about 1 GB at scale 1)
+PEAK_BYTES_PER_SCALE = 1.2 * 2**30
+
+
+def available_memory():
+    """Bytes of memory available to a new run, or None when unknown."""
+    if psutil is not None:
+        return psutil.virtual_memory().available
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def dataset(work_dir, scale, seed):
+    """Return the folder holding synthetic data for ``scale``, generating it if needed."""
+    path = os.path.join(work_dir, f'scale_{scale:g}')
+    marker = os.path.join(path, 'synthetic.json')
+    settings = {'scale': scale, 'seed': seed}
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if json.load(f) == settings:
+                return path
+    start = time.perf_counter()
+    stats = generate(path, scale, seed)
+    print(f'generated {stats.orders:,} orders and {stats.order_products:,} order lines '
+          f'at scale {scale:g} in {time.perf_counter() - start:.1f}s')
+    with open(marker, 'w') as f:
+        json.dump(settings, f)
+    return path
+
+
+def time_stages(data_dir):
+    """Run every stage from an empty cache and return seconds per stage."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        pipeline = build_pipeline(data_dir, os.path.join(cache_dir, 'stages'))
+        sources = default_sources(data_dir, os.path.join(cache_dir, 'reports'))
+        _, summary = pipeline.run(list(pipeline.stages), sources)
+    return summary.seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=float, nargs='*', default=[1, 10])
+    parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), 'instacart_bench'))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--force', action='store_true',
+                        help='run scales whose memory estimate exceeds the available memory')
+    args = parser.parse_args(argv)
+
+    available = available_memory()
+    columns = {}
+    for scale in args.scales:
+        needed = scale * PEAK_BYTES_PER_SCALE
+        if not args.force and available is not None and needed > available:
+            print(f'skipping scale {scale:g}: needs about {needed / 2**30:.1f} GiB, '
+                  f'{available / 2**30:.1f} GiB available (use --force to run it anyway)')
+            continue
+        seconds = time_stages(dataset(args.work_dir, scale, args.seed))
+        columns[f'{scale:g}x'] = pd.Series(seconds)
+    if not columns:
+        return
+    report = pd.DataFrame(columns)
+    report.loc['total'] = report.sum()
+    report.index.name = 'stage'
+    report.to_csv(os.path.join(args.work_dir, 'stage_seconds.csv'))
+    print(report.to_string(float_format='{:.3f}'.format))
+
+
+if __name__ == '__main__':
+    main()
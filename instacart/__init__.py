@@ -0,0 +1,6 @@
+"""Reusable building blocks for the Instacart orders analysis.
+
+``Instachart_Project.py`` is the exploratory walk-through of the data; the
+modules in this package hold the loading, cleaning and aggregation code it
+relies on so the same steps can be run at full scale outside the notebook.
+"""
@@ -0,0 +1,151 @@
+"""Reorder metrics per product, aisle, department or user in one pass.
+
+The notebook builds every reorder table the same way: ``groupby().size()``,
+a second ``groupby`` over the ``reordered == 1`` rows, a ``merge`` of the
+two, a ``fillna(0)`` and a division. It does this for products, then for
+users, then again for the top reordered products.
+
+Every key here is a small integer id, so all metrics can be read off
+``np.bincount`` over the key array:
+
+- ``items``: rows with that key
+- ``reorders``: sum of ``reordered``
+- ``reorder_proportion``: ``reorders / items``
+- ``first_in_cart``: rows with ``add_to_cart_order == 1``
+- ``mean_cart_position``: mean of the known ``add_to_cart_order`` values
+
+Keys that are too sparse for a dense count array (ids much larger than the
+number of rows) are first compacted with ``np.unique`` into sorted segments.
+"""
+
+import numpy as np
+import pandas as pd
+
+from instacart.joins import OrderIndex, user_ids
+
+METRICS = ('items', 'reorders', 'reorder_proportion', 'first_in_cart', 'mean_cart_position')
+
+KEYS = ('product_id', 'aisle_id', 'department_id', 'user_id')
+
+# Dense arrays are used while the largest key is at most this many times the row count
+_DENSE_FACTOR = 4
+
+
+def product_attribute(products, column):
+    """Dense array mapping ``product_id`` to ``column`` (-1 where unknown)."""
+    product_ids = products['product_id'].to_numpy()
+    lookup = np.full(int(product_ids.max()) + 1, -1, dtype=np.int32)
+    lookup[product_ids] = products[column].to_numpy(dtype=np.int32, na_value=-1)
+    return lookup
+
+
+def _gather(lookup, ids):
+    inside = (ids >= 0) & (ids < len(lookup))
+    if inside.all():
+        return lookup.take(ids)
+    out = np.full(len(ids), -1, dtype=lookup.dtype)
+    out[inside] = lookup.take(ids[inside])
+    return out
+
+
+def key_array(order_products, key, products=None, orders=None):
+    """Return the value of ``key`` for every ``order_products`` row.
+
+    ``aisle_id`` and ``department_id`` need ``products``; ``user_id`` needs
+    ``orders`` (a frame or an :class:`~instacart.joins.OrderIndex`) unless
+    ``order_products`` already carries a ``user_id`` column.
+    """
+    if key in order_products:
+        return order_products[key].to_numpy()
+    if key in ('aisle_id', 'department_id'):
+        if products is None:
+            raise ValueError(f'products is needed to aggregate by {key}')
+        return _gather(product_attribute(products, key), order_products['product_id'].to_numpy())
+    if key == 'user_id':
+        if orders is None:
+            raise ValueError('orders is needed to aggregate by user_id')
+        index = orders if isinstance(orders, OrderIndex) else OrderIndex.from_orders(orders, ['user_id'])
+        return user_ids(order_products, index)
+    raise ValueError(f'Cannot aggregate by {key!r}; expected one of {", ".join(KEYS)}')
+
+
+def _segments(keys):
+    """Return ``(codes, key_values)`` so that ``key_values[codes] == keys``."""
+    if len(keys) == 0:
+        return keys.astype(np.intp), keys
+    largest = int(keys.max())
+    if largest <= _DENSE_FACTOR * len(keys) + 1024:
+        return keys.astype(np.intp, copy=False), None
+    values, codes = np.unique(keys, return_inverse=True)
+    return codes, values
+
+
+def bincount_sums(codes, reordered, cart_position=None, size=None):
+    """Per-code sums that :func:`metrics_frame` turns into :data:`METRICS`.
+
+    Returns a dict of arrays indexed by code: ``items``, ``reorders`` and,
+    when ``cart_position`` is given, ``first_in_cart``, ``cart_sum`` and
+    ``cart_count`` (number of known positions). The sums add up across
+    chunks, which is what incremental and partitioned runs rely on.
+    """
+    if size is None:
+        size = (int(codes.max()) + 1) if len(codes) else 0
+    sums = {
+        'items': np.bincount(codes, minlength=size),
+        'reorders': np.bincount(codes, weights=np.asarray(reordered, dtype=np.float64),
+                                minlength=size).astype(np.int64),
+    }
+    if cart_position is not None:
+        position = pd.array(cart_position, dtype='Float64')
+        known = ~position.isna().astype(bool)
+        position = position.to_numpy(dtype=np.float64, na_value=0.0)
+        sums['first_in_cart'] = np.bincount(codes[position == 1], minlength=size)
+        sums['cart_sum'] = np.bincount(codes, weights=position, minlength=size)
+        sums['cart_count'] = np.bincount(codes[known], minlength=size)
+    return sums
+
+
+def metrics_frame(sums, name='key', values=None):
+    """Build the :data:`METRICS` table from sums produced by :func:`bincount_sums`.
+
+    Only codes with at least one item are kept. The index holds the codes
+    themselves, or ``values[code]`` when ``values`` is given.
+    """
+    items = sums['items']
+    present = items > 0
+    columns = {'items': items[present], 'reorders': sums['reorders'][present]}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        columns['reorder_proportion'] = columns['reorders'] / columns['items']
+        if 'cart_sum' in sums:
+            columns['first_in_cart'] = sums['first_in_cart'][present]
+            columns['mean_cart_position'] = sums['cart_sum'][present] / sums['cart_count'][present]
+    index = np.flatnonzero(present) if values is None else values[present]
+    return pd.DataFrame(columns, index=pd.Index(index, name=name))
+
+
+def bincount_metrics(keys, reordered, cart_position=None, name='key'):
+    """Compute :data:`METRICS` for integer ``keys``; negative keys are ignored.
+
+    ``cart_position`` is the ``add_to_cart_order`` column and may contain
+    missing values. Returns one row per key that occurs, indexed by key.
+    """
+    keys = np.asarray(keys)
+    valid = keys >= 0
+    if not valid.all():
+        keys = keys[valid]
+        reordered = np.asarray(reordered)[valid]
+        if cart_position is not None:
+            cart_position = cart_position[valid]
+    codes, values = _segments(keys)
+    return metrics_frame(bincount_sums(codes, reordered, cart_position), name, values)
+
+
+def reorder_metrics(order_products, key='product_id', products=None, orders=None):
+    """Return :data:`METRICS` for every value of ``key`` found in ``order_products``.
+
+    ``key`` is one of :data:`KEYS`. The result is indexed by ``key`` and has
+    one row per key value that occurs.
+    """
+    keys = key_array(order_products, key, products, orders)
+    cart = order_products['add_to_cart_order'].array if 'add_to_cart_order' in order_products else None
+    return bincount_metrics(keys, order_products['reordered'].to_numpy(), cart, name=key)
@@ -0,0 +1,224 @@
+"""The notebook's checks and aggregations behind interchangeable backends.
+
+``run_analyses`` returns the same result frames whichever backend computes
+them:
+
+- ``pandas``: the reference path. It loads whole tables with
+  :mod:`instacart.loader` and uses the cleaning and aggregation modules.
+- ``duckdb``: runs the same steps as SQL over the files on disk, see
+  :mod:`instacart.duckdb_backend`.
+- ``polars``: lazy queries collected together, see
+  :mod:`instacart.polars_backend`.
+
+Pick one per run with ``backend=``, ``--backend`` or ``INSTACART_BACKEND``::
+
+    python -m instacart.analysis --backend duckdb --data-dir /path/to/csvs
+
+``--check-parity`` runs every backend and fails if any result differs from
+the pandas one.
+
+Aggregates are computed on the cleaned tables (duplicate orders and order
+lines dropped); ``checks`` describes the raw ones.
+"""
+
+import argparse
+import importlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from instacart import cleaning
+from instacart.aggregates import reorder_metrics
+from instacart.loader import DEFAULT_DATA_DIR, load_table
+from instacart.quality import check_table
+from instacart.topn import top_n_products
+
+BACKENDS = ('pandas', 'duckdb', 'polars')
+
+DEFAULT_BACKEND = os.environ.get('INSTACART_BACKEND', 'pandas')
+
+# Analysis name -> tables it reads
+ANALYSES = {
+    'checks': ('orders', 'order_products'),
+    'order_hour_counts': ('orders',),
+    'order_dow_counts': ('orders',),
+    'hour_dow_counts': ('orders',),
+    'days_counts': ('orders',),
+    'customer_order_counts': ('orders',),
+    'order_sizes': ('order_products',),
+    'top_products': ('order_products', 'products'),
+    'top_reordered': ('order_products', 'products'),
+    'top_first_added': ('order_products', 'products'),
+    'product_metrics': ('order_products',),
+    'user_metrics': ('order_products', 'orders'),
+}
+
+TOP_N = 20
+
+# Rows with add_to_cart_order above this are missing their position in the source data
+CART_LIMIT = 64
+
+
+def hour_dow_frame(hours, dows, counts):
+    """24 x 7 table of order counts (hour rows, day-of-week columns) from sparse triples."""
+    table = pd.DataFrame({'order_hour_of_day': hours, 'order_dow': dows, 'count': counts})
+    table = table.pivot(index='order_hour_of_day', columns='order_dow', values='count')
+    table = table.reindex(index=range(24), columns=range(7), fill_value=0).fillna(0).astype(np.int64)
+    table.index.name, table.columns.name = 'order_hour_of_day', 'order_dow'
+    return table
+
+
+def _checks(orders, order_products):
+    """Duplicate, missing-value and range counts for the raw order tables."""
+    orders_report = check_table('orders', orders)
+    lines_report = check_table('order_products', order_products)
+    cart = order_products['add_to_cart_order']
+    values = {
+        ('orders', 'rows'): len(orders),
+        ('orders', 'duplicate_rows'): orders_report.duplicates['rows'].extra_rows,
+        ('orders', 'duplicate_order_id'): orders_report.duplicates['order_id'].extra_rows,
+        ('orders', 'missing_days_since_prior_order'): orders_report.nulls['days_since_prior_order'],
+        ('orders', 'hour_out_of_range'): orders_report.ranges['order_hour_of_day'].violations,
+        ('orders', 'dow_out_of_range'): orders_report.ranges['order_dow'].violations,
+        ('order_products', 'rows'): len(order_products),
+        ('order_products', 'duplicate_rows'): lines_report.duplicates['rows'].extra_rows,
+        ('order_products', 'missing_add_to_cart_order'): lines_report.nulls['add_to_cart_order'],
+        ('order_products', 'add_to_cart_over_limit'): int((cart > CART_LIMIT).sum()),
+    }
+    index = pd.MultiIndex.from_tuples(values, names=['table', 'check'])
+    return pd.Series(list(values.values()), index=index, name='count', dtype=np.int64)
+
+
+def _pandas_analysis(name, raw, clean):
+    if name == 'checks':
+        return _checks(raw['orders'], raw['order_products'])
+    orders = clean.get('orders')
+    order_products = clean.get('order_products')
+    if name == 'order_hour_counts':
+        return orders['order_hour_of_day'].value_counts().sort_index()
+    if name == 'order_dow_counts':
+        return orders['order_dow'].value_counts().sort_index()
+    if name == 'days_counts':
+        return orders['days_since_prior_order'].value_counts().sort_index()
+    if name == 'hour_dow_counts':
+        counts = orders.groupby(['order_hour_of_day', 'order_dow']).size()
+        return hour_dow_frame(counts.index.get_level_values(0), counts.index.get_level_values(1),
+                              counts.to_numpy())
+    if name == 'customer_order_counts':
+        return orders.groupby('user_id')['order_number'].max()
+    if name == 'order_sizes':
+        return order_products.groupby('order_id').size().rename('items')
+    if name == 'top_products':
+        return top_n_products(order_products, TOP_N, products=raw['products'])
+    if name == 'top_reordered':
+        return top_n_products(order_products, TOP_N, where='reordered', products=raw['products'],
+                              count_name='reorder_count')
+    if name == 'top_first_added':
+        return top_n_products(order_products, TOP_N, where='first_in_cart', products=raw['products'],
+                              count_name='first_added_count')
+    if name == 'product_metrics':
+        return reorder_metrics(order_products, 'product_id')
+    if name == 'user_metrics':
+        return reorder_metrics(order_products, 'user_id', orders=orders)
+    raise KeyError(name)
+
+
+def run_pandas(names, data_dir=None):
+    """The reference implementation of every analysis in :data:`ANALYSES`."""
+    tables = {t for name in names for t in ANALYSES[name]}
+    raw = {t: load_table(t, data_dir) for t in sorted(tables)}
+    clean = {t: cleaning.CLEANERS[t](raw[t]) for t in ('orders', 'order_products') if t in raw}
+    return {name: _pandas_analysis(name, raw, clean) for name in names}
+
+
+def run_analyses(names=None, data_dir=None, backend=None, **options):
+    """Run the analyses ``names`` (default: all of :data:`ANALYSES`) on ``backend``.
+
+    Returns a dict mapping each name to a Series or DataFrame. ``options``
+    are passed to the backend.
+    """
+    names = list(ANALYSES) if names is None else list(names)
+    unknown = [n for n in names if n not in ANALYSES]
+    if unknown:
+        raise KeyError(f'Unknown analyses: {", ".join(unknown)}')
+    backend = backend or DEFAULT_BACKEND
+    if backend == 'pandas':
+        return run_pandas(names, data_dir, **options)
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown backend {backend!r}; expected one of {", ".join(BACKENDS)}')
+    module = importlib.import_module(f'instacart.{backend}_backend')
+    return module.run(names, data_dir, **options)
+
+
+def _comparable(value):
+    # Backends differ in integer widths and in how they hold strings
+    value = value.copy()
+    if isinstance(value, pd.Series):
+        value = value.to_frame()
+    for column in value.columns:
+        if not pd.api.types.is_numeric_dtype(value[column]):
+            value[column] = value[column].astype(object)
+    return value.set_axis(range(value.shape[1]), axis=1)
+
+
+def compare_results(actual, expected):
+    """Return ``{name: message}`` for every analysis whose results differ."""
+    differences = {}
+    for name, value in expected.items():
+        if name not in actual:
+            differences[name] = 'missing'
+            continue
+        try:
+            pd.testing.assert_frame_equal(_comparable(actual[name]), _comparable(value),
+                                          check_dtype=False, check_index_type=False,
+                                          check_names=False, check_column_type=False)
+        except AssertionError as error:
+            differences[name] = str(error)
+    return differences
+
+
+def check_parity(backends=BACKENDS, names=None, data_dir=None):
+    """Run ``names`` on every backend and compare each with the pandas results.
+
+    Returns ``{backend: {name: message}}`` holding only the differences, so
+    an empty dict means every backend agrees.
+    """
+    expected = run_analyses(names, data_dir, 'pandas')
+    failures = {}
+    for backend in backends:
+        if backend == 'pandas':
+            continue
+        differences = compare_results(run_analyses(names, data_dir, backend), expected)
+        if differences:
+            failures[backend] = differences
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the Instacart analyses on one backend.')
+    parser.add_argument('names', nargs='*', help='analyses to run (default: all)')
+    parser.add_argument('--backend', default=DEFAULT_BACKEND, choices=BACKENDS)
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--check-parity', action='store_true',
+                        help='run every backend and compare them with pandas')
+    args = parser.parse_args(argv)
+
+    if args.check_parity:
+        failures = check_parity(names=args.names or None, data_dir=args.data_dir)
+        for backend, differences in failures.items():
+            for name, message in differences.items():
+                print(f'{backend} {name}: {message}')
+        if failures:
+            raise SystemExit(1)
+        print(f'{", ".join(BACKENDS)} agree')
+        return
+
+    results = run_analyses(args.names or None, args.data_dir, args.backend)
+    for name, value in results.items():
+        print(f'== {name}')
+        print(value.head(TOP_N).to_string())
+
+
+if __name__ == '__main__':
+    main()
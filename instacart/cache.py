@@ -0,0 +1,187 @@
+"""On-disk cache of the cleaned tables.
+
+Parsing the csv files and re-running the cleaning steps dominates start-up
+time. The cleaned frames are therefore written once as uncompressed Feather
+(Arrow IPC) files, which can be memory-mapped on the next run instead of
+parsed.
+
+Each cache entry lives in its own folder named after a key built from
+
+- the content hash of every source csv,
+- ``CLEANING_VERSION`` from :mod:`instacart.cleaning`, and
+- the dtype schemas from :mod:`instacart.loader`,
+
+so editing a source file or the cleaning logic automatically points at a
+new entry. When a new entry is written, the stale entries of the same data
+folder and tables are removed; entries of other data folders sharing the
+cache folder (``INSTACART_CACHE_DIR``) are left alone. Hashing a
+large csv is not free either, so the digest of each file is remembered
+together with its size and modification time and only recomputed when
+those change.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+from instacart.cleaning import CLEANING_VERSION, clean_tables
+from instacart.loader import DEFAULT_DATA_DIR, SCHEMAS, TABLES, load_tables, table_path
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # pragma: no cover - optional dependency
+    feather = None
+
+# Bump when the on-disk layout of an entry changes
+CACHE_FORMAT = 1
+
+_STAMPS_FILE = 'sources.json'
+_BLOCK_SIZE = 1 << 20
+
+
+def _require_pyarrow():
+    if feather is None:
+        raise ImportError('The cleaned-table cache needs pyarrow: pip install pyarrow')
+
+
+def default_cache_dir(data_dir=None):
+    """Return the cache folder, ``$INSTACART_CACHE_DIR`` or ``<data_dir>/.instacart_cache``."""
+    return os.environ.get('INSTACART_CACHE_DIR') or os.path.join(
+        data_dir or DEFAULT_DATA_DIR, '.instacart_cache')
+
+
+def file_digest(path):
+    """Return the BLAKE2b hex digest of the file at ``path``."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_stamps(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, _STAMPS_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_stamps(cache_dir, stamps):
+    path = os.path.join(cache_dir, _STAMPS_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(stamps, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def source_digests(data_dir=None, tables=TABLES, cache_dir=None):
+    """Return ``{table: digest}`` for the source csv of each table.
+
+    A file is only re-hashed when its size or modification time differs from
+    the last time it was seen.
+    """
+    cache_dir = cache_dir or default_cache_dir(data_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    stamps = _load_stamps(cache_dir)
+    digests = {}
+    changed = False
+    for name in tables:
+        path = os.path.abspath(table_path(name, data_dir))
+        stat = os.stat(path)
+        stamp = stamps.get(path)
+        if stamp is None or stamp['size'] != stat.st_size or stamp['mtime_ns'] != stat.st_mtime_ns:
+            stamp = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': file_digest(path)}
+            stamps[path] = stamp
+            changed = True
+        digests[name] = stamp['digest']
+    if changed:
+        _save_stamps(cache_dir, stamps)
+    return digests
+
+
+def cache_key(digests):
+    """Combine source digests with the cleaning and schema versions into one key."""
+    payload = {
+        'format': CACHE_FORMAT,
+        'cleaning': CLEANING_VERSION,
+        'schemas': {name: SCHEMAS[name] for name in digests},
+        'sources': digests,
+    }
+    encoded = json.dumps(payload, sort_keys=True).encode()
+    return hashlib.blake2b(encoded, digest_size=12).hexdigest()
+
+
+def source_id(data_dir=None, tables=TABLES):
+    """Identify a data folder and table set, so only its own stale entries are pruned."""
+    payload = {'data_dir': os.path.abspath(data_dir or DEFAULT_DATA_DIR), 'tables': sorted(tables)}
+    encoded = json.dumps(payload, sort_keys=True).encode()
+    return hashlib.blake2b(encoded, digest_size=12).hexdigest()
+
+
+def _entry_name(source, key):
+    return f'{source}_{key}'
+
+
+def _entry_dir(cache_dir, name):
+    return os.path.join(cache_dir, name)
+
+
+def _read_entry(entry, tables, memory_map):
+    frames = {}
+    for table in tables:
+        arrow = feather.read_table(os.path.join(entry, f'{table}.feather'), memory_map=memory_map)
+        # split_blocks lets numeric columns stay views on the mapped buffers
+        frames[table] = arrow.to_pandas(split_blocks=True)
+    return frames
+
+
+def _write_entry(cache_dir, name, frames):
+    entry = _entry_dir(cache_dir, name)
+    staging = entry + '.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for table, frame in frames.items():
+        # Uncompressed so the files can be memory-mapped on read
+        feather.write_feather(frame, os.path.join(staging, f'{table}.feather'),
+                              compression='uncompressed')
+    with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+        json.dump({'entry': name, 'tables': sorted(frames),
+                   'rows': {table: len(frame) for table, frame in frames.items()}}, f, indent=1)
+    shutil.rmtree(entry, ignore_errors=True)
+    os.replace(staging, entry)
+    return entry
+
+
+def prune(cache_dir, keep, source):
+    """Delete the entries in ``cache_dir`` written for ``source``, except the one named ``keep``.
+
+    Entry folders are named ``<source>_<key>`` (``source`` from
+    :func:`source_id`), so entries of other sources are kept.
+    """
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name != keep and name.startswith(f'{source}_') and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def load_cleaned_tables(data_dir=None, tables=TABLES, cache_dir=None, memory_map=True):
+    """Return ``{table: cleaned DataFrame}``, reading from the cache when possible.
+
+    On a cold start the csv files are parsed with :func:`load_tables`,
+    cleaned with :func:`clean_tables` and written to a fresh cache entry.
+    On a warm start the Feather files are memory-mapped and nothing is
+    parsed or cleaned.
+    """
+    _require_pyarrow()
+    cache_dir = cache_dir or default_cache_dir(data_dir)
+    source = source_id(data_dir, tables)
+    key = cache_key(source_digests(data_dir, tables, cache_dir))
+    name = _entry_name(source, key)
+    entry = _entry_dir(cache_dir, name)
+    if os.path.exists(os.path.join(entry, 'manifest.json')):
+        return _read_entry(entry, tables, memory_map)
+    frames, _ = load_tables(data_dir, tables, track_memory=False)
+    _write_entry(cache_dir, name, clean_tables(frames))
+    prune(cache_dir, keep=name, source=source)
+    return _read_entry(entry, tables, memory_map)
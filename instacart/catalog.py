@@ -0,0 +1,243 @@
+"""Near-duplicate product names and a product id -> canonical id mapping.
+
+The notebook only looks for exact and lowercased duplicates of
+``product_name``. The catalog also has names that differ only in
+punctuation, spacing, unit spelling or word order, such as
+``'Organic Whole Milk- 16 oz'`` and ``'Whole Milk, Organic 16 Ounce'``.
+Comparing every pair of the ~49k names is quadratic, so this works in
+three near-linear passes over the distinct names:
+
+- :func:`canonical_names` lowercases, drops accents and punctuation, spells
+  units one way (``16 Ounce`` -> ``16oz``) and sorts the tokens. Names with
+  the same canonical form are duplicates.
+- The canonical forms get a MinHash signature over their character
+  3-grams. Banding the signature (LSH) puts names that share most 3-grams
+  into the same bucket, so only names sharing a bucket are compared.
+- Candidates are kept when the exact Jaccard similarity of their 3-grams
+  reaches ``threshold`` and they mention the same numbers, so ``16oz`` and
+  ``32oz`` of a product stay apart.
+
+Matches are joined into clusters and the smallest ``product_id`` of a
+cluster becomes its canonical id. :class:`ProductCatalog` holds that
+mapping as a dense array, like :class:`~instacart.dimensions.DimensionStore`,
+and :meth:`ProductCatalog.remap` rewrites ``product_id`` in any table so
+the aggregations count a product once.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# Spellings of each unit, matched as whole words after lowercasing
+UNITS = {
+    'floz': r'fl ?oz|fluid ounces?',
+    'oz': r'ounces?|oz',
+    'lb': r'pounds?|lbs?',
+    'ct': r'counts?|ct',
+    'pk': r'packs?|pk',
+    'ml': r'milliliters?|millilitres?|ml',
+    'l': r'liters?|litres?|ltr',
+    'kg': r'kilograms?|kg',
+    'g': r'grams?|gr?',
+    'pct': r'percent|%',
+}
+
+# A number followed by any unit spelling; the group name is the unit
+_UNIT_PATTERN = re.compile(
+    r'(?<=\d) ?(?:' + '|'.join(f'(?P<{unit}>{p})' for unit, p in UNITS.items()) + r')(?![a-z])')
+
+# Bytes of each canonical name used for its 3-grams
+MAX_NAME_BYTES = 96
+
+# Mersenne prime for the MinHash permutations (a * x + b) % P
+_PRIME = (1 << 31) - 1
+
+
+def canonical_names(names):
+    """Canonical form of each of ``names``; computed once per distinct name.
+
+    Missing names stay missing.
+    """
+    names = pd.Series(names)
+    codes, uniques = pd.factorize(names)
+    forms = pd.Index(uniques.astype(str)).str.lower()
+    forms = forms.str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+    forms = forms.str.replace('&', ' and ', regex=False)
+    # Keep decimal points and percent signs, drop other punctuation
+    forms = forms.str.replace(r'(?<!\d)\.|\.(?!\d)', ' ', regex=True)
+    forms = forms.str.replace(r'[^\w\s.%]|_', ' ', regex=True)
+    forms = forms.str.replace(r'\s+', ' ', regex=True)
+    forms = forms.str.replace(_UNIT_PATTERN, lambda match: match.lastgroup, regex=True)
+    forms = forms.str.split().map(lambda tokens: ' '.join(sorted(tokens)))
+    return pd.Series(forms.take(codes, allow_fill=True, fill_value=np.nan),
+                     index=names.index, name=names.name)
+
+
+class _Shingles:
+    """Character 3-grams of each form, as ids into the distinct 3-grams.
+
+    The 3-grams of form ``i`` are ``ids[starts[i]:starts[i + 1]]``.
+    """
+
+    def __init__(self, forms):
+        padded = [f' {form} '.encode('ascii') for form in forms]
+        width = max(3, min(MAX_NAME_BYTES, max(map(len, padded), default=3)))
+        data = np.array(padded, dtype=f'S{width}').view(np.uint8).reshape(len(padded), width)
+        data = data.astype(np.int64)
+        grams = (data[:, :-2] << 16) | (data[:, 1:-1] << 8) | data[:, 2:]
+        lengths = np.minimum([len(p) for p in padded], width) - 2
+        valid = np.arange(width - 2) < lengths[:, None]
+        self.grams, self.ids = np.unique(grams[valid], return_inverse=True)
+        self.starts = np.r_[0, np.cumsum(lengths)]
+
+    def of(self, i):
+        return self.ids[self.starts[i]:self.starts[i + 1]]
+
+    def signatures(self, num_perm, seed):
+        """MinHash signature of every form, one column per permutation."""
+        rng = np.random.default_rng(seed)
+        a = rng.integers(1, _PRIME, num_perm)
+        b = rng.integers(0, _PRIME, num_perm)
+        signatures = np.empty((len(self.starts) - 1, num_perm), dtype=np.int32)
+        for k in range(num_perm):
+            # Hash each distinct 3-gram once, then take the minimum per form
+            hashed = ((a[k] * self.grams + b[k]) % _PRIME).astype(np.int32)
+            signatures[:, k] = np.minimum.reduceat(hashed[self.ids], self.starts[:-1])
+        return signatures
+
+
+def _bucket_pairs(keys, max_bucket):
+    """All pairs of rows with equal ``keys``, skipping buckets above ``max_bucket``."""
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    sizes = np.diff(np.r_[starts, len(keys)])
+    pairs = []
+    for start, size in zip(starts[(sizes > 1) & (sizes <= max_bucket)],
+                           sizes[(sizes > 1) & (sizes <= max_bucket)]):
+        members = order[start:start + size]
+        left, right = np.triu_indices(size, k=1)
+        pairs.append(np.column_stack([members[left], members[right]]))
+    return np.concatenate(pairs) if pairs else np.empty((0, 2), dtype=np.int64)
+
+
+def _candidates(signatures, bands, max_bucket):
+    rows = signatures.shape[1] // bands
+    mixers = np.random.default_rng(0).integers(1, 1 << 62, rows).astype(np.uint64)
+    pairs = []
+    for band in range(bands):
+        block = signatures[:, band * rows:(band + 1) * rows].astype(np.uint64)
+        pairs.append(_bucket_pairs((block * mixers).sum(axis=1), max_bucket))
+    pairs = np.concatenate(pairs)
+    pairs.sort(axis=1)
+    return np.unique(pairs, axis=0)
+
+
+def _jaccard(shingles, pairs):
+    sets = {}
+
+    def gram_set(i):
+        if i not in sets:
+            sets[i] = set(shingles.of(i).tolist())
+        return sets[i]
+
+    scores = np.empty(len(pairs))
+    for n, (i, j) in enumerate(pairs):
+        left, right = gram_set(i), gram_set(j)
+        scores[n] = len(left & right) / len(left | right)
+    return scores
+
+
+def _components(size, pairs):
+    """Smallest member of the connected component of each of ``size`` nodes."""
+    labels = np.arange(size)
+    if len(pairs) == 0:
+        return labels
+    left, right = pairs[:, 0], pairs[:, 1]
+    while True:
+        lowest = np.minimum(labels[left], labels[right])
+        updated = labels.copy()
+        np.minimum.at(updated, left, lowest)
+        np.minimum.at(updated, right, lowest)
+        # Pointer jumping: follow labels to their own labels until stable
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+class ProductCatalog:
+    """Dense ``product_id -> canonical_id`` array, position ``i`` holding product ``i``."""
+
+    def __init__(self, canonical, clusters):
+        # -1 for ids that are not in the products table
+        self.canonical = canonical
+        # Products in clusters of two or more, for review
+        self.clusters = clusters
+
+    def canonical_ids(self, product_ids):
+        """Canonical id of each of ``product_ids``; unknown ids map to themselves."""
+        product_ids = np.asarray(product_ids)
+        inside = (product_ids >= 0) & (product_ids < len(self.canonical))
+        result = product_ids.copy()
+        mapped = self.canonical[product_ids[inside]]
+        result[inside] = np.where(mapped >= 0, mapped, product_ids[inside])
+        return result
+
+    @property
+    def mapping(self):
+        """``canonical_id`` Series indexed by ``product_id`` for every product."""
+        product_ids = np.flatnonzero(self.canonical >= 0)
+        return pd.Series(self.canonical[product_ids], index=pd.Index(product_ids, name='product_id'),
+                         name='canonical_id')
+
+    def remap(self, frame, column='product_id'):
+        """Return ``frame`` with ``column`` replaced by canonical ids."""
+        result = frame.copy(deep=False)
+        values = frame[column].to_numpy()
+        result[column] = self.canonical_ids(values).astype(values.dtype, copy=False)
+        return result
+
+
+def find_duplicates(products, threshold=0.85, num_perm=60, bands=10, max_bucket=200, seed=0):
+    """Cluster near-duplicate product names and return a :class:`ProductCatalog`.
+
+    ``threshold`` is the 3-gram Jaccard similarity two canonical names need
+    to be matched. ``num_perm`` MinHash permutations are split into
+    ``bands`` LSH bands; buckets holding more than ``max_bucket`` names are
+    skipped, which bounds the number of comparisons.
+    """
+    product_ids = products['product_id'].to_numpy()
+    forms = canonical_names(products['product_name'])
+    named = forms.notna().to_numpy()
+    form_codes, distinct = pd.factorize(forms[named])
+
+    shingles = _Shingles(distinct)
+    pairs = _candidates(shingles.signatures(num_perm, seed), bands, max_bucket)
+    if len(pairs):
+        numbers = pd.Series(distinct).str.findall(r'\d+(?:\.\d+)?').map(lambda n: ' '.join(sorted(n)))
+        numbers = numbers.to_numpy()
+        pairs = pairs[numbers[pairs[:, 0]] == numbers[pairs[:, 1]]]
+        pairs = pairs[_jaccard(shingles, pairs) >= threshold]
+    form_cluster = _components(len(distinct), pairs)
+
+    # Clusters of products: equal canonical form, or matched forms
+    cluster = np.arange(len(products)) + len(distinct)
+    cluster[named] = form_cluster[form_codes]
+    canonical_of_cluster = pd.Series(product_ids).groupby(cluster).transform('min').to_numpy()
+
+    size = int(product_ids.max()) + 1 if len(product_ids) else 0
+    canonical = np.full(size, -1, dtype=np.int32)
+    # The first row of a repeated product_id wins
+    canonical[product_ids[::-1]] = canonical_of_cluster[::-1]
+
+    sizes = pd.Series(cluster).map(pd.Series(cluster).value_counts()).to_numpy()
+    clusters = pd.DataFrame({
+        'product_id': product_ids,
+        'product_name': products['product_name'].to_numpy(),
+        'canonical_name': forms.to_numpy(),
+        'canonical_id': canonical_of_cluster,
+        'cluster_size': sizes,
+    })[sizes > 1].sort_values(['canonical_id', 'product_id']).reset_index(drop=True)
+    return ProductCatalog(canonical, clusters)
@@ -0,0 +1,317 @@
+"""Charts drawn from pre-aggregated counts, and a parallel headless renderer.
+
+The notebook hands raw rows to ``sns.histplot(..., kde=True)``: every order
+hour for the Wednesday/Saturday chart, and every customer for the
+orders-per-customer chart. Seaborn then bins the rows and evaluates a
+Gaussian KDE over all of them, which costs O(rows) per grid point.
+
+Here the rows are reduced first:
+
+- :func:`histogram` bins them in one vectorized pass. Integer data goes
+  through ``np.bincount``, so equal values are counted once.
+- :func:`kde_curve` smooths the counts of each distinct value (or the bin
+  counts, for continuous data). It spreads them onto a regular grid and
+  convolves with a Gaussian kernel by FFT, so the cost depends on
+  the grid size, not the row count. The bandwidth follows Scott's rule like
+  seaborn's default, and the curve is scaled to the histogram's counts.
+
+Only these arrays reach matplotlib. :func:`render_report` computes the
+inputs of every chart (on any :mod:`instacart.analysis` backend) and
+writes the PNG files from a process pool, with no display::
+
+    python -m instacart.charts --data-dir /path/to/csvs --report-dir reports --workers 4
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+DAY_NAMES = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat']
+
+# Integer data is counted per value while its range is at most this wide
+_DENSE_RANGE = 1 << 20
+
+
+@dataclass
+class Histogram:
+    """Bin ``edges`` (one more than ``counts``) and the count in each bin.
+
+    For integer data ``values`` and ``weights`` keep the exact count of each
+    distinct value, which :func:`kde_curve` smooths instead of the bins.
+    """
+
+    edges: np.ndarray
+    counts: np.ndarray
+    values: np.ndarray = None
+    weights: np.ndarray = None
+
+    @property
+    def centers(self):
+        return (self.edges[:-1] + self.edges[1:]) / 2
+
+    @property
+    def widths(self):
+        return np.diff(self.edges)
+
+    @classmethod
+    def from_counts(cls, counts):
+        """One unit-wide bin per index value of ``counts`` (e.g. a ``value_counts`` Series)."""
+        values = counts.index.to_numpy(dtype=np.float64)
+        order = np.argsort(values)
+        values = values[order]
+        edges = np.append(values - 0.5, values[-1] + 0.5) if len(values) else np.array([0.0])
+        weights = counts.to_numpy()[order].astype(np.int64)
+        histogram = cls(edges, weights, values, weights)
+        if len(values) and np.any(np.diff(values) != 1):
+            # Fill the gaps between values with empty bins
+            full = np.arange(values[0], values[-1] + 1)
+            filled = np.zeros(len(full), dtype=np.int64)
+            filled[(values - values[0]).astype(np.intp)] = histogram.counts
+            histogram = cls(np.append(full - 0.5, full[-1] + 0.5), filled, values, histogram.weights)
+        return histogram
+
+
+def histogram(values, bins=50, range=None, discrete=False):
+    """Bin ``values`` like ``np.histogram(values, bins, range)``, ignoring missing values.
+
+    With ``discrete=True`` every integer value gets its own unit-wide bin
+    instead.
+    """
+    values = pd.Series(values).dropna().to_numpy()
+    if len(values) == 0:
+        return Histogram(np.array([0.0, 1.0]), np.zeros(1, dtype=np.int64))
+    low, high = values.min(), values.max()
+    if np.issubdtype(values.dtype, np.integer) and high - low < _DENSE_RANGE:
+        # Count each distinct value once, then bin the distinct values
+        counts = np.bincount((values - low).astype(np.intp))
+        distinct = np.flatnonzero(counts)
+        values, weights = distinct + low, counts[distinct]
+    elif discrete:
+        values, weights = np.unique(values, return_counts=True)
+    else:
+        weights = None
+    if discrete:
+        counts = pd.Series(weights, index=values)
+        return Histogram.from_counts(counts)
+    counts, edges = np.histogram(values, bins=bins, range=range, weights=weights)
+    if weights is None:
+        return Histogram(edges, counts.astype(np.int64))
+    return Histogram(edges, counts.astype(np.int64), values.astype(np.float64), weights)
+
+
+def scott_bandwidth(points, weights):
+    total = weights.sum()
+    mean = np.dot(points, weights) / total
+    std = np.sqrt(np.dot((points - mean) ** 2, weights) / total)
+    return std * total ** -0.2
+
+
+def kde_curve(hist, bandwidth=None, gridsize=200, cut=3):
+    """Gaussian KDE of binned data, scaled to overlay ``hist`` on a count axis.
+
+    Returns ``(x, y)`` arrays. The exact value counts (or the bin counts at
+    the bin centers) are linearly binned onto a regular grid covering the
+    data plus ``cut`` bandwidths on each side, then convolved with the
+    kernel by FFT.
+    """
+    if hist.values is not None:
+        points, weights = hist.values, hist.weights.astype(np.float64)
+    else:
+        points, weights = hist.centers, hist.counts.astype(np.float64)
+    present = weights > 0
+    points, weights = points[present], weights[present]
+    if len(points) == 0:
+        return np.array([]), np.array([])
+    bandwidth = bandwidth or scott_bandwidth(points, weights)
+    if bandwidth <= 0:
+        return np.array([]), np.array([])
+    low, high = points.min() - cut * bandwidth, points.max() + cut * bandwidth
+    # At least three grid points per bandwidth so the kernel is resolved
+    gridsize = int(min(max(gridsize, np.ceil(3 * (high - low) / bandwidth) + 1), 1 << 16))
+    grid, step = np.linspace(low, high, gridsize, retstep=True)
+
+    position = (points - low) / step
+    left = np.minimum(np.floor(position).astype(np.intp), gridsize - 2)
+    right_share = position - left
+    binned = (np.bincount(left, weights * (1 - right_share), gridsize)
+              + np.bincount(left + 1, weights * right_share, gridsize))
+
+    reach = int(min(gridsize - 1, np.ceil(4 * bandwidth / step)))
+    offsets = np.arange(-reach, reach + 1) * step
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+    size = 1 << int(np.ceil(np.log2(gridsize + len(kernel))))
+    smoothed = np.fft.irfft(np.fft.rfft(binned, size) * np.fft.rfft(kernel, size), size)
+    density = smoothed[reach:reach + gridsize]
+    # Density times bin width puts the curve on the same scale as the counts
+    return grid, np.maximum(density, 0) * hist.widths.mean()
+
+
+def plot_histogram(ax, hist, color=None, label=None, alpha=0.6, kde=False, edgecolor=None):
+    """Draw ``hist`` as bars on ``ax``, with its KDE curve when ``kde`` is set."""
+    ax.bar(hist.edges[:-1], hist.counts, width=hist.widths, align='edge', color=color,
+           alpha=alpha, label=label, edgecolor=edgecolor)
+    if kde:
+        x, y = kde_curve(hist)
+        ax.plot(x, y, color=color)
+
+
+# Chart files. Each takes its aggregated input and the output folder and
+# returns the path it wrote.
+
+def _figure(size):
+    # Figure objects render without pyplot, so no display is needed
+    from matplotlib.figure import Figure
+    return Figure(figsize=size)
+
+
+def _save(figure, report_dir, name):
+    os.makedirs(report_dir, exist_ok=True)
+    path = os.path.join(report_dir, f'{name}.png')
+    figure.savefig(path, bbox_inches='tight')
+    return path
+
+
+def _bar_chart(counts, report_dir, name, xlabel, title, size=(10, 5), ticks=None):
+    figure = _figure(size)
+    ax = figure.add_subplot()
+    ax.bar(counts.index, counts.values, color='royalblue')
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel('Number of Orders')
+    ax.set_title(title)
+    if ticks is not None:
+        ax.set_xticks(*ticks)
+    ax.grid(axis='y', linestyle='--', alpha=0.7)
+    return _save(figure, report_dir, name)
+
+
+def hour_chart(counts, report_dir):
+    return _bar_chart(counts, report_dir, 'order_hour_of_day', 'Hour of Day',
+                      'Grocery Shopping Trends by Hour of Day', ticks=(range(24),))
+
+
+def dow_chart(counts, report_dir):
+    return _bar_chart(counts, report_dir, 'order_dow', 'Day of the Week (0 = Sunday, 6 = Saturday)',
+                      'Grocery Shopping Trends by Day of the Week', size=(8, 5),
+                      ticks=(range(7), DAY_NAMES))
+
+
+def days_chart(counts, report_dir):
+    return _bar_chart(counts, report_dir, 'days_since_prior_order', 'Days Since Prior Order',
+                      'Time Between Grocery Orders')
+
+
+def wed_sat_hour_histogram(counts, report_dir):
+    """``counts`` has one row per hour and ``Wednesday`` and ``Saturday`` columns."""
+    figure = _figure((12, 6))
+    ax = figure.add_subplot()
+    for day, color in (('Wednesday', 'blue'), ('Saturday', 'orange')):
+        plot_histogram(ax, Histogram.from_counts(counts[day]), color=color, label=day, kde=True)
+    ax.set_xlabel('Hour of Day')
+    ax.set_ylabel('Number of Orders')
+    ax.set_title('Distribution of Orders by Hour on Wednesday vs. Saturday')
+    ax.legend()
+    ax.set_xticks(range(24))
+    ax.grid(axis='y', linestyle='--', alpha=0.7)
+    return _save(figure, report_dir, 'wed_sat_hour_histogram')
+
+
+def _as_histogram(values, bins):
+    return values if isinstance(values, Histogram) else histogram(values, bins)
+
+
+def orders_per_customer_chart(counts, report_dir):
+    """``counts`` is the orders per customer, or a :class:`Histogram` of them."""
+    figure = _figure((12, 6))
+    ax = figure.add_subplot()
+    plot_histogram(ax, _as_histogram(counts, 50), color='purple', alpha=0.7, kde=True)
+    ax.set_xlabel('Number of Orders per Customer')
+    ax.set_ylabel('Number of Customers')
+    ax.set_title('Distribution of Orders per Customer')
+    ax.grid(axis='y', linestyle='--', alpha=0.7)
+    return _save(figure, report_dir, 'orders_per_customer')
+
+
+def order_size_chart(sizes, report_dir):
+    """``sizes`` is the items per order, or a :class:`Histogram` of them."""
+    figure = _figure((10, 5))
+    ax = figure.add_subplot()
+    plot_histogram(ax, _as_histogram(sizes, 50), alpha=1.0, edgecolor='black')
+    ax.set_xlabel('Number of Items in an Order')
+    ax.set_ylabel('Frequency')
+    ax.set_title('Distribution of Items per Order')
+    ax.set_xlim(0, 100)
+    ax.set_yscale('log')
+    return _save(figure, report_dir, 'order_sizes')
+
+
+def _wed_sat(hour_dow_counts):
+    return hour_dow_counts[[3, 6]].set_axis(['Wednesday', 'Saturday'], axis=1)
+
+
+# Chart -> (renderer, analysis it is drawn from, reduction applied before rendering)
+CHARTS = {
+    'order_hour_of_day': (hour_chart, 'order_hour_counts', None),
+    'order_dow': (dow_chart, 'order_dow_counts', None),
+    'days_since_prior_order': (days_chart, 'days_counts', None),
+    'wed_sat_hour_histogram': (wed_sat_hour_histogram, 'hour_dow_counts', _wed_sat),
+    'orders_per_customer': (orders_per_customer_chart, 'customer_order_counts',
+                            lambda counts: histogram(counts, 50)),
+    'order_sizes': (order_size_chart, 'order_sizes', lambda sizes: histogram(sizes, 50)),
+}
+
+
+def _render(job):
+    renderer, data, report_dir = job
+    return renderer(data, report_dir)
+
+
+def render_charts(jobs, report_dir, workers=None):
+    """Render ``{name: (renderer, data)}`` to ``report_dir`` in a process pool.
+
+    ``workers=1`` renders in this process. Returns ``{name: path}``.
+    """
+    tasks = [(renderer, data, report_dir) for renderer, data in jobs.values()]
+    if workers == 1 or len(tasks) <= 1:
+        paths = [_render(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            paths = list(pool.map(_render, tasks))
+    return dict(zip(jobs, paths))
+
+
+def render_report(data_dir=None, report_dir='reports', charts=None, backend=None, workers=None):
+    """Compute the inputs of ``charts`` (default: all) and write every chart file."""
+    from instacart.analysis import run_analyses
+
+    charts = list(CHARTS) if charts is None else list(charts)
+    results = run_analyses(sorted({CHARTS[c][1] for c in charts}), data_dir, backend)
+    jobs = {}
+    for chart in charts:
+        renderer, analysis, reduce = CHARTS[chart]
+        data = results[analysis]
+        jobs[chart] = (renderer, reduce(data) if reduce else data)
+    return render_charts(jobs, report_dir, workers)
+
+
+def main(argv=None):
+    from instacart.analysis import BACKENDS, DEFAULT_BACKEND
+    from instacart.loader import DEFAULT_DATA_DIR
+
+    parser = argparse.ArgumentParser(description='Write every chart of the analysis to files.')
+    parser.add_argument('charts', nargs='*', help=f'charts to render (default: {", ".join(CHARTS)})')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--report-dir', default='reports')
+    parser.add_argument('--backend', default=DEFAULT_BACKEND, choices=BACKENDS)
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args(argv)
+    for name, path in render_report(args.data_dir, args.report_dir, args.charts or None,
+                                    args.backend, args.workers).items():
+        print(f'{name}: {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Cleaning steps applied to the raw tables before any analysis.
+
+These are the same steps the notebook walks through one cell at a time:
+duplicate orders are dropped by ``order_id``, ``order_products`` is stripped
+of stray whitespace and de-duplicated, and products without a name are
+removed. ``CLEANING_VERSION`` must be bumped whenever the output of any of
+these functions changes, since cached results are keyed on it.
+"""
+
+from instacart.normalize import strip_whitespace
+
+CLEANING_VERSION = 1
+
+
+def clean_orders(orders):
+    """Drop repeated orders, keeping the first row for each ``order_id``."""
+    return orders.drop_duplicates(subset=['order_id'], keep='first').reset_index(drop=True)
+
+
+def clean_order_products(order_products):
+    """Strip whitespace from text cells and drop fully duplicate rows."""
+    stripped = strip_whitespace(order_products)
+    return stripped.drop_duplicates().reset_index(drop=True)
+
+
+def clean_products(products):
+    """Drop products without a name and mark missing aisle/department ids as -1."""
+    products_cleaned = products.dropna(subset=['product_name']).copy()
+    products_cleaned.loc[:, ['aisle_id', 'department_id']] = (
+        products_cleaned[['aisle_id', 'department_id']].fillna(-1)
+    )
+    return products_cleaned.reset_index(drop=True)
+
+
+def clean_aisles(aisles):
+    """Drop fully duplicate aisle rows."""
+    return aisles.drop_duplicates().reset_index(drop=True)
+
+
+def clean_departments(departments):
+    """Drop fully duplicate department rows."""
+    return departments.drop_duplicates().reset_index(drop=True)
+
+
+CLEANERS = {
+    'orders': clean_orders,
+    'order_products': clean_order_products,
+    'products': clean_products,
+    'aisles': clean_aisles,
+    'departments': clean_departments,
+}
+
+
+def clean_tables(frames):
+    """Return a dict with every table in ``frames`` passed through its cleaner."""
+    return {name: CLEANERS[name](frame) for name, frame in frames.items()}
@@ -0,0 +1,315 @@
+"""Which products are bought together: pair rules and frequent itemsets.
+
+The notebook stops at single-product counts. Here ``order_products`` is
+turned into a sparse order x product incidence matrix whose rows are the
+``order_id`` values and columns the ``product_id`` values themselves, so no
+key is re-encoded. With ``X`` that matrix:
+
+- the support of a product (orders containing it) is a column count of ``X``
+- the number of orders holding both products of a pair is ``X.T @ X``, of
+  which only the upper triangle is kept
+
+Support is anti-monotone, so products below ``min_support`` are dropped
+before the product. Pairs then get confidence and lift. :func:`fp_growth`
+mines larger itemsets from baskets cut down to the products of frequent
+pairs, with identical baskets counted once.
+
+Orders never span shards, because :func:`analyze_baskets` partitions the
+lines by ``order_id`` like :mod:`instacart.parallel`. Per-shard pair
+matrices and basket counts can then be summed, and each worker sees only
+its own slice of the file.
+
+Needs scipy: ``pip install scipy``.
+"""
+
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from instacart.parallel import ORDER_PRODUCT_COLUMNS, SharedTable, attach_shard, shard_layout
+
+try:
+    from scipy import sparse
+except ImportError:  # pragma: no cover - optional dependency
+    sparse = None
+
+_BASKET_COLUMNS = {c: ORDER_PRODUCT_COLUMNS[c] for c in ('order_id', 'product_id')}
+
+
+def basket_matrix(order_ids, product_ids, shape=None):
+    """Binary CSR matrix with a 1 at ``(order_id, product_id)`` for every line.
+
+    Repeated lines count once. ``shape`` defaults to the largest ids plus one.
+    """
+    if sparse is None:
+        raise ImportError('the co-occurrence engine needs scipy: pip install scipy')
+    order_ids = np.asarray(order_ids)
+    product_ids = np.asarray(product_ids)
+    if shape is None:
+        shape = (int(order_ids.max(initial=0)) + 1, int(product_ids.max(initial=0)) + 1)
+    matrix = sparse.csr_matrix((np.ones(len(order_ids), dtype=np.int32), (order_ids, product_ids)),
+                               shape=shape)
+    # Duplicate lines were summed when the matrix was built
+    matrix.data[:] = 1
+    return matrix
+
+
+def product_support(matrix):
+    """Number of orders containing each product (column counts of ``matrix``)."""
+    return np.bincount(matrix.indices, minlength=matrix.shape[1])
+
+
+def prune(matrix, keep):
+    """``matrix`` without the entries of products outside the boolean mask ``keep``."""
+    matrix = matrix @ sparse.diags(keep.astype(np.int32), dtype=np.int32)
+    matrix.eliminate_zeros()
+    return matrix
+
+
+def pair_counts(matrix):
+    """Upper-triangular CSR of the number of orders holding each product pair."""
+    return sparse.triu(matrix.T @ matrix, k=1, format='csr')
+
+
+def basket_counts(matrix, min_size=1):
+    """Count identical baskets: Counter mapping a tuple of product ids to orders.
+
+    Baskets of fewer than ``min_size`` products are left out.
+    """
+    rows = np.flatnonzero(np.diff(matrix.indptr) >= min_size)
+    starts, stops = matrix.indptr[rows], matrix.indptr[rows + 1]
+    counts = Counter(matrix.indices[start:stop].tobytes() for start, stop in zip(starts, stops))
+    dtype = matrix.indices.dtype
+    return Counter({tuple(np.frombuffer(key, dtype=dtype).tolist()): count
+                    for key, count in counts.items()})
+
+
+def pair_products(pairs, min_count=1):
+    """Boolean mask of the products in at least one pair counted ``min_count`` times."""
+    pairs = pairs.tocoo()
+    frequent = pairs.data >= min_count
+    keep = np.zeros(pairs.shape[1], dtype=bool)
+    keep[pairs.row[frequent]] = True
+    keep[pairs.col[frequent]] = True
+    return keep
+
+
+def pair_rules(pairs, support, orders, min_count=1):
+    """Support, confidence and lift of every pair counted at least ``min_count`` times."""
+    pairs = pairs.tocoo()
+    frequent = pairs.data >= min_count
+    a, b, both = pairs.row[frequent], pairs.col[frequent], pairs.data[frequent].astype(np.int64)
+    support_a, support_b = support[a], support[b]
+    rules = pd.DataFrame({
+        'product_a': a,
+        'product_b': b,
+        'orders': both,
+        'support': both / orders,
+        'confidence_a_b': both / support_a,
+        'confidence_b_a': both / support_b,
+        'lift': both * orders / (support_a * support_b),
+    })
+    return rules.sort_values(['orders', 'product_a', 'product_b'],
+                             ascending=[False, True, True]).reset_index(drop=True)
+
+
+class _Node:
+    __slots__ = ('item', 'count', 'parent', 'children')
+
+    def __init__(self, item, parent):
+        self.item = item
+        self.count = 0
+        self.parent = parent
+        self.children = {}
+
+
+def _fp_tree(transactions, min_count):
+    """Build an FP-tree; returns the frequent item counts and the nodes of each item.
+
+    Items are frequency ranks and every transaction is sorted by rank, so
+    the tree is built without sorting again at each level.
+    """
+    counts = Counter()
+    for items, count in transactions:
+        for item in items:
+            counts[item] += count
+    frequent = {item: count for item, count in counts.items() if count >= min_count}
+    root = _Node(None, None)
+    nodes = {item: [] for item in frequent}
+    for items, count in transactions:
+        node = root
+        for item in items:
+            if item not in frequent:
+                continue
+            child = node.children.get(item)
+            if child is None:
+                child = node.children[item] = _Node(item, node)
+                nodes[item].append(child)
+            child.count += count
+            node = child
+    return frequent, nodes
+
+
+def _mine(transactions, min_count, suffix, max_len, found):
+    frequent, nodes = _fp_tree(transactions, min_count)
+    for item in frequent:
+        itemset = (item,) + suffix
+        found[itemset] = frequent[item]
+        if max_len is not None and len(itemset) >= max_len:
+            continue
+        if max_len is not None and len(itemset) + 1 == max_len:
+            # The next itemsets cannot be extended, so count the items above
+            # each node instead of building a conditional tree
+            counts = Counter()
+            for node in nodes[item]:
+                parent = node.parent
+                while parent.item is not None:
+                    counts[parent.item] += node.count
+                    parent = parent.parent
+            for other, count in counts.items():
+                if count >= min_count:
+                    found[(other,) + itemset] = count
+            continue
+        # Conditional pattern base: the path above every node of the item
+        base = []
+        for node in nodes[item]:
+            path, parent = [], node.parent
+            while parent.item is not None:
+                path.append(parent.item)
+                parent = parent.parent
+            if path:
+                base.append((path[::-1], node.count))
+        if base:
+            _mine(base, min_count, itemset, max_len, found)
+
+
+def fp_growth(baskets, min_count, max_len=None):
+    """Frequent itemsets of ``baskets`` with FP-growth.
+
+    ``baskets`` maps a tuple of product ids to the number of orders with
+    exactly that basket (see :func:`basket_counts`). Returns a DataFrame of
+    ``itemset`` (sorted tuple), ``size`` and ``orders``.
+    """
+    support = Counter()
+    for basket, count in baskets.items():
+        for product in basket:
+            support[product] += count
+    # Most frequent products get the lowest ranks, so baskets share the top of the tree
+    products = sorted(support, key=lambda p: (-support[p], p))
+    rank = {product: i for i, product in enumerate(products)}
+    transactions = [(sorted(rank[p] for p in basket), count) for basket, count in baskets.items()]
+    found = {}
+    _mine(transactions, min_count, (), max_len, found)
+    itemsets = pd.DataFrame({
+        'itemset': [tuple(sorted(products[i] for i in itemset)) for itemset in found],
+        'size': [len(itemset) for itemset in found],
+        'orders': list(found.values()),
+    }, columns=['itemset', 'size', 'orders'])
+    return itemsets.sort_values(['size', 'orders', 'itemset'],
+                                ascending=[True, False, True]).reset_index(drop=True)
+
+
+@dataclass
+class BasketAnalysis:
+    orders: int
+    # Orders containing each product, indexed by product_id
+    support: pd.Series
+    # One row per product pair: orders, support, confidence both ways, lift
+    pairs: pd.DataFrame
+    # Frequent itemsets from FP-growth; None unless asked for
+    itemsets: pd.DataFrame = None
+
+
+def _shard_matrix(spec, bounds, shape, keep=None):
+    lines = attach_shard(spec, *bounds)
+    if keep is not None:
+        lines = lines[keep[lines['product_id'].to_numpy()]]
+    return basket_matrix(lines['order_id'].to_numpy(), lines['product_id'].to_numpy(), shape)
+
+
+def _shard_support(spec, bounds, shape):
+    matrix = _shard_matrix(spec, bounds, shape)
+    return int(np.count_nonzero(np.diff(matrix.indptr))), product_support(matrix)
+
+
+def _shard_pairs(spec, bounds, shape, keep):
+    return pair_counts(_shard_matrix(spec, bounds, shape, keep))
+
+
+def _shard_baskets(spec, bounds, shape, keep):
+    return basket_counts(_shard_matrix(spec, bounds, shape, keep), min_size=2)
+
+
+def _itemsets(baskets, support, min_count, max_len, orders):
+    # Single products come from the support counts; the baskets only hold
+    # products of frequent pairs, which is all larger itemsets can contain.
+    singles = np.flatnonzero(support >= min_count)
+    larger = fp_growth(baskets, min_count, max_len)
+    itemsets = pd.concat([
+        pd.DataFrame({'itemset': [(int(p),) for p in singles], 'size': 1,
+                      'orders': support[singles]}),
+        larger[larger['size'] > 1],
+    ], ignore_index=True)
+    itemsets['support'] = itemsets['orders'] / orders
+    return itemsets.sort_values(['size', 'orders', 'itemset'],
+                                ascending=[True, False, True]).reset_index(drop=True)
+
+
+def analyze_baskets(order_products, min_support=0.001, itemsets=False, max_len=3,
+                    workers=1, shards=None):
+    """Pair rules (and optionally frequent itemsets) of ``order_products``.
+
+    Only products and pairs found in at least ``min_support`` of the orders
+    are kept. With ``workers`` above one (``None`` for all cores) the lines
+    are split into ``shards`` partitions by ``order_id`` (default four per
+    worker) and counted in worker processes.
+    """
+    order_ids = order_products['order_id'].to_numpy()
+    product_ids = order_products['product_id'].to_numpy()
+    shape = (int(order_ids.max(initial=0)) + 1, int(product_ids.max(initial=0)) + 1)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        matrix = basket_matrix(order_ids, product_ids, shape)
+        orders = int(np.count_nonzero(np.diff(matrix.indptr)))
+        support = product_support(matrix)
+        min_count = max(1, int(np.ceil(min_support * orders)))
+        matrix = prune(matrix, support >= min_count)
+        pairs = pair_counts(matrix)
+        if itemsets:
+            baskets = basket_counts(prune(matrix, pair_products(pairs, min_count)), min_size=2)
+    else:
+        shards = shards or workers * 4
+        layout, bounds = shard_layout(order_ids, shards)
+        shared = SharedTable.create(order_products, _BASKET_COLUMNS, layout)
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                ranges = [(bounds[i], bounds[i + 1]) for i in range(shards)]
+                partials = list(pool.map(_shard_support, [shared.spec()] * shards, ranges,
+                                         [shape] * shards))
+                orders = sum(count for count, _ in partials)
+                support = np.sum([counts for _, counts in partials], axis=0)
+                min_count = max(1, int(np.ceil(min_support * orders)))
+                keep = support >= min_count
+                pairs = sum(pool.map(_shard_pairs, [shared.spec()] * shards, ranges,
+                                     [shape] * shards, [keep] * shards))
+                if itemsets:
+                    keep = pair_products(pairs, min_count)
+                    baskets = sum(pool.map(_shard_baskets, [shared.spec()] * shards, ranges,
+                                           [shape] * shards, [keep] * shards), Counter())
+        finally:
+            shared.release()
+
+    present = np.flatnonzero(support)
+    result = BasketAnalysis(
+        orders=orders,
+        support=pd.Series(support[present], index=pd.Index(present, name='product_id'),
+                          name='orders'),
+        pairs=pair_rules(pairs, support, orders, min_count),
+    )
+    if itemsets:
+        result.itemsets = _itemsets(baskets, support, min_count, max_len, orders)
+    return result
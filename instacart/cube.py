@@ -0,0 +1,247 @@
+"""Dense count cube over order day, hour, days since prior order and department.
+
+The notebook counts ``order_hour_of_day``, ``order_dow`` and
+``days_since_prior_order`` with a separate ``value_counts`` each, and finds
+the Wednesday 2 AM orders with a boolean filter over the whole table.
+Every question is a full scan of ``orders``.
+
+All of these axes are small, so :class:`OrderCube` keeps every count in
+dense arrays:
+
+- ``orders``: 7 days x 24 hours x 32 day buckets (0..30 and one for a
+  missing ``days_since_prior_order``)
+- ``items``, ``reorders`` and ``department_orders``: the same axes times
+  ``department_id``, where 0 holds products with an unknown department
+
+The cube is built in one vectorized pass (``np.bincount`` over the flat
+cell index). Any slice, marginal or roll-up is then a few small array
+sums with no rescan of the orders. :meth:`OrderCube.update` adds new
+batches of orders and order lines. The cube remembers the cell of every
+order and which departments each order already touched, so lines arriving
+after their order still land in the right cell, and an order is counted
+once per department. Lines that arrive before their order wait in a
+buffer and are counted when the order comes in, so feeding the tables in
+batches gives the same cube as one build.
+
+Rows are counted as given, so pass cleaned tables to count distinct orders.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from instacart.joins import grow_array
+
+DAYS_BUCKETS = 32
+
+# Bucket of a missing days_since_prior_order
+NULL_DAYS = DAYS_BUCKETS - 1
+
+AXES = ('order_dow', 'order_hour_of_day', 'days_since_prior_order', 'department_id')
+
+# Department ids run from 1 to 21; 0 is the unknown department
+DEFAULT_DEPARTMENTS = 22
+
+ORDER_MEASURES = ('orders',)
+
+LINE_MEASURES = ('items', 'reorders', 'department_orders')
+
+_ORDER_SHAPE = (7, 24, DAYS_BUCKETS)
+
+_CELLS = 7 * 24 * DAYS_BUCKETS
+
+_PENDING_COLUMNS = ('order_id', 'department_id', 'reordered')
+
+
+def order_cells(orders):
+    """Flat cell index (dow, hour, days bucket) of every row of ``orders``."""
+    days = orders['days_since_prior_order'].to_numpy(dtype=np.float64)
+    bucket = np.where(np.isnan(days), NULL_DAYS, np.nan_to_num(days)).astype(np.intp)
+    dow = orders['order_dow'].to_numpy().astype(np.intp)
+    hour = orders['order_hour_of_day'].to_numpy().astype(np.intp)
+    return (dow * 24 + hour) * DAYS_BUCKETS + bucket
+
+
+def _bits(departments):
+    return np.left_shift(np.uint32(1), departments.astype(np.uint32))
+
+
+def _positions(axis, value):
+    values = np.atleast_1d(np.asarray(value, dtype=object))
+    if axis == 'days_since_prior_order':
+        values = [NULL_DAYS if v is None or v != v else v for v in values]
+    return np.asarray(values, dtype=np.intp)
+
+
+def _labels(axis, size):
+    if axis == 'days_since_prior_order':
+        return pd.Index(np.r_[np.arange(NULL_DAYS, dtype=float), np.nan], name=axis)
+    return pd.RangeIndex(size, name=axis)
+
+
+class OrderCube:
+    """Order and order-line counts by day, hour, days since prior order and department."""
+
+    def __init__(self, measures, order_cell, order_departments, pending=None):
+        self.measures = measures
+        # Cell of each order_id, -1 for unknown orders
+        self.order_cell = order_cell
+        # Bit d is set when the order already has a line in department d
+        self.order_departments = order_departments
+        # Order lines whose order has not arrived yet, with their department resolved
+        self.pending = pending if pending is not None else pd.DataFrame(
+            {name: np.zeros(0, dtype=np.int64) for name in _PENDING_COLUMNS})
+
+    @classmethod
+    def empty(cls, departments=DEFAULT_DEPARTMENTS):
+        if departments > 32:
+            raise ValueError('the per-order department bit mask holds at most 32 departments')
+        measures = {'orders': np.zeros(_ORDER_SHAPE, dtype=np.int64)}
+        for name in LINE_MEASURES:
+            measures[name] = np.zeros(_ORDER_SHAPE + (departments,), dtype=np.int64)
+        return cls(measures, np.full(0, -1, dtype=np.int16), np.zeros(0, dtype=np.uint32))
+
+    @classmethod
+    def build(cls, orders, order_products=None, dimensions=None, departments=DEFAULT_DEPARTMENTS):
+        """Build the cube from ``orders`` and, optionally, ``order_products``.
+
+        ``dimensions`` (a :class:`~instacart.dimensions.DimensionStore`)
+        gives the department of each product and is needed with
+        ``order_products``.
+        """
+        return cls.empty(departments).update(orders, order_products, dimensions)
+
+    @property
+    def departments(self):
+        return self.measures['items'].shape[-1]
+
+    @property
+    def unmatched_lines(self):
+        """Number of order lines still waiting for their order."""
+        return len(self.pending)
+
+    def update(self, orders=None, order_products=None, dimensions=None):
+        """Add a batch of orders and/or order lines; returns the cube."""
+        if orders is not None and len(orders):
+            cells = order_cells(orders)
+            self.measures['orders'] += np.bincount(cells, minlength=_CELLS).reshape(_ORDER_SHAPE)
+            order_ids = orders['order_id'].to_numpy()
+            size = int(order_ids.max()) + 1
+            self.order_cell = grow_array(self.order_cell, size, -1)
+            self.order_departments = grow_array(self.order_departments, size)
+            # The first row of a repeated order_id decides its cell
+            unseen = self.order_cell[order_ids] < 0
+            self.order_cell[order_ids[unseen][::-1]] = cells[unseen][::-1]
+            if unseen.any() and len(self.pending):
+                self._resolve_pending()
+        if order_products is not None and len(order_products):
+            if dimensions is None:
+                raise ValueError('dimensions is needed to place order lines by department')
+            self._add_lines(order_products, dimensions)
+        return self
+
+    def _add_lines(self, order_products, dimensions):
+        departments = dimensions.lookup(order_products['product_id'].to_numpy(), 'department_id')
+        departments = np.where((departments > 0) & (departments < self.departments), departments, 0)
+        self._count_lines(order_products['order_id'].to_numpy().astype(np.int64),
+                          departments.astype(np.int64),
+                          order_products['reordered'].to_numpy().astype(np.int64))
+
+    def _cells_of(self, order_ids):
+        cells = np.full(len(order_ids), -1, dtype=np.intp)
+        inside = order_ids < len(self.order_cell)
+        cells[inside] = self.order_cell[order_ids[inside]]
+        return cells
+
+    def _resolve_pending(self):
+        known = self._cells_of(self.pending['order_id'].to_numpy()) >= 0
+        if known.any():
+            ready = self.pending[known]
+            self.pending = self.pending[~known].reset_index(drop=True)
+            self._count_lines(*(ready[name].to_numpy() for name in _PENDING_COLUMNS))
+
+    def _count_lines(self, order_ids, departments, reordered):
+        cells = self._cells_of(order_ids)
+        known = cells >= 0
+        if not known.all():
+            waiting = pd.DataFrame({'order_id': order_ids[~known], 'department_id': departments[~known],
+                                    'reordered': reordered[~known]})
+            self.pending = pd.concat([self.pending, waiting], ignore_index=True)
+            order_ids, departments, reordered, cells = (
+                order_ids[known], departments[known], reordered[known], cells[known])
+        flat = cells * self.departments + departments
+        size = _CELLS * self.departments
+        shape = self.measures['items'].shape
+        self.measures['items'] += np.bincount(flat, minlength=size).reshape(shape)
+        self.measures['reorders'] += np.bincount(flat, weights=reordered,
+                                                 minlength=size).astype(np.int64).reshape(shape)
+
+        # Each order counts once per department, across batches too
+        pairs = np.unique(order_ids * self.departments + departments)
+        pair_orders, pair_departments = pairs // self.departments, pairs % self.departments
+        new = (self.order_departments[pair_orders] & _bits(pair_departments)) == 0
+        pair_orders, pair_departments = pair_orders[new], pair_departments[new]
+        np.bitwise_or.at(self.order_departments, pair_orders, _bits(pair_departments))
+        new_flat = self.order_cell[pair_orders].astype(np.intp) * self.departments + pair_departments
+        self.measures['department_orders'] += np.bincount(new_flat, minlength=size).reshape(shape)
+
+    def _select(self, measure, where):
+        if measure not in self.measures:
+            raise KeyError(f'Unknown measure {measure!r}; expected one of {", ".join(self.measures)}')
+        cube = self.measures[measure]
+        for axis, value in where.items():
+            if axis not in AXES[:cube.ndim]:
+                raise KeyError(f'{measure!r} has no axis {axis!r}')
+            cube = np.take(cube, _positions(axis, value), axis=AXES.index(axis))
+        return cube
+
+    def count(self, measure='orders', **where):
+        """Total of ``measure`` over the cells matching ``where``.
+
+        ``where`` maps an axis to one value or a list of values, e.g.
+        ``count(order_dow=3, order_hour_of_day=2)``. Use ``None`` for a
+        missing ``days_since_prior_order``.
+        """
+        return int(self._select(measure, where).sum())
+
+    def marginal(self, *axes, measure='orders', dropna=True, **where):
+        """Totals of ``measure`` by ``axes`` over the cells matching ``where``.
+
+        Returns a Series indexed by the axes (a MultiIndex for more than
+        one). With ``dropna`` the missing ``days_since_prior_order`` bucket
+        is left out when that axis is in ``axes``, like ``value_counts``.
+        """
+        cube = self._select(measure, where)
+        names = AXES[:cube.ndim]
+        summed = tuple(i for i, name in enumerate(names) if name not in axes)
+        totals = cube.sum(axis=summed)
+        kept = [name for name in names if name in axes]
+        totals = np.transpose(totals, [kept.index(axis) for axis in axes])
+        labels = []
+        for axis in axes:
+            position = names.index(axis)
+            full = _labels(axis, self.measures[measure].shape[position])
+            labels.append(full[_positions(axis, where[axis])] if axis in where else full)
+        if len(axes) == 1:
+            result = pd.Series(totals, index=labels[0], name=measure)
+        else:
+            result = pd.Series(totals.ravel(), index=pd.MultiIndex.from_product(labels), name=measure)
+        if dropna and 'days_since_prior_order' in axes:
+            result = result[result.index.get_level_values('days_since_prior_order').notna()]
+        return result
+
+    def save(self, path):
+        """Persist the cube to folder ``path``."""
+        os.makedirs(path, exist_ok=True)
+        pending = {f'pending_{name}': self.pending[name].to_numpy() for name in _PENDING_COLUMNS}
+        np.savez(os.path.join(path, 'cube.npz'), order_cell=self.order_cell,
+                 order_departments=self.order_departments, **pending, **self.measures)
+
+    @classmethod
+    def load(cls, path):
+        """Open a cube written by :meth:`save`."""
+        with np.load(os.path.join(path, 'cube.npz')) as state:
+            measures = {name: state[name] for name in ORDER_MEASURES + LINE_MEASURES}
+            pending = pd.DataFrame({name: state[f'pending_{name}'] for name in _PENDING_COLUMNS})
+            return cls(measures, state['order_cell'], state['order_departments'], pending)
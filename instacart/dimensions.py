@@ -0,0 +1,166 @@
+"""Dense id-indexed lookup arrays for products, aisles and departments.
+
+The notebook attaches names with
+``merge(products[['product_id', 'product_name']], on='product_id')`` and
+looks single names up with a boolean scan such as
+``aisles.loc[aisles['aisle_id'] == 100, 'aisle'].values[0]``. Both hash or
+scan a whole table to find a handful of rows.
+
+The ids are small dense integers (at most 49,694 products, 134 aisles and
+21 departments), so each dimension column fits in one array indexed
+directly by id, like :class:`~instacart.joins.OrderIndex` does for orders.
+Names are stored as category codes, so decoding any id column is a single
+``np.take`` followed by ``pd.Categorical.from_codes``. :meth:`DimensionStore.attach`
+replaces the merges.
+"""
+
+import numpy as np
+import pandas as pd
+
+from instacart.loader import load_table
+
+# Each dimension column, with the id it is indexed by
+KEYS = {
+    'product_name': 'product_id',
+    'aisle_id': 'product_id',
+    'department_id': 'product_id',
+    'aisle': 'aisle_id',
+    'department': 'department_id',
+}
+
+# Columns holding names; their arrays store category codes
+NAME_COLUMNS = ('product_name', 'aisle', 'department')
+
+# Value stored for ids that are unknown or missing; -1 is also the missing category code
+MISSING = -1
+
+
+def _dense_positions(ids):
+    """Reversed ids and the array size needed to index them.
+
+    Writing values in reverse order makes the first occurrence of a repeated
+    id win, as with ``drop_duplicates(subset=[id])``.
+    """
+    ids = np.asarray(ids, dtype=np.int64)[::-1]
+    if len(ids) and ids.min() < 0:
+        raise ValueError('dimension ids must be non-negative')
+    return ids, int(ids.max()) + 1 if len(ids) else 0
+
+
+def _codes(series):
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype('category')
+    return series.cat.codes.to_numpy(), series.cat.categories
+
+
+class DimensionStore:
+    """Dense arrays of dimension columns, position ``i`` holding id ``i``."""
+
+    def __init__(self, arrays, categories, present):
+        self.arrays = arrays
+        # Column -> names that the codes of a name column point into
+        self.categories = categories
+        # Key -> boolean array, True where that id exists
+        self.present = present
+
+    @classmethod
+    def from_tables(cls, products=None, aisles=None, departments=None):
+        """Build the store from any of the three dimension frames.
+
+        When an id appears more than once the first row wins.
+        """
+        arrays, categories, present = {}, {}, {}
+        for frame, key in ((products, 'product_id'), (aisles, 'aisle_id'),
+                           (departments, 'department_id')):
+            if frame is None:
+                continue
+            ids, size = _dense_positions(frame[key].to_numpy())
+            present[key] = np.zeros(size, dtype=bool)
+            present[key][ids] = True
+            for column in (c for c, k in KEYS.items() if k == key and c in frame):
+                if column in NAME_COLUMNS:
+                    values, categories[column] = _codes(frame[column])
+                    dtype = np.int32
+                else:
+                    values = frame[column].to_numpy(dtype=np.int16, na_value=MISSING)
+                    dtype = np.int16
+                array = np.full(size, MISSING, dtype=dtype)
+                array[ids] = values[::-1]
+                arrays[column] = array
+        return cls(arrays, categories, present)
+
+    @classmethod
+    def from_data_dir(cls, data_dir=None):
+        """Load the three dimension tables from ``data_dir`` and build the store."""
+        return cls.from_tables(*(load_table(t, data_dir) for t in ('products', 'aisles', 'departments')))
+
+    def contains(self, ids, key='product_id'):
+        """Boolean mask of which ``ids`` (values of ``key``) exist."""
+        ids = np.asarray(ids)
+        present = self.present[key]
+        inside = (ids >= 0) & (ids < len(present))
+        mask = np.zeros(len(ids), dtype=bool)
+        mask[inside] = present[ids[inside]]
+        return mask
+
+    def codes(self, ids, column):
+        """Return the stored values of ``column`` for ``ids`` (-1 for unknown ids).
+
+        For name columns these are category codes into ``categories[column]``.
+        """
+        ids = np.asarray(ids)
+        array = self.arrays[column]
+        inside = (ids >= 0) & (ids < len(array))
+        if inside.all():
+            return array.take(ids)
+        out = np.full(len(ids), MISSING, dtype=array.dtype)
+        out[inside] = array.take(ids[inside])
+        return out
+
+    def lookup(self, ids, column):
+        """Decode ``column`` for ``ids``, the values of the id in :data:`KEYS`.
+
+        Name columns come back as a ``Categorical`` (missing for unknown
+        ids), id columns as an int16 array with -1 for unknown ids.
+        """
+        values = self.codes(ids, column)
+        if column in NAME_COLUMNS:
+            return pd.Categorical.from_codes(values, self.categories[column])
+        return values
+
+    def get(self, id, column):
+        """Return the value of ``column`` for the single id ``id``."""
+        return self.lookup([id], column)[0]
+
+    def key_values(self, frame, key):
+        """Values of ``key`` for every row of ``frame``.
+
+        The key is read from a column or the index of that name. Aisle and
+        department ids can also be reached through ``product_id``.
+        """
+        if key in frame.columns:
+            return frame[key].to_numpy()
+        if key in frame.index.names:
+            return frame.index.get_level_values(key).to_numpy()
+        if key != 'product_id':
+            return self.codes(self.key_values(frame, 'product_id'), key)
+        raise KeyError(f'{key!r} is neither a column nor an index level')
+
+    def attach(self, frame, columns=('product_name',), drop_unmatched=True):
+        """Return ``frame`` with dimension ``columns`` added.
+
+        This replaces ``frame.merge(products[['product_id', 'product_name']],
+        on='product_id')`` and its aisle and department counterparts. With
+        ``drop_unmatched`` rows whose id is unknown are removed, like the
+        inner join they replace.
+        """
+        result = frame.copy(deep=False)
+        matched = np.ones(len(frame), dtype=bool)
+        for column in columns:
+            ids = self.key_values(frame, KEYS[column])
+            result[column] = self.lookup(ids, column)
+            if drop_unmatched:
+                matched &= self.contains(ids, KEYS[column])
+        if not matched.all():
+            result = result[matched]
+        return result
@@ -0,0 +1,221 @@
+"""The analyses of :mod:`instacart.analysis` as DuckDB SQL over files on disk.
+
+Nothing is loaded into pandas except the small result tables. Each table is
+a view over its csv file, or over ``<parquet_dir>/<table>.parquet`` when
+that exists (:func:`export_parquet` writes them). The cleaning steps are
+views on top:
+
+- ``orders_clean``: one row per ``order_id``, the first in file order, like
+  pandas' ``drop_duplicates(keep='first')``
+- ``order_products_clean``: distinct rows
+
+DuckDB reads only the columns a query uses and pushes filters such as
+``reordered = 1`` into the scan. With Parquet sources it also skips row
+groups that the filter rules out. De-duplication and grouping run in
+streaming operators that spill to ``temp_directory`` once
+``memory_limit`` is reached, so the order tables may be several times
+larger than RAM.
+
+Needs duckdb: ``pip install duckdb``.
+"""
+
+import os
+
+import pandas as pd
+
+from instacart.analysis import CART_LIMIT, TOP_N, hour_dow_frame
+from instacart.loader import SCHEMAS, SEP, TABLES, table_path
+
+try:
+    import duckdb
+except ImportError:  # pragma: no cover - optional dependency
+    duckdb = None
+
+# pandas dtype in loader.SCHEMAS -> SQL type
+SQL_TYPES = {
+    'int32': 'INTEGER',
+    'int16': 'SMALLINT',
+    'Int16': 'SMALLINT',
+    'uint8': 'UTINYINT',
+    'float32': 'FLOAT',
+    'category': 'VARCHAR',
+}
+
+CLEAN_VIEWS = {
+    'orders_clean': ('SELECT * EXCLUDE (row_number) FROM '
+                     '(SELECT DISTINCT ON (order_id) * FROM orders_numbered ORDER BY order_id, row_number)'),
+    'order_products_clean': 'SELECT DISTINCT * FROM order_products',
+}
+
+
+def _quote(path):
+    return "'" + str(path).replace("'", "''") + "'"
+
+
+def _typed_columns(table):
+    return ', '.join(f'CAST({column} AS {SQL_TYPES[dtype]}) AS {column}'
+                     for column, dtype in SCHEMAS[table].items())
+
+
+def _csv_scan(table, data_dir, parallel=True):
+    # Nullable integer columns are written as floats ("1.0"), so read them as
+    # DOUBLE and cast afterwards, like the pandas loader does.
+    columns = {column: 'DOUBLE' if dtype == 'Int16' else SQL_TYPES[dtype]
+               for column, dtype in SCHEMAS[table].items()}
+    spec = ', '.join(f"'{column}': '{sql_type}'" for column, sql_type in columns.items())
+    return (f'read_csv({_quote(table_path(table, data_dir))}, delim={_quote(SEP)}, header=true, '
+            f'columns={{{spec}}}, parallel={str(parallel).lower()})')
+
+
+def _scan(table, data_dir, parquet_dir):
+    if parquet_dir is not None:
+        path = os.path.join(parquet_dir, f'{table}.parquet')
+        if os.path.exists(path):
+            return f'read_parquet({_quote(path)})'
+    return _csv_scan(table, data_dir)
+
+
+def _numbered_scan(table, data_dir, parquet_dir):
+    """``_scan`` plus a ``row_number`` column holding the position of each row in its file."""
+    if parquet_dir is not None:
+        path = os.path.join(parquet_dir, f'{table}.parquet')
+        if os.path.exists(path):
+            return (f'(SELECT *, file_row_number AS row_number '
+                    f'FROM read_parquet({_quote(path)}, file_row_number=true))')
+    # preserve_insertion_order is off, so read the csv sequentially to number rows in file order
+    return f'(SELECT *, row_number() OVER () AS row_number FROM {_csv_scan(table, data_dir, parallel=False)})'
+
+
+def connect(data_dir=None, parquet_dir=None, memory_limit=None, temp_directory=None, threads=None,
+            preserve_order=False):
+    """Open a DuckDB connection with a view per table and the cleaned views."""
+    if duckdb is None:
+        raise ImportError('the duckdb backend needs duckdb: pip install duckdb')
+    config = {'preserve_insertion_order': preserve_order}
+    if memory_limit is not None:
+        config['memory_limit'] = memory_limit
+    if temp_directory is not None:
+        config['temp_directory'] = temp_directory
+    if threads is not None:
+        config['threads'] = threads
+    con = duckdb.connect(config=config)
+    for table in TABLES:
+        con.execute(f'CREATE VIEW {table} AS SELECT {_typed_columns(table)} '
+                    f'FROM {_scan(table, data_dir, parquet_dir)}')
+    con.execute(f'CREATE VIEW orders_numbered AS SELECT {_typed_columns("orders")}, row_number '
+                f'FROM {_numbered_scan("orders", data_dir, parquet_dir)}')
+    for view, query in CLEAN_VIEWS.items():
+        con.execute(f'CREATE VIEW {view} AS {query}')
+    return con
+
+
+def export_parquet(data_dir=None, parquet_dir=None, tables=TABLES, row_group_size=1_000_000):
+    """Write each csv table as typed Parquet, for faster scans with pushdown.
+
+    ``parquet_dir`` defaults to ``<data_dir>/parquet``. Returns it.
+    """
+    parquet_dir = parquet_dir or os.path.join(data_dir or '.', 'parquet')
+    os.makedirs(parquet_dir, exist_ok=True)
+    # Rows keep their csv order, which decides the duplicate orders_clean keeps
+    con = connect(data_dir, preserve_order=True)
+    for table in tables:
+        path = os.path.join(parquet_dir, f'{table}.parquet')
+        con.execute(f'COPY (SELECT * FROM {table}) TO {_quote(path)} '
+                    f'(FORMAT parquet, ROW_GROUP_SIZE {row_group_size})')
+    con.close()
+    return parquet_dir
+
+
+def _checks(con):
+    orders = con.execute("""
+        SELECT count(*),
+               count(*) - (SELECT count(*) FROM (SELECT DISTINCT * FROM orders)),
+               count(*) - count(DISTINCT order_id),
+               count(*) FILTER (days_since_prior_order IS NULL),
+               count(*) FILTER (order_hour_of_day > 23),
+               count(*) FILTER (order_dow > 6)
+        FROM orders
+    """).fetchone()
+    lines = con.execute(f"""
+        SELECT count(*),
+               count(*) - (SELECT count(*) FROM (SELECT DISTINCT * FROM order_products)),
+               count(*) FILTER (add_to_cart_order IS NULL),
+               count(*) FILTER (add_to_cart_order > {CART_LIMIT})
+        FROM order_products
+    """).fetchone()
+    checks = ['rows', 'duplicate_rows', 'duplicate_order_id', 'missing_days_since_prior_order',
+              'hour_out_of_range', 'dow_out_of_range']
+    keys = [('orders', c) for c in checks]
+    keys += [('order_products', c) for c in ('rows', 'duplicate_rows', 'missing_add_to_cart_order',
+                                             'add_to_cart_over_limit')]
+    index = pd.MultiIndex.from_tuples(keys, names=['table', 'check'])
+    return pd.Series(list(orders) + list(lines), index=index, name='count', dtype='int64')
+
+
+def _counts(con, query, index, name):
+    frame = con.execute(query).df()
+    return frame.set_index(index)[name]
+
+
+def _top(con, where, count_name):
+    where = f'WHERE {where}' if where else ''
+    return con.execute(f"""
+        SELECT top.product_id, top.n AS {count_name}, products.product_name
+        FROM (SELECT product_id, count(*) AS n FROM order_products_clean {where}
+              GROUP BY product_id ORDER BY n DESC, product_id LIMIT {TOP_N}) AS top
+        LEFT JOIN products USING (product_id)
+        ORDER BY top.n DESC, top.product_id
+    """).df()
+
+
+def _metrics(con, key, source):
+    return con.execute(f"""
+        SELECT {key},
+               count(*) AS items,
+               CAST(sum(reordered) AS BIGINT) AS reorders,
+               sum(reordered) / count(*) AS reorder_proportion,
+               count(*) FILTER (add_to_cart_order = 1) AS first_in_cart,
+               avg(add_to_cart_order) AS mean_cart_position
+        FROM {source}
+        GROUP BY {key} ORDER BY {key}
+    """).df().set_index(key)
+
+
+def _analysis(con, name):
+    if name == 'checks':
+        return _checks(con)
+    if name in ('order_hour_counts', 'order_dow_counts', 'days_counts'):
+        column = {'order_hour_counts': 'order_hour_of_day', 'order_dow_counts': 'order_dow',
+                  'days_counts': 'days_since_prior_order'}[name]
+        return _counts(con, f'SELECT {column}, count(*) AS count FROM orders_clean '
+                            f'WHERE {column} IS NOT NULL GROUP BY 1 ORDER BY 1', column, 'count')
+    if name == 'hour_dow_counts':
+        counts = con.execute('SELECT order_hour_of_day, order_dow, count(*) AS n FROM orders_clean '
+                             'GROUP BY 1, 2').df()
+        return hour_dow_frame(counts['order_hour_of_day'], counts['order_dow'], counts['n'])
+    if name == 'customer_order_counts':
+        return _counts(con, 'SELECT user_id, max(order_number) AS order_number FROM orders_clean '
+                            'GROUP BY 1 ORDER BY 1', 'user_id', 'order_number')
+    if name == 'order_sizes':
+        return _counts(con, 'SELECT order_id, count(*) AS items FROM order_products_clean '
+                            'GROUP BY 1 ORDER BY 1', 'order_id', 'items')
+    if name == 'top_products':
+        return _top(con, None, 'order_count')
+    if name == 'top_reordered':
+        return _top(con, 'reordered = 1', 'reorder_count')
+    if name == 'top_first_added':
+        return _top(con, 'add_to_cart_order = 1', 'first_added_count')
+    if name == 'product_metrics':
+        return _metrics(con, 'product_id', 'order_products_clean')
+    if name == 'user_metrics':
+        return _metrics(con, 'user_id', 'order_products_clean JOIN orders_clean USING (order_id)')
+    raise KeyError(name)
+
+
+def run(names, data_dir=None, **options):
+    """Run the analyses ``names``; ``options`` are passed to :func:`connect`."""
+    con = connect(data_dir, **options)
+    try:
+        return {name: _analysis(con, name) for name in names}
+    finally:
+        con.close()
@@ -0,0 +1,278 @@
+"""Per-user and per-user x product features for reorder modeling.
+
+The notebook computes user-level numbers one at a time
+(``customer_order_counts``, ``reorder_proportion_per_user``) and throws
+them away. :func:`build_features` computes them all in one pass over the
+cleaned ``orders`` and ``order_products``, with ``np.bincount`` over dense
+user ids and over ``(user, product)`` pairs compacted with ``np.unique``:
+
+- users: order count, last order number, mean days between orders, items,
+  reorders, reorder rate, mean basket size, distinct products, and
+  preferred hour and day of week
+- user x product: times bought, reorders, first and last order number the
+  product was bought in, orders since then, and mean cart position
+
+:meth:`UserFeatures.save` writes one folder per user-id range, holding one
+``.npy`` file per column. User rows in a partition are dense, so row
+``user_id - start`` is that user. User x product rows are sorted by user
+and product, and an ``offsets`` array gives each user's slice.
+:class:`FeatureStore` memory-maps a partition the first time it is
+touched. Fetching a user's feature vector is then an index into each
+column, a few microseconds. Build the store from the csv files with::
+
+    python -m instacart.features /tmp/instacart_features --data-dir /path/to/csvs
+"""
+
+import argparse
+import json
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from instacart.cleaning import clean_order_products, clean_orders
+from instacart.joins import OrderIndex
+from instacart.loader import DEFAULT_DATA_DIR, load_table
+
+USER_COLUMNS = {
+    'orders': 'int32',
+    'max_order_number': 'int16',
+    'mean_days_between_orders': 'float32',
+    'items': 'int32',
+    'reorders': 'int32',
+    'reorder_rate': 'float32',
+    'mean_basket_size': 'float32',
+    'distinct_products': 'int32',
+    # Most frequent value, the smallest on ties
+    'preferred_hour': 'int8',
+    'preferred_dow': 'int8',
+}
+
+USER_PRODUCT_COLUMNS = {
+    'product_id': 'int32',
+    'times_bought': 'int32',
+    'reorders': 'int32',
+    'first_order_number': 'int16',
+    'last_order_number': 'int16',
+    'orders_since_last': 'int16',
+    'mean_cart_position': 'float32',
+}
+
+# Users per partition folder
+DEFAULT_PARTITION_USERS = 65_536
+
+
+def _ratio(numerator, denominator):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(denominator > 0, numerator / np.maximum(denominator, 1), np.nan)
+
+
+def _mode(keys, values, levels, size):
+    """Most frequent of ``values`` (0..levels-1) for each key, smallest on ties; -1 if none."""
+    pairs, counts = np.unique(keys.astype(np.int64) * levels + values, return_counts=True)
+    owner, value = pairs // levels, pairs % levels
+    order = np.lexsort((value, -counts, owner))
+    first = order[np.r_[True, owner[order][1:] != owner[order][:-1]]]
+    result = np.full(size, -1, dtype=np.int8)
+    result[owner[first]] = value[first]
+    return result
+
+
+@dataclass
+class UserFeatures:
+    # Indexed by user_id
+    users: pd.DataFrame
+    # Indexed by (user_id, product_id), sorted
+    user_products: pd.DataFrame
+
+    def save(self, path, partition_users=DEFAULT_PARTITION_USERS):
+        """Write the features to folder ``path``, one sub-folder per user-id range."""
+        os.makedirs(path, exist_ok=True)
+        user_ids = self.users.index.to_numpy()
+        pair_users = self.user_products.index.get_level_values('user_id').to_numpy()
+        size = int(user_ids.max()) + 1 if len(user_ids) else 0
+        partitions = []
+        for start in range(0, size, partition_users):
+            stop = min(start + partition_users, size)
+            folder = os.path.join(path, f'users_{start:09d}')
+            os.makedirs(folder, exist_ok=True)
+            # Dense user rows: row i is user start + i
+            rows = slice(*np.searchsorted(user_ids, [start, stop]))
+            present = np.zeros(stop - start, dtype=bool)
+            present[user_ids[rows] - start] = True
+            np.save(os.path.join(folder, 'present.npy'), present)
+            for column, dtype in USER_COLUMNS.items():
+                array = np.full(stop - start, -1 if dtype.startswith('int') else np.nan, dtype=dtype)
+                array[user_ids[rows] - start] = self.users[column].to_numpy()[rows]
+                np.save(os.path.join(folder, f'{column}.npy'), array)
+            # User x product rows of the range, with each user's slice
+            lo, hi = np.searchsorted(pair_users, [start, stop])
+            counts = np.bincount(pair_users[lo:hi] - start, minlength=stop - start)
+            np.save(os.path.join(folder, 'offsets.npy'), np.r_[0, np.cumsum(counts)].astype(np.int64))
+            for column, dtype in USER_PRODUCT_COLUMNS.items():
+                values = (self.user_products.index.get_level_values('product_id')
+                          if column == 'product_id' else self.user_products[column])
+                np.save(os.path.join(folder, f'pair_{column}.npy'),
+                        np.asarray(values[lo:hi], dtype=dtype))
+            partitions.append(start)
+        with open(os.path.join(path, 'features.json'), 'w') as f:
+            json.dump({'partition_users': partition_users, 'size': size, 'partitions': partitions,
+                       'user_columns': list(USER_COLUMNS),
+                       'user_product_columns': list(USER_PRODUCT_COLUMNS)}, f)
+        return path
+
+
+def build_features(orders, order_products):
+    """Compute :class:`UserFeatures` from cleaned ``orders`` and ``order_products``.
+
+    Lines whose order is not in ``orders`` are left out, as with the
+    inner join the notebook uses.
+    """
+    index = OrderIndex.from_orders(orders, ['user_id', 'order_number'])
+    order_users = orders['user_id'].to_numpy()
+    size = int(order_users.max()) + 1 if len(order_users) else 0
+
+    order_counts = np.bincount(order_users, minlength=size)
+    max_order_number = np.zeros(size, dtype=np.int64)
+    np.maximum.at(max_order_number, order_users, orders['order_number'].to_numpy())
+    days = orders['days_since_prior_order'].to_numpy(dtype=np.float64)
+    known = ~np.isnan(days)
+    days_sum = np.bincount(order_users[known], weights=days[known], minlength=size)
+    days_count = np.bincount(order_users[known], minlength=size)
+    hours = _mode(order_users, orders['order_hour_of_day'].to_numpy(), 24, size)
+    dows = _mode(order_users, orders['order_dow'].to_numpy(), 7, size)
+
+    order_ids = order_products['order_id'].to_numpy()
+    matched = index.contains(order_ids)
+    order_ids = order_ids[matched]
+    users = index.lookup(order_ids, 'user_id').astype(np.int64)
+    order_numbers = index.lookup(order_ids, 'order_number')
+    product_ids = order_products['product_id'].to_numpy()[matched]
+    reordered = order_products['reordered'].to_numpy()[matched].astype(np.int64)
+    cart = order_products['add_to_cart_order'].to_numpy(dtype=np.float64, na_value=np.nan)[matched]
+
+    items = np.bincount(users, minlength=size)
+    reorders = np.bincount(users, weights=reordered, minlength=size).astype(np.int64)
+    baskets = np.bincount(index.lookup(np.unique(order_ids), 'user_id'), minlength=size)
+
+    # (user, product) pairs compacted to consecutive codes
+    width = int(product_ids.max()) + 1 if len(product_ids) else 1
+    pairs, codes = np.unique(users * width + product_ids, return_inverse=True)
+    pair_users = pairs // width
+    first_order = np.full(len(pairs), np.iinfo(np.int16).max, dtype=np.int16)
+    np.minimum.at(first_order, codes, order_numbers)
+    last_order = np.zeros(len(pairs), dtype=np.int16)
+    np.maximum.at(last_order, codes, order_numbers)
+    known = ~np.isnan(cart)
+    distinct = np.bincount(pair_users, minlength=size)
+
+    present = np.flatnonzero(order_counts)
+    users_frame = pd.DataFrame({
+        'orders': order_counts[present],
+        'max_order_number': max_order_number[present],
+        'mean_days_between_orders': _ratio(days_sum, days_count)[present],
+        'items': items[present],
+        'reorders': reorders[present],
+        'reorder_rate': _ratio(reorders, items)[present],
+        'mean_basket_size': _ratio(items, baskets)[present],
+        'distinct_products': distinct[present],
+        'preferred_hour': hours[present],
+        'preferred_dow': dows[present],
+    }, index=pd.Index(present, name='user_id')).astype(USER_COLUMNS)
+
+    user_products = pd.DataFrame({
+        'times_bought': np.bincount(codes, minlength=len(pairs)),
+        'reorders': np.bincount(codes, weights=reordered, minlength=len(pairs)),
+        'first_order_number': first_order,
+        'last_order_number': last_order,
+        'orders_since_last': max_order_number[pair_users] - last_order,
+        'mean_cart_position': _ratio(np.bincount(codes[known], weights=cart[known], minlength=len(pairs)),
+                                     np.bincount(codes[known], minlength=len(pairs))),
+    }, index=pd.MultiIndex.from_arrays([pair_users, pairs % width], names=['user_id', 'product_id']))
+    user_products = user_products.astype({c: d for c, d in USER_PRODUCT_COLUMNS.items()
+                                          if c != 'product_id'})
+    return UserFeatures(users_frame, user_products)
+
+
+class FeatureStore:
+    """Read access to features written by :meth:`UserFeatures.save`."""
+
+    def __init__(self, path, mmap_mode='r'):
+        self.path = path
+        self.mmap_mode = mmap_mode
+        with open(os.path.join(path, 'features.json')) as f:
+            self.meta = json.load(f)
+        self.partition_users = self.meta['partition_users']
+        self.user_columns = self.meta['user_columns']
+        self.user_product_columns = self.meta['user_product_columns']
+        self._partitions = {}
+
+    def _partition(self, user_id):
+        start = user_id - user_id % self.partition_users
+        partition = self._partitions.get(start)
+        if partition is None:
+            folder = os.path.join(self.path, f'users_{start:09d}')
+            names = (['present', 'offsets'] + self.user_columns
+                     + [f'pair_{c}' for c in self.user_product_columns])
+            partition = {name: np.load(os.path.join(folder, f'{name}.npy'), mmap_mode=self.mmap_mode)
+                         for name in names}
+            self._partitions[start] = partition
+        return partition, user_id - start
+
+    def __contains__(self, user_id):
+        if not 0 <= user_id < self.meta['size']:
+            return False
+        partition, row = self._partition(user_id)
+        return bool(partition['present'][row])
+
+    def _check(self, user_id):
+        if user_id not in self:
+            raise KeyError(user_id)
+        return self._partition(user_id)
+
+    def user(self, user_id):
+        """Dict of the user features of ``user_id``."""
+        partition, row = self._check(user_id)
+        return {column: partition[column][row].item() for column in self.user_columns}
+
+    def user_vector(self, user_id):
+        """User features of ``user_id`` as a float64 array, in :data:`USER_COLUMNS` order."""
+        partition, row = self._check(user_id)
+        return np.array([partition[column][row] for column in self.user_columns], dtype=np.float64)
+
+    def user_products(self, user_id):
+        """DataFrame of the user x product features of ``user_id``, indexed by product_id."""
+        partition, row = self._check(user_id)
+        lo, hi = partition['offsets'][row], partition['offsets'][row + 1]
+        frame = pd.DataFrame({column: np.asarray(partition[f'pair_{column}'][lo:hi])
+                              for column in self.user_product_columns})
+        return frame.set_index('product_id')
+
+    def user_product(self, user_id, product_id):
+        """Dict of the features of one ``(user_id, product_id)`` pair."""
+        partition, row = self._check(user_id)
+        lo, hi = partition['offsets'][row], partition['offsets'][row + 1]
+        products = partition['pair_product_id']
+        at = lo + int(np.searchsorted(products[lo:hi], product_id))
+        if at == hi or products[at] != product_id:
+            raise KeyError((user_id, product_id))
+        return {column: partition[f'pair_{column}'][at].item() for column in self.user_product_columns}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the user feature store from the csv files.')
+    parser.add_argument('out_dir')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--partition-users', type=int, default=DEFAULT_PARTITION_USERS)
+    args = parser.parse_args(argv)
+    orders = clean_orders(load_table('orders', args.data_dir))
+    order_products = clean_order_products(load_table('order_products', args.data_dir))
+    features = build_features(orders, order_products)
+    features.save(args.out_dir, args.partition_users)
+    print(f'{len(features.users):,} users and {len(features.user_products):,} user x product rows '
+          f'written to {args.out_dir}')
+
+
+if __name__ == '__main__':
+    main()
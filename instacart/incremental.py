@@ -0,0 +1,343 @@
+"""Append-only ingestion of new orders with aggregates maintained by deltas.
+
+Every metric in the notebook (hour/day/days-since distributions, orders per
+customer, product and user reorder proportions) is recomputed from the full
+history. :class:`IncrementalAggregates` keeps only what those metrics are
+built from:
+
+- counts and sums per hour, day, product and user
+- the highest ``order_number`` per user
+- the key indexes needed to de-duplicate new rows
+
+A new batch is de-duplicated against those indexes and folded in. The cost
+depends on the batch, not the history. The key index of order lines is a
+set of sorted runs merged like a binary counter, so a lookup is a
+``searchsorted`` per run and each key is rewritten O(log n) times overall.
+:meth:`IncrementalAggregates.save` writes only the runs created since the
+last save to the same folder.
+
+The results match :func:`full_recompute`, i.e. running the cleaning steps
+and the aggregations over everything ingested so far. :func:`verify`
+checks exactly that.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from instacart.aggregates import bincount_sums, metrics_frame, reorder_metrics
+from instacart.cleaning import clean_order_products, clean_orders
+from instacart.joins import grow_array
+
+_SUM_NAMES = ('items', 'reorders', 'first_in_cart', 'cart_sum', 'cart_count')
+
+# Bit layout of an order line key: order_id | product_id | cart position + 1 | reordered
+_PRODUCT_BITS = 17
+_CART_BITS = 8
+
+
+def line_keys(order_products):
+    """Pack full ``order_products`` rows into ``int64`` keys.
+
+    Two rows get the same key exactly when all four columns are equal, which
+    is what ``drop_duplicates()`` compares.
+    """
+    order_id = order_products['order_id'].to_numpy().astype(np.int64)
+    product_id = order_products['product_id'].to_numpy().astype(np.int64)
+    cart = order_products['add_to_cart_order'].to_numpy(dtype=np.float64, na_value=-1)
+    cart = cart.astype(np.int64) + 1
+    reordered = order_products['reordered'].to_numpy().astype(np.int64)
+    if len(order_id) and (product_id.max() >= 1 << _PRODUCT_BITS or cart.max() >= 1 << _CART_BITS
+                          or order_id.max() >= 1 << (62 - _PRODUCT_BITS - _CART_BITS)
+                          or reordered.max() > 1 or min(order_id.min(), product_id.min()) < 0):
+        raise ValueError('order_products values are outside the range the line key can encode')
+    key = order_id << (_PRODUCT_BITS + _CART_BITS + 1)
+    key |= product_id << (_CART_BITS + 1)
+    key |= cart << 1
+    return key | reordered
+
+
+class SortedKeySet:
+    """Set of ``int64`` keys stored as a few sorted runs."""
+
+    def __init__(self, runs=None, files=None, folder=None):
+        self.runs = list(runs or [])
+        # File in ``folder`` holding each run, None for runs not saved there yet
+        self.files = list(files) if files is not None else [None] * len(self.runs)
+        self.folder = folder
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs)
+
+    def contains(self, keys):
+        found = np.zeros(len(keys), dtype=bool)
+        for run in self.runs:
+            position = np.searchsorted(run, keys)
+            inside = position < len(run)
+            found[inside] |= run[position[inside]] == keys[inside]
+        return found
+
+    def add(self, keys):
+        """Add ``keys``, which must be unique and not already in the set."""
+        if len(keys) == 0:
+            return
+        self.runs.append(np.sort(keys))
+        self.files.append(None)
+        # Merge the newest runs while they are of similar size, so there are
+        # only O(log n) runs and every key is merged O(log n) times.
+        while len(self.runs) >= 2 and len(self.runs[-2]) <= 2 * len(self.runs[-1]):
+            newest = self.runs.pop()
+            merged = np.concatenate([self.runs.pop(), newest])
+            merged.sort(kind='mergesort')
+            del self.files[-2:]
+            self.runs.append(merged)
+            self.files.append(None)
+
+    def save(self, folder, prefix='lines_'):
+        """Write the runs not yet in ``folder`` and delete the files of merged-away runs.
+
+        Returns the file name of every run. Runs already saved there are
+        left in place, so a save costs the keys added or merged since the
+        last one.
+        """
+        folder = os.path.abspath(folder)
+        if folder != self.folder:
+            self.files = [None] * len(self.runs)
+        existing = {name for name in os.listdir(folder) if name.startswith(prefix)}
+        number = 0
+        for i, run in enumerate(self.runs):
+            if self.files[i] is None:
+                while f'{prefix}{number}.npy' in existing:
+                    number += 1
+                self.files[i] = f'{prefix}{number}.npy'
+                existing.add(self.files[i])
+                np.save(os.path.join(folder, self.files[i]), run)
+        self.folder = folder
+        return list(self.files)
+
+    def prune(self, prefix='lines_'):
+        """Delete the run files in the saved folder that no run uses any more."""
+        for name in set(os.listdir(self.folder)) - set(self.files):
+            if name.startswith(prefix):
+                os.remove(os.path.join(self.folder, name))
+
+    @classmethod
+    def load(cls, folder, files):
+        """Read the run ``files`` written to ``folder`` by :meth:`save`."""
+        return cls([np.load(os.path.join(folder, name)) for name in files], files, os.path.abspath(folder))
+
+
+class _KeyedSums:
+    """Growable per-key sums in the layout of :func:`bincount_sums`."""
+
+    def __init__(self, sums=None):
+        self.sums = sums or {name: np.zeros(0, dtype=np.float64 if name == 'cart_sum' else np.int64)
+                             for name in _SUM_NAMES}
+
+    def add(self, keys, reordered, cart):
+        if len(keys) == 0:
+            return
+        size = int(keys.max()) + 1
+        delta = bincount_sums(keys.astype(np.intp), reordered, cart, size)
+        for name in _SUM_NAMES:
+            self.sums[name] = grow_array(self.sums[name], size)
+            self.sums[name][:size] += delta[name]
+
+    def frame(self, name):
+        return metrics_frame(self.sums, name)
+
+
+class IncrementalAggregates:
+    """Notebook aggregates kept up to date one batch at a time."""
+
+    def __init__(self):
+        self.order_seen = np.zeros(0, dtype=bool)
+        self.order_user = np.zeros(0, dtype=np.int32)
+        self.hour_counts = np.zeros(24, dtype=np.int64)
+        self.dow_counts = np.zeros(7, dtype=np.int64)
+        # Days since prior order 0..30, slot 31 for missing
+        self.days_counts = np.zeros(32, dtype=np.int64)
+        self.user_max_order = np.zeros(0, dtype=np.int64)
+        self.lines = SortedKeySet()
+        self.products = _KeyedSums()
+        self.users = _KeyedSums()
+        # Order lines whose order has not arrived yet
+        self.pending = pd.DataFrame({'order_id': np.zeros(0, np.int64), 'reordered': np.zeros(0, np.int64),
+                                     'add_to_cart_order': pd.array([], dtype='Float64')})
+
+    def ingest(self, orders=None, order_products=None):
+        """Fold a batch of new ``orders`` and/or ``order_products`` rows in.
+
+        Rows already seen (same ``order_id`` for orders, identical rows for
+        order lines) are skipped, as the cleaning steps would drop them.
+        Returns the number of new ``(orders, order_products)`` rows kept.
+        """
+        kept_orders = self._ingest_orders(orders) if orders is not None else 0
+        kept_lines = self._ingest_lines(order_products) if order_products is not None else 0
+        if kept_orders and len(self.pending):
+            self._resolve_pending()
+        return kept_orders, kept_lines
+
+    def _ingest_orders(self, orders):
+        order_ids = orders['order_id'].to_numpy().astype(np.int64)
+        if len(order_ids) == 0:
+            return 0
+        # First row per order_id within the batch, and only ids never seen
+        fresh = ~pd.Series(order_ids).duplicated().to_numpy()
+        self.order_seen = grow_array(self.order_seen, int(order_ids.max()) + 1, False)
+        fresh &= ~self.order_seen[order_ids]
+        new = orders[fresh]
+        order_ids = order_ids[fresh]
+        if len(new) == 0:
+            return 0
+
+        users = new['user_id'].to_numpy().astype(np.int64)
+        self.order_seen[order_ids] = True
+        self.order_user = grow_array(self.order_user, len(self.order_seen), -1)
+        self.order_user[order_ids] = users
+
+        self.hour_counts += np.bincount(new['order_hour_of_day'].to_numpy(), minlength=24)
+        self.dow_counts += np.bincount(new['order_dow'].to_numpy(), minlength=7)
+        days = new['days_since_prior_order'].to_numpy(dtype=np.float64)
+        days = np.where(np.isnan(days), 31, np.nan_to_num(days)).astype(np.intp)
+        self.days_counts += np.bincount(days, minlength=32)
+
+        self.user_max_order = grow_array(self.user_max_order, int(users.max()) + 1)
+        np.maximum.at(self.user_max_order, users, new['order_number'].to_numpy().astype(np.int64))
+        return len(new)
+
+    def _ingest_lines(self, order_products):
+        keys = line_keys(order_products)
+        if len(keys) == 0:
+            return 0
+        _, first = np.unique(keys, return_index=True)
+        fresh = np.zeros(len(keys), dtype=bool)
+        fresh[first] = True
+        fresh &= ~self.lines.contains(keys)
+        new = order_products[fresh]
+        if len(new) == 0:
+            return 0
+        self.lines.add(keys[fresh])
+
+        reordered = new['reordered'].to_numpy().astype(np.int64)
+        cart = pd.array(new['add_to_cart_order'], dtype='Float64')
+        self.products.add(new['product_id'].to_numpy().astype(np.int64), reordered, cart)
+
+        order_ids = new['order_id'].to_numpy().astype(np.int64)
+        users = self._users_of(order_ids)
+        known = users >= 0
+        self.users.add(users[known], reordered[known], cart[known])
+        if not known.all():
+            waiting = pd.DataFrame({'order_id': order_ids[~known], 'reordered': reordered[~known],
+                                    'add_to_cart_order': cart[~known]})
+            self.pending = pd.concat([self.pending, waiting], ignore_index=True)
+        return len(new)
+
+    def _users_of(self, order_ids):
+        users = np.full(len(order_ids), -1, dtype=np.int64)
+        inside = order_ids < len(self.order_user)
+        users[inside] = self.order_user[order_ids[inside]]
+        return users
+
+    def _resolve_pending(self):
+        order_ids = self.pending['order_id'].to_numpy()
+        users = self._users_of(order_ids)
+        known = users >= 0
+        if known.any():
+            ready = self.pending[known]
+            self.users.add(users[known], ready['reordered'].to_numpy(), ready['add_to_cart_order'].array)
+            self.pending = self.pending[~known].reset_index(drop=True)
+
+    def results(self):
+        """The aggregates, shaped like :func:`full_recompute`'s output."""
+        return _results(self.hour_counts, self.dow_counts, self.days_counts, self.user_max_order,
+                        self.products.frame('product_id'), self.users.frame('user_id'))
+
+    def save(self, path):
+        """Persist the state to folder ``path``."""
+        os.makedirs(path, exist_ok=True)
+        arrays = {
+            'order_seen': self.order_seen, 'order_user': self.order_user,
+            'hour_counts': self.hour_counts, 'dow_counts': self.dow_counts,
+            'days_counts': self.days_counts, 'user_max_order': self.user_max_order,
+            'pending_order_id': self.pending['order_id'].to_numpy(),
+            'pending_reordered': self.pending['reordered'].to_numpy(),
+            'pending_cart': self.pending['add_to_cart_order'].to_numpy(dtype=np.float64, na_value=np.nan),
+        }
+        for prefix, sums in (('product', self.products), ('user', self.users)):
+            arrays.update({f'{prefix}_{name}': array for name, array in sums.sums.items()})
+        np.savez(os.path.join(path, 'state.npz'), **arrays)
+        # Only new line runs are written; state.json names the current ones,
+        # and the files of runs merged away are deleted once it is in place
+        files = self.lines.save(path)
+        with open(os.path.join(path, 'state.json.tmp'), 'w') as f:
+            json.dump({'line_files': files}, f)
+        os.replace(os.path.join(path, 'state.json.tmp'), os.path.join(path, 'state.json'))
+        self.lines.prune()
+
+    @classmethod
+    def load(cls, path):
+        """Read a state written by :meth:`save`."""
+        with open(os.path.join(path, 'state.json')) as f:
+            meta = json.load(f)
+        state = cls()
+        with np.load(os.path.join(path, 'state.npz')) as arrays:
+            for name in ('order_seen', 'order_user', 'hour_counts', 'dow_counts', 'days_counts',
+                         'user_max_order'):
+                setattr(state, name, arrays[name])
+            state.pending = pd.DataFrame({
+                'order_id': arrays['pending_order_id'], 'reordered': arrays['pending_reordered'],
+                'add_to_cart_order': pd.array(arrays['pending_cart'], dtype='Float64'),
+            })
+            state.products = _KeyedSums({n: arrays[f'product_{n}'] for n in _SUM_NAMES})
+            state.users = _KeyedSums({n: arrays[f'user_{n}'] for n in _SUM_NAMES})
+        state.lines = SortedKeySet.load(path, meta['line_files'])
+        return state
+
+
+def _results(hours, dows, days, user_max, product_metrics, user_metrics):
+    def counts(array, name, index_dtype=np.int64):
+        present = np.flatnonzero(array)
+        return pd.Series(array[present], index=pd.Index(present.astype(index_dtype), name=name),
+                         name='count')
+
+    users = np.flatnonzero(user_max)
+    return {
+        'order_hour_counts': counts(hours, 'order_hour_of_day'),
+        'order_dow_counts': counts(dows, 'order_dow'),
+        'days_counts': counts(days[:31], 'days_since_prior_order', np.float64),
+        'customer_order_counts': pd.Series(user_max[users], index=pd.Index(users, name='user_id'),
+                                           name='order_number'),
+        'product_metrics': product_metrics,
+        'user_metrics': user_metrics,
+    }
+
+
+def full_recompute(orders, order_products):
+    """The same aggregates computed from scratch over the cleaned tables."""
+    orders = clean_orders(orders)
+    order_products = clean_order_products(order_products)
+    return {
+        'order_hour_counts': orders['order_hour_of_day'].value_counts().sort_index(),
+        'order_dow_counts': orders['order_dow'].value_counts().sort_index(),
+        'days_counts': orders['days_since_prior_order'].value_counts().sort_index(),
+        'customer_order_counts': orders.groupby('user_id')['order_number'].max(),
+        'product_metrics': reorder_metrics(order_products, 'product_id'),
+        'user_metrics': reorder_metrics(order_products, 'user_id', orders=orders),
+    }
+
+
+def verify(state, orders, order_products):
+    """Raise ``AssertionError`` unless ``state`` matches a full recompute of the given tables."""
+    expected = full_recompute(orders, order_products)
+    actual = state.results()
+    for name, value in expected.items():
+        compare = pd.testing.assert_frame_equal if isinstance(value, pd.DataFrame) \
+            else pd.testing.assert_series_equal
+        try:
+            compare(actual[name], value, check_dtype=False, check_names=False,
+                    check_index_type=False)
+        except AssertionError as error:
+            raise AssertionError(f'{name} differs from a full recompute: {error}') from None
@@ -0,0 +1,169 @@
+"""Join-free access to order attributes from ``order_products`` rows.
+
+Per-user metrics in the notebook start with
+``order_products.merge(orders[['order_id', 'user_id']], on='order_id')``.
+That hash join builds a second copy of the 32M-row table every time.
+Order ids are small positive integers, so the whole ``orders`` table can be
+laid out as dense arrays indexed by ``order_id``. Fetching the user (or day,
+hour, days since prior order) of any row is then a single ``np.take``.
+
+:class:`OrderIndex` holds those arrays and can be saved to and
+memory-mapped from a folder of ``.npy`` files. :func:`build_fact_table`
+uses it to denormalize ``order_products`` once, so later user- and
+time-level metrics need no join at all.
+"""
+
+import json
+import os
+
+import numpy as np
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # pragma: no cover - optional dependency
+    feather = None
+
+# Columns carried by the index, with the value used for ids that have no order
+INDEX_COLUMNS = {
+    'user_id': ('int32', -1),
+    'order_number': ('int16', -1),
+    'order_dow': ('uint8', 255),
+    'order_hour_of_day': ('uint8', 255),
+    'days_since_prior_order': ('float32', np.nan),
+}
+
+FACT_COLUMNS = ('user_id', 'order_dow', 'order_hour_of_day', 'days_since_prior_order')
+
+
+def grow_array(array, size, fill=0):
+    """``array`` extended with ``fill`` to at least ``size`` slots, doubling to amortize growth."""
+    if size <= len(array):
+        return array
+    grown = np.full(max(size, 2 * len(array)), fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class OrderIndex:
+    """Dense arrays of order attributes, position ``i`` holding order id ``i``."""
+
+    def __init__(self, columns, present):
+        self.columns = columns
+        # present[i] is True when order id i exists
+        self.present = present
+
+    @classmethod
+    def from_orders(cls, orders, columns=tuple(INDEX_COLUMNS)):
+        """Build the index from an ``orders`` frame.
+
+        When an ``order_id`` appears more than once the first row wins, as
+        with ``drop_duplicates(subset=['order_id'])``.
+        """
+        # Reverse so that the first occurrence is the last one written
+        order_ids = orders['order_id'].to_numpy()[::-1]
+        size = int(order_ids.max()) + 1 if len(order_ids) else 0
+        present = np.zeros(size, dtype=bool)
+        present[order_ids] = True
+        arrays = {}
+        for column in columns:
+            dtype, missing = INDEX_COLUMNS[column]
+            array = np.full(size, missing, dtype=dtype)
+            values = orders[column].to_numpy(dtype=dtype, na_value=missing)
+            array[order_ids] = values[::-1]
+            arrays[column] = array
+        return cls(arrays, present)
+
+    def __len__(self):
+        return int(self.present.sum())
+
+    @property
+    def max_order_id(self):
+        return len(self.present) - 1
+
+    def contains(self, order_ids):
+        """Boolean mask of which ``order_ids`` are in the index."""
+        order_ids = np.asarray(order_ids)
+        inside = (order_ids >= 0) & (order_ids < len(self.present))
+        mask = np.zeros(len(order_ids), dtype=bool)
+        mask[inside] = self.present[order_ids[inside]]
+        return mask
+
+    def lookup(self, order_ids, column):
+        """Return ``column`` for each of ``order_ids`` (missing value for unknown ids)."""
+        order_ids = np.asarray(order_ids)
+        array = self.columns[column]
+        inside = (order_ids >= 0) & (order_ids < len(array))
+        if inside.all():
+            return array.take(order_ids)
+        out = np.full(len(order_ids), INDEX_COLUMNS[column][1], dtype=array.dtype)
+        out[inside] = array.take(order_ids[inside])
+        return out
+
+    def save(self, path):
+        """Write the index to folder ``path`` as one ``.npy`` file per column."""
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'present.npy'), self.present)
+        for column, array in self.columns.items():
+            np.save(os.path.join(path, f'{column}.npy'), array)
+        with open(os.path.join(path, 'index.json'), 'w') as f:
+            json.dump({'columns': list(self.columns), 'size': len(self.present)}, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Open an index written by :meth:`save`, memory-mapped by default."""
+        with open(os.path.join(path, 'index.json')) as f:
+            meta = json.load(f)
+        present = np.load(os.path.join(path, 'present.npy'), mmap_mode=mmap_mode)
+        columns = {c: np.load(os.path.join(path, f'{c}.npy'), mmap_mode=mmap_mode)
+                   for c in meta['columns']}
+        return cls(columns, present)
+
+
+def attach_order_columns(order_products, index, columns=('user_id',), drop_unmatched=True):
+    """Return ``order_products`` with order attributes added as new columns.
+
+    This replaces ``order_products.merge(orders[['order_id', ...]], on='order_id')``.
+    With ``drop_unmatched`` rows whose order is not in ``index`` are removed,
+    like the inner join they replace.
+    """
+    order_ids = order_products['order_id'].to_numpy()
+    result = order_products.copy(deep=False)
+    for column in columns:
+        result[column] = index.lookup(order_ids, column)
+    if drop_unmatched:
+        matched = index.contains(order_ids)
+        if not matched.all():
+            result = result[matched]
+    return result
+
+
+def build_fact_table(order_products, orders, columns=FACT_COLUMNS, path=None):
+    """Denormalize ``order_products`` with the order attributes in ``columns``.
+
+    ``orders`` may be the orders frame or an :class:`OrderIndex`. When
+    ``path`` is given the fact table is also written there as an
+    uncompressed Feather file, ready to be memory-mapped by
+    :func:`load_fact_table`.
+    """
+    index = orders if isinstance(orders, OrderIndex) else OrderIndex.from_orders(orders, columns)
+    fact = attach_order_columns(order_products, index, columns).reset_index(drop=True)
+    if path is not None:
+        if feather is None:
+            raise ImportError('Saving the fact table needs pyarrow: pip install pyarrow')
+        feather.write_feather(fact, path, compression='uncompressed')
+    return fact
+
+
+def load_fact_table(path, memory_map=True):
+    """Read a fact table written by :func:`build_fact_table`."""
+    if feather is None:
+        raise ImportError('Reading the fact table needs pyarrow: pip install pyarrow')
+    return feather.read_table(path, memory_map=memory_map).to_pandas(split_blocks=True)
+
+
+def user_ids(order_products, index):
+    """Return the ``user_id`` of every ``order_products`` row as an array."""
+    if 'user_id' in order_products:
+        return order_products['user_id'].to_numpy()
+    return index.lookup(order_products['order_id'].to_numpy(), 'user_id')
+
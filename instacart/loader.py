@@ -0,0 +1,185 @@
+"""Typed loading of the five Instacart tables.
+
+The raw files are semicolon separated. Reading them with plain
+``pd.read_csv`` gives int64/float64/object columns everywhere, which roughly
+triples the resident size of ``order_products``. The schemas below pin every
+column to the smallest dtype that holds the real data:
+
+- ids are ``int32`` (aisle and department ids fit in ``int16``)
+- ``order_dow`` and ``order_hour_of_day`` are ``uint8``
+- names are ``category`` so each distinct string is stored once
+- ``add_to_cart_order`` is a nullable ``Int16`` because it has missing values
+
+Tables can be read in one go or streamed in chunks, and ``load_tables``
+reports the peak memory each table needed while it was being parsed.
+"""
+
+import os
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Folder holding the raw csv files; override with INSTACART_DATA_DIR
+DEFAULT_DATA_DIR = os.environ.get('INSTACART_DATA_DIR', 'C:/Users/kwame/Downloads')
+
+SEP = ';'
+
+# File name of each table inside the data folder
+TABLE_FILES = {
+    'orders': 'instacart_orders.csv',
+    'order_products': 'order_products.csv',
+    'products': 'products.csv',
+    'aisles': 'aisles.csv',
+    'departments': 'departments.csv',
+}
+
+# Compact dtype for every column of every table
+SCHEMAS = {
+    'orders': {
+        'order_id': 'int32',
+        'user_id': 'int32',
+        'order_number': 'int16',
+        'order_dow': 'uint8',
+        'order_hour_of_day': 'uint8',
+        # Missing for a customer's first order, so it stays a float
+        'days_since_prior_order': 'float32',
+    },
+    'order_products': {
+        'order_id': 'int32',
+        'product_id': 'int32',
+        'add_to_cart_order': 'Int16',
+        'reordered': 'uint8',
+    },
+    'products': {
+        'product_id': 'int32',
+        'product_name': 'category',
+        'aisle_id': 'Int16',
+        'department_id': 'Int16',
+    },
+    'aisles': {
+        'aisle_id': 'int16',
+        'aisle': 'category',
+    },
+    'departments': {
+        'department_id': 'int16',
+        'department': 'category',
+    },
+}
+
+TABLES = tuple(TABLE_FILES)
+
+
+@dataclass
+class LoadStats:
+    """Size and cost of loading one table."""
+
+    table: str
+    rows: int
+    # Bytes held by the finished DataFrame
+    resident_bytes: int
+    # Highest number of bytes allocated at any point while parsing
+    peak_bytes: int
+    seconds: float
+
+
+def table_path(name, data_dir=None):
+    """Return the path of the csv file behind table ``name``."""
+    if name not in TABLE_FILES:
+        raise KeyError(f"Unknown table {name!r}; expected one of {', '.join(TABLES)}")
+    return os.path.join(data_dir or DEFAULT_DATA_DIR, TABLE_FILES[name])
+
+
+def _is_nullable_int(dtype):
+    return isinstance(dtype, str) and dtype.startswith(('Int', 'UInt'))
+
+
+def _to_schema(frame, schema):
+    # Nullable integers are parsed as floats (the C parser's fast path) and
+    # converted afterwards; asking the parser for Int16 directly is ~2x slower.
+    for column, dtype in schema.items():
+        if _is_nullable_int(dtype) and column in frame:
+            frame[column] = frame[column].astype(dtype)
+    return frame
+
+
+def _read_csv(name, path, chunksize=None, **kwargs):
+    schema = SCHEMAS[name]
+    parse_dtypes = {c: 'float64' if _is_nullable_int(d) else d for c, d in schema.items()}
+    result = pd.read_csv(path, sep=SEP, dtype=parse_dtypes, chunksize=chunksize, **kwargs)
+    if chunksize is None:
+        return _to_schema(result, schema)
+    return result
+
+
+def iter_table(name, data_dir=None, chunksize=1_000_000, path=None):
+    """Yield table ``name`` as typed DataFrames of at most ``chunksize`` rows.
+
+    Only one chunk is held in memory at a time, so this is the way to scan
+    ``order_products`` when the whole table does not need to be resident.
+    """
+    path = path or table_path(name, data_dir)
+    schema = SCHEMAS[name]
+    with _read_csv(name, path, chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield _to_schema(chunk, schema)
+
+
+def _concat_chunks(chunks):
+    # Categorical columns only survive pd.concat when every chunk has the same
+    # categories, so union them explicitly before concatenating.
+    if len(chunks) == 1:
+        return chunks[0]
+    frame = pd.concat(chunks, ignore_index=True)
+    for column in chunks[0].columns:
+        if isinstance(chunks[0][column].dtype, pd.CategoricalDtype):
+            frame[column] = union_categoricals([chunk[column] for chunk in chunks])
+    return frame
+
+
+def load_table(name, data_dir=None, chunksize=None, path=None):
+    """Read table ``name`` with its compact schema.
+
+    With ``chunksize`` set the file is parsed in pieces and concatenated,
+    which keeps the parser's own buffers small on very large files.
+    """
+    path = path or table_path(name, data_dir)
+    if chunksize is None:
+        return _read_csv(name, path)
+    chunks = list(iter_table(name, chunksize=chunksize, path=path))
+    if not chunks:
+        return _read_csv(name, path, nrows=0)
+    return _concat_chunks(chunks)
+
+
+def memory_usage(frame):
+    """Return the number of bytes held by ``frame`` including string data."""
+    return int(frame.memory_usage(deep=True).sum())
+
+
+def load_tables(data_dir=None, tables=TABLES, chunksize=None, track_memory=True):
+    """Load several tables and report what each one cost.
+
+    Returns ``(frames, report)`` where ``frames`` maps table names to
+    DataFrames and ``report`` has one row of :class:`LoadStats` per table.
+    Peak memory is measured with ``tracemalloc``; pass
+    ``track_memory=False`` to skip it when only the frames are needed.
+    """
+    frames = {}
+    stats = []
+    for name in tables:
+        if track_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        frame = load_table(name, data_dir, chunksize=chunksize)
+        seconds = time.perf_counter() - start
+        peak = 0
+        if track_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        frames[name] = frame
+        stats.append(LoadStats(name, len(frame), memory_usage(frame), peak, seconds))
+    report = pd.DataFrame([asdict(s) for s in stats])
+    return frames, report
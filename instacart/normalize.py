@@ -0,0 +1,83 @@
+"""Whitespace normalization that only touches text columns.
+
+The notebook strips whitespace with ``order_products.map(lambda x: ...)``,
+which calls a Python function for every cell of the table, numeric or not,
+and builds an object copy of the whole frame. Here numeric columns are left
+alone, and text columns are stripped once per distinct value. Categorical
+columns are handled through their categories; plain string columns are
+factorized first. The stripped values are then taken back out by code,
+which is a vectorized gather.
+"""
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_object_dtype, is_string_dtype
+
+
+def is_text_column(series):
+    """Return True for categorical, string and object columns."""
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        return True
+    return is_string_dtype(dtype) or is_object_dtype(dtype)
+
+
+def _strip_categorical(series):
+    categories = series.cat.categories
+    if not (is_string_dtype(categories.dtype) or is_object_dtype(categories.dtype)):
+        return series
+    stripped = categories.str.strip()
+    if stripped.equals(categories):
+        return series
+    if stripped.is_unique:
+        return series.cat.rename_categories(stripped)
+    # Some categories only differed by whitespace; merge them
+    mapping, uniques = pd.factorize(stripped)
+    codes = series.cat.codes.to_numpy()
+    merged_codes = mapping[codes]
+    merged_codes[codes < 0] = -1
+    merged = pd.Categorical.from_codes(merged_codes, uniques)
+    return pd.Series(merged, index=series.index, name=series.name)
+
+
+def _strip_text(series):
+    codes, uniques = pd.factorize(series)
+    if len(uniques) == 0:
+        return series
+    if uniques.inferred_type == 'string':
+        stripped = uniques.str.strip()
+    else:
+        # Mixed object column: non-string values are kept as they are
+        stripped = pd.Index([v.strip() if isinstance(v, str) else v for v in uniques],
+                            dtype=uniques.dtype)
+    if stripped.equals(uniques):
+        return series
+    values = stripped.take(codes, allow_fill=True, fill_value=np.nan)
+    return pd.Series(values, index=series.index, name=series.name, dtype=series.dtype)
+
+
+def strip_column(series):
+    """Return ``series`` with leading/trailing whitespace removed from its text."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return _strip_categorical(series)
+    if is_text_column(series):
+        return _strip_text(series)
+    return series
+
+
+def strip_whitespace(frame, inplace=False):
+    """Strip whitespace from every text column of ``frame``.
+
+    Numeric columns are never copied. With ``inplace=True`` the changed
+    columns are replaced on ``frame`` itself; otherwise a shallow copy is
+    returned, sharing the untouched columns with ``frame``.
+    """
+    result = frame if inplace else frame.copy(deep=False)
+    for column in frame.columns:
+        series = frame[column]
+        if not is_text_column(series):
+            continue
+        stripped = strip_column(series)
+        if stripped is not series:
+            result[column] = stripped
+    return result
@@ -0,0 +1,245 @@
+"""Partitioned multi-process execution of the cleaning and aggregation steps.
+
+Every groupby in the notebook is keyed by ``order_id``, ``product_id`` or
+``user_id``. Once ``orders`` and ``order_products`` are hash-partitioned by
+``order_id``, each shard holds complete orders together with all of their
+products. Duplicate orders and duplicate order lines can then be dropped
+inside the shard, the user of every line found locally, and per-key counts
+accumulated into small dense arrays. Summing (or taking the maximum of)
+those arrays across shards gives the same totals as one big run.
+
+The numeric columns are copied once into ``multiprocessing`` shared memory,
+laid out so each shard is a contiguous slice. Workers attach to those
+buffers by name instead of receiving pickled frames.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from instacart.joins import OrderIndex
+from instacart.quality import DuplicateCheck, TableChecks, check_table
+
+# Dtype and missing-value sentinel of every column copied to shared memory
+ORDER_COLUMNS = {
+    'order_id': ('int32', 0),
+    'user_id': ('int32', 0),
+    'order_number': ('int16', 0),
+    'order_dow': ('uint8', 0),
+    'order_hour_of_day': ('uint8', 0),
+    'days_since_prior_order': ('float32', np.nan),
+}
+ORDER_PRODUCT_COLUMNS = {
+    'order_id': ('int32', 0),
+    'product_id': ('int32', 0),
+    'add_to_cart_order': ('int16', -1),
+    'reordered': ('uint8', 0),
+}
+
+_ROWS_ONLY = TableChecks(duplicates=(DuplicateCheck('rows'),))
+
+# Partial results combined with np.maximum instead of a sum
+_MAX_PARTIALS = ('user_max_order_number',)
+
+
+class SharedTable:
+    """Columns of a frame copied into shared memory, shard by shard."""
+
+    def __init__(self, blocks, length):
+        self.blocks = blocks
+        self.length = length
+
+    @classmethod
+    def create(cls, frame, columns, order):
+        """Copy ``columns`` of ``frame``, rows taken in ``order``, into shared memory."""
+        blocks = {}
+        try:
+            for column, (dtype, missing) in columns.items():
+                values = frame[column].to_numpy(dtype=dtype, na_value=missing)
+                block = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+                blocks[column] = (block, dtype)
+                np.take(values, order, out=np.ndarray(len(order), dtype=dtype, buffer=block.buf))
+        except BaseException:
+            cls(blocks, len(order)).release()
+            raise
+        return cls(blocks, len(order))
+
+    def spec(self):
+        """Picklable description workers use to attach to the buffers."""
+        return {column: (block.name, dtype) for column, (block, dtype) in self.blocks.items()}, self.length
+
+    def release(self):
+        for block, _ in self.blocks.values():
+            block.close()
+            block.unlink()
+
+
+def attach_shard(spec, start, stop):
+    """Return rows ``start:stop`` of the :class:`SharedTable` described by ``spec`` as a DataFrame."""
+    names, length = spec
+    handles, views = [], {}
+    for column, (name, dtype) in names.items():
+        block = shared_memory.SharedMemory(name=name)
+        handles.append(block)
+        views[column] = np.ndarray(length, dtype=dtype, buffer=block.buf)[start:stop]
+    # Building the frame copies just this shard's slice, after which the
+    # views are dropped so the buffers can be closed
+    frame = pd.DataFrame(views, copy=True)
+    del views
+    for block in handles:
+        block.close()
+    return frame
+
+
+def shard_layout(keys, shards):
+    """Return ``(order, bounds)`` grouping rows by ``key % shards``.
+
+    ``order`` lists row positions shard by shard (stable within a shard) and
+    shard ``i`` is ``order[bounds[i]:bounds[i + 1]]``.
+    """
+    shard = np.asarray(keys) % shards
+    order = np.argsort(shard, kind='stable')
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(shard, minlength=shards))])
+    return order, bounds
+
+
+@dataclass
+class _Sizes:
+    products: int
+    users: int
+
+
+def _process_shard(orders_spec, orders_range, lines_spec, lines_range, sizes):
+    orders = attach_shard(orders_spec, *orders_range)
+    lines = attach_shard(lines_spec, *lines_range)
+    rows_in = (len(orders), len(lines))
+
+    # Cleaning: first row per order_id, then fully duplicate order lines
+    orders = orders[~orders['order_id'].duplicated()]
+    lines = check_table('order_products', lines, _ROWS_ONLY).drop_duplicates(lines)
+
+    index = OrderIndex.from_orders(orders, ['user_id'])
+    users = index.lookup(lines['order_id'].to_numpy(), 'user_id')
+    matched = users >= 0
+    product_ids = lines['product_id'].to_numpy()
+    reordered = lines['reordered'].to_numpy().astype(np.float64)
+    first = lines['add_to_cart_order'].to_numpy() == 1
+
+    days = orders['days_since_prior_order'].to_numpy()
+    days_bucket = np.where(np.isnan(days), 31, np.nan_to_num(days)).astype(np.intp)
+    user_max = np.zeros(sizes.users, dtype=np.int64)
+    np.maximum.at(user_max, orders['user_id'].to_numpy(), orders['order_number'].to_numpy())
+
+    return {
+        'rows_in': np.array(rows_in, dtype=np.int64),
+        'rows_out': np.array([len(orders), len(lines)], dtype=np.int64),
+        'product_items': np.bincount(product_ids, minlength=sizes.products),
+        'product_reorders': np.bincount(product_ids, weights=reordered, minlength=sizes.products),
+        'product_first_in_cart': np.bincount(product_ids[first], minlength=sizes.products),
+        'user_items': np.bincount(users[matched], minlength=sizes.users),
+        'user_reorders': np.bincount(users[matched], weights=reordered[matched], minlength=sizes.users),
+        'user_max_order_number': user_max,
+        'order_hour_counts': np.bincount(orders['order_hour_of_day'].to_numpy(), minlength=24),
+        'order_dow_counts': np.bincount(orders['order_dow'].to_numpy(), minlength=7),
+        'days_counts': np.bincount(days_bucket, minlength=32),
+    }
+
+
+def merge_partials(partials):
+    """Combine shard results: counts are summed, per-user maxima maximized."""
+    merged = {}
+    for partial in partials:
+        for name, array in partial.items():
+            if name not in merged:
+                merged[name] = array.copy()
+            elif name in _MAX_PARTIALS:
+                np.maximum(merged[name], array, out=merged[name])
+            else:
+                merged[name] += array
+    return merged
+
+
+def _metrics_frame(items, reorders, name, first=None):
+    present = np.flatnonzero(items)
+    frame = pd.DataFrame({
+        'items': items[present],
+        'reorders': reorders[present].astype(np.int64),
+        'reorder_proportion': reorders[present] / items[present],
+    }, index=pd.Index(present, name=name))
+    if first is not None:
+        frame['first_in_cart'] = first[present]
+    return frame
+
+
+@dataclass
+class PartitionedResult:
+    """Aggregates of a partitioned run, shaped like the notebook's results."""
+
+    product_metrics: pd.DataFrame
+    user_metrics: pd.DataFrame
+    order_hour_counts: pd.Series
+    order_dow_counts: pd.Series
+    days_counts: pd.Series
+    customer_order_counts: pd.Series
+    rows: dict
+
+
+def _result(merged):
+    hour = merged['order_hour_counts']
+    dow = merged['order_dow_counts']
+    days = merged['days_counts'][:31]
+    user_max = merged['user_max_order_number']
+    users = np.flatnonzero(user_max)
+    return PartitionedResult(
+        product_metrics=_metrics_frame(merged['product_items'], merged['product_reorders'],
+                                       'product_id', merged['product_first_in_cart']),
+        user_metrics=_metrics_frame(merged['user_items'], merged['user_reorders'], 'user_id'),
+        order_hour_counts=pd.Series(hour, index=pd.RangeIndex(len(hour), name='order_hour_of_day')),
+        order_dow_counts=pd.Series(dow, index=pd.RangeIndex(len(dow), name='order_dow')),
+        days_counts=pd.Series(days[days > 0], index=pd.Index(
+            np.flatnonzero(days > 0).astype(float), name='days_since_prior_order')),
+        customer_order_counts=pd.Series(user_max[users], index=pd.Index(users, name='user_id'),
+                                        name='order_number'),
+        rows={'orders_in': int(merged['rows_in'][0]), 'order_products_in': int(merged['rows_in'][1]),
+              'orders_out': int(merged['rows_out'][0]), 'order_products_out': int(merged['rows_out'][1])},
+    )
+
+
+def run_partitioned(orders, order_products, workers=None, shards=None):
+    """Clean and aggregate ``orders``/``order_products`` across worker processes.
+
+    Both tables are split into ``shards`` partitions by ``order_id`` (default
+    four per worker) and processed by a ``ProcessPoolExecutor`` with
+    ``workers`` processes (default: all cores). Distributions are computed on
+    the cleaned orders, i.e. after dropping repeated ``order_id`` rows.
+    """
+    workers = workers or os.cpu_count() or 1
+    shards = shards or workers * 4
+    sizes = _Sizes(
+        products=int(order_products['product_id'].max()) + 1 if len(order_products) else 1,
+        users=int(orders['user_id'].max()) + 1 if len(orders) else 1,
+    )
+    order_layout, order_bounds = shard_layout(orders['order_id'].to_numpy(), shards)
+    line_layout, line_bounds = shard_layout(order_products['order_id'].to_numpy(), shards)
+    shared_orders = SharedTable.create(orders, ORDER_COLUMNS, order_layout)
+    try:
+        shared_lines = SharedTable.create(order_products, ORDER_PRODUCT_COLUMNS, line_layout)
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(_process_shard,
+                                shared_orders.spec(), (order_bounds[i], order_bounds[i + 1]),
+                                shared_lines.spec(), (line_bounds[i], line_bounds[i + 1]),
+                                sizes)
+                    for i in range(shards)
+                ]
+                merged = merge_partials(f.result() for f in futures)
+        finally:
+            shared_lines.release()
+    finally:
+        shared_orders.release()
+    return _result(merged)
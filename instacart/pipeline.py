@@ -0,0 +1,306 @@
+"""A small stage runner with cached outputs and incremental recomputation.
+
+The notebook runs top to bottom, so changing one chart re-reads the csv
+files and re-runs every dedupe and groupby. Here each step is a
+:class:`Stage` with named inputs and outputs, and a :class:`Pipeline` runs
+only what a requested target needs.
+
+Each stage gets a fingerprint built from its name, its code, its
+``version`` and the fingerprints of its inputs. The code is the source of
+the stage function, of the functions of its own module that it calls, and
+of every module of the same package that it uses, directly or through
+other modules: editing ``loader.SCHEMAS`` or ``charts._bar_chart``
+re-runs the stages that depend on them. Source inputs are
+fingerprinted by value, or by size and modification time for
+:class:`FileSource`. A stage whose fingerprint matches a cached result is
+not run; its outputs are read back from disk, and only when a stage that
+does run needs them. Editing a plotting function therefore re-runs that
+stage alone, and touching a csv re-runs exactly the stages downstream of it.
+Outputs that are paths of existing files (the charts) are recorded next to
+the cached result, and a stage whose files have since been deleted runs
+again.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import sys
+import time
+from dataclasses import dataclass, field
+
+from instacart import profiling
+
+
+@dataclass(frozen=True)
+class FileSource:
+    """A file passed into the pipeline; its value is the path."""
+
+    path: str
+
+    def fingerprint(self):
+        stat = os.stat(self.path)
+        return f'{os.path.abspath(self.path)}:{stat.st_size}:{stat.st_mtime_ns}'
+
+
+@dataclass(frozen=True)
+class Stage:
+    """One step of the pipeline.
+
+    ``func`` is called with the values of ``inputs`` as positional
+    arguments. With a single output it returns that value; with several it
+    returns a tuple in the order of ``outputs``. Bump ``version`` to force a
+    re-run when something the source code does not show has changed, such
+    as a third-party library or a file the stage reads on its own.
+    """
+
+    name: str
+    func: object
+    inputs: tuple = ()
+    outputs: tuple = ()
+    version: int = 1
+
+    def code_fingerprint(self):
+        digest = hashlib.blake2b(digest_size=8)
+        for source in _code_sources(self.func):
+            digest.update(source.encode())
+            digest.update(b'\x1f')
+        return digest.hexdigest()
+
+
+@dataclass
+class RunSummary:
+    """Which stages ran and which were served from the cache."""
+
+    ran: list = field(default_factory=list)
+    cached: list = field(default_factory=list)
+    seconds: dict = field(default_factory=dict)
+
+
+def _source(obj):
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        return getattr(obj, '__qualname__', repr(obj))
+
+
+def _global_names(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _global_names(const)
+    return names
+
+
+def _used_objects(func):
+    """``(name, value)`` of the globals ``func`` names, then the values it closes over."""
+    code = getattr(func, '__code__', None)
+    if code is None:
+        return []
+    found = [(name, func.__globals__[name]) for name in sorted(_global_names(code))
+             if name in func.__globals__]
+    found += [(None, cell.cell_contents) for cell in func.__closure__ or ()]
+    return found
+
+
+def _module_name(obj):
+    if inspect.ismodule(obj):
+        return obj.__name__
+    name = getattr(obj, '__module__', None)
+    return name if isinstance(name, str) else None
+
+
+def _code_sources(func):
+    """Sources ``func`` depends on within its package, in a stable order.
+
+    Functions of ``func``'s own module are followed one by one. Any other
+    module of the package that is used contributes its whole source, and so
+    do the package modules it uses in turn. A constant such as a dict or a
+    tuple has no module of its own, so it pulls in every package module
+    holding it under the same name.
+    """
+    home = getattr(func, '__module__', None) or ''
+    package = home.partition('.')[0]
+    package_modules = {name: module for name, module in list(sys.modules.items())
+                       if module is not None and name.partition('.')[0] == package}
+    sources, functions, todo = [_source(func)], {id(func)}, []
+    pending = [func]
+    while pending:
+        for name, obj in _used_objects(pending.pop()):
+            module = _module_name(obj)
+            if module is None:
+                todo += [other for other, m in package_modules.items()
+                         if name is not None and vars(m).get(name) is obj]
+            elif module == home and inspect.isfunction(obj):
+                if id(obj) not in functions:
+                    functions.add(id(obj))
+                    sources.append(_source(obj))
+                    pending.append(obj)
+            elif module in package_modules:
+                todo.append(module)
+    modules = set()
+    while todo:
+        name = todo.pop()
+        if name in modules:
+            continue
+        modules.add(name)
+        for obj in vars(package_modules[name]).values():
+            if _module_name(obj) in package_modules:
+                todo.append(_module_name(obj))
+    return sources + [_source(package_modules[name]) for name in sorted(modules)]
+
+
+def _hash(*parts):
+    return hashlib.blake2b('\x1f'.join(parts).encode(), digest_size=12).hexdigest()
+
+
+def _files_path(path):
+    # Files written by the stage whose result is cached at path
+    return path + '.files.json'
+
+
+class Pipeline:
+    """Runs :class:`Stage` objects, caching every output under ``cache_dir``."""
+
+    def __init__(self, stages, cache_dir):
+        self.stages = {}
+        self.producers = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f'Duplicate stage name {stage.name!r}')
+            self.stages[stage.name] = stage
+            for output in stage.outputs:
+                if output in self.producers:
+                    raise ValueError(f'{output!r} is produced by both '
+                                     f'{self.producers[output]!r} and {stage.name!r}')
+                self.producers[output] = stage.name
+        self.cache_dir = cache_dir
+
+    def _plan(self, targets, sources):
+        """Return the stages needed for ``targets`` in dependency order."""
+        order, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f'Cycle in pipeline at stage {name!r}')
+            visiting.add(name)
+            for value in self.stages[name].inputs:
+                if value in self.producers:
+                    visit(self.producers[value])
+                elif value not in sources:
+                    raise KeyError(f'Stage {name!r} needs {value!r}, which no stage produces '
+                                   'and was not passed as a source')
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for target in targets:
+            if target in self.stages:
+                visit(target)
+            elif target in self.producers:
+                visit(self.producers[target])
+            else:
+                raise KeyError(f'Unknown stage or output {target!r}')
+        return order
+
+    def _output_path(self, stage, fingerprint):
+        return os.path.join(self.cache_dir, stage, f'{fingerprint}.pkl')
+
+    def _is_cached(self, path):
+        """Whether the result at ``path`` exists and so do the files it points to."""
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(_files_path(path)) as f:
+                files = json.load(f)
+        except FileNotFoundError:
+            return True
+        return all(os.path.isfile(file) for file in files)
+
+    def run(self, targets, sources, force=()):
+        """Produce ``targets`` (stage or output names) from ``sources``.
+
+        ``sources`` maps every input that no stage produces to its value
+        (use :class:`FileSource` for files). Stages named in ``force`` are
+        re-run even when cached. Returns ``(values, summary)`` where
+        ``values`` maps each requested output to its value.
+        """
+        if isinstance(targets, str):
+            targets = [targets]
+        plan = self._plan(targets, sources)
+
+        fingerprints = {}
+        for name, value in sources.items():
+            source_print = value.fingerprint() if hasattr(value, 'fingerprint') else repr(value)
+            fingerprints[name] = _hash('source', name, source_print)
+        stage_prints = {}
+        for name in plan:
+            stage = self.stages[name]
+            stage_prints[name] = _hash(name, str(stage.version), stage.code_fingerprint(),
+                                       *(fingerprints[i] for i in stage.inputs))
+            for output in stage.outputs:
+                fingerprints[output] = _hash(stage_prints[name], output)
+
+        # Walk backwards to find which stages must actually run: those with
+        # no cached result, plus the producers of anything they consume.
+        values = {name: getattr(value, 'path', value) for name, value in sources.items()}
+        must_run = set()
+        for name in plan:
+            if name in force or not self._is_cached(self._output_path(name, stage_prints[name])):
+                must_run.add(name)
+
+        summary = RunSummary()
+        wanted = {self.producers.get(t, t) for t in targets}
+        needed = set()
+        for name in reversed(plan):
+            if name in wanted or name in needed:
+                needed.add(name)
+                if name in must_run:
+                    for value in self.stages[name].inputs:
+                        if value in self.producers:
+                            needed.add(self.producers[value])
+
+        for name in plan:
+            if name not in needed:
+                continue
+            stage = self.stages[name]
+            path = self._output_path(name, stage_prints[name])
+            if name in must_run:
+                start = time.perf_counter()
+                with profiling.step(name):
+                    result = stage.func(*(values[i] for i in stage.inputs))
+                summary.seconds[name] = time.perf_counter() - start
+                results = (result,) if len(stage.outputs) == 1 else tuple(result)
+                outputs = dict(zip(stage.outputs, results))
+                self._store(name, path, outputs)
+                summary.ran.append(name)
+            else:
+                with open(path, 'rb') as f:
+                    outputs = pickle.load(f)
+                summary.cached.append(name)
+            values.update(outputs)
+
+        requested = {}
+        for target in targets:
+            outputs = self.stages[target].outputs if target in self.stages else (target,)
+            for output in outputs:
+                requested[output] = values[output]
+        return requested, summary
+
+    def _store(self, name, path, outputs):
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        # Only the newest result of a stage is kept
+        for old in os.listdir(folder):
+            os.remove(os.path.join(folder, old))
+        files = [os.path.abspath(value) for value in outputs.values()
+                 if isinstance(value, (str, os.PathLike)) and os.path.isfile(value)]
+        if files:
+            with open(_files_path(path), 'w') as f:
+                json.dump(files, f)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(outputs, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
@@ -0,0 +1,173 @@
+"""The analyses of :mod:`instacart.analysis` as Polars lazy queries.
+
+Every table is a ``LazyFrame`` over its csv file, and the cleaning steps
+are lazy too (``orders.unique('order_id')``, ``order_products.unique()``).
+All requested analyses are built first and collected together with
+``pl.collect_all``. The optimizer can then share a scan and a cleaning
+step between queries, push projections and filters into the csv reader,
+and run everything on Polars' thread pool.
+
+Needs polars: ``pip install polars``.
+"""
+
+from instacart.analysis import CART_LIMIT, TOP_N, hour_dow_frame
+from instacart.loader import SCHEMAS, SEP, table_path
+
+try:
+    import polars as pl
+except ImportError:  # pragma: no cover - optional dependency
+    pl = None
+
+
+def _dtypes():
+    return {
+        'int32': pl.Int32,
+        'int16': pl.Int16,
+        'Int16': pl.Int16,
+        'uint8': pl.UInt8,
+        'float32': pl.Float32,
+        'category': pl.String,
+    }
+
+
+def scan_table(name, data_dir=None):
+    """``LazyFrame`` over one csv table with the compact dtypes of :data:`SCHEMAS`."""
+    if pl is None:
+        raise ImportError('the polars backend needs polars: pip install polars')
+    dtypes = _dtypes()
+    schema = SCHEMAS[name]
+    # Nullable integers are written as floats ("1.0"); read them as Float64 and cast
+    overrides = {column: pl.Float64 if dtype == 'Int16' else dtypes[dtype]
+                 for column, dtype in schema.items()}
+    frame = pl.scan_csv(table_path(name, data_dir), separator=SEP, schema_overrides=overrides)
+    return frame.with_columns([pl.col(column).cast(dtypes[dtype]) for column, dtype in schema.items()
+                               if dtype == 'Int16'])
+
+
+def _checks(orders, order_products):
+    orders = orders.select(
+        rows=pl.len(),
+        duplicate_rows=pl.len() - pl.struct(pl.all()).n_unique(),
+        duplicate_order_id=pl.len() - pl.col('order_id').n_unique(),
+        missing_days_since_prior_order=pl.col('days_since_prior_order').null_count(),
+        hour_out_of_range=(pl.col('order_hour_of_day') > 23).sum(),
+        dow_out_of_range=(pl.col('order_dow') > 6).sum(),
+    )
+    lines = order_products.select(
+        rows=pl.len(),
+        duplicate_rows=pl.len() - pl.struct(pl.all()).n_unique(),
+        missing_add_to_cart_order=pl.col('add_to_cart_order').null_count(),
+        add_to_cart_over_limit=(pl.col('add_to_cart_order') > CART_LIMIT).sum(),
+    )
+    return pl.concat([_long(orders, 'orders'), _long(lines, 'order_products')])
+
+
+def _long(frame, table):
+    columns = frame.collect_schema().names()
+    frame = frame.select(pl.all().cast(pl.Int64)).unpivot(on=columns, variable_name='check',
+                                                          value_name='count')
+    return frame.select(pl.lit(table).alias('table'), 'check', 'count')
+
+
+def _counts(orders, column):
+    return orders.drop_nulls(column).group_by(column).agg(count=pl.len()).sort(column)
+
+
+def _top(order_products, products, where, count_name):
+    if where is not None:
+        order_products = order_products.filter(where)
+    top = (order_products.group_by('product_id').agg(pl.len().alias(count_name))
+           .sort([count_name, 'product_id'], descending=[True, False]).head(TOP_N))
+    names = products.select('product_id', 'product_name').unique('product_id', keep='first',
+                                                                   maintain_order=True)
+    return (top.join(names, on='product_id', how='left')
+            .sort([count_name, 'product_id'], descending=[True, False]))
+
+
+def _metrics(lines, key):
+    cart = pl.col('add_to_cart_order')
+    return lines.group_by(key).agg(
+        items=pl.len(),
+        reorders=pl.col('reordered').cast(pl.Int64).sum(),
+        reorder_proportion=pl.col('reordered').cast(pl.Int64).sum() / pl.len(),
+        first_in_cart=(cart == 1).sum(),
+        mean_cart_position=cart.cast(pl.Float64).mean(),
+    ).sort(key)
+
+
+def queries(names, data_dir=None):
+    """Build the ``LazyFrame`` for each analysis in ``names``."""
+    orders = scan_table('orders', data_dir)
+    order_products = scan_table('order_products', data_dir)
+    products = scan_table('products', data_dir)
+    orders_clean = orders.unique('order_id', keep='first', maintain_order=True)
+    lines_clean = order_products.unique(keep='any')
+
+    built = {}
+    for name in names:
+        if name == 'checks':
+            built[name] = _checks(orders, order_products)
+        elif name == 'order_hour_counts':
+            built[name] = _counts(orders_clean, 'order_hour_of_day')
+        elif name == 'order_dow_counts':
+            built[name] = _counts(orders_clean, 'order_dow')
+        elif name == 'days_counts':
+            built[name] = _counts(orders_clean, 'days_since_prior_order')
+        elif name == 'hour_dow_counts':
+            built[name] = orders_clean.group_by('order_hour_of_day', 'order_dow').agg(count=pl.len())
+        elif name == 'customer_order_counts':
+            built[name] = orders_clean.group_by('user_id').agg(pl.col('order_number').max()).sort('user_id')
+        elif name == 'order_sizes':
+            built[name] = lines_clean.group_by('order_id').agg(items=pl.len()).sort('order_id')
+        elif name == 'top_products':
+            built[name] = _top(lines_clean, products, None, 'order_count')
+        elif name == 'top_reordered':
+            built[name] = _top(lines_clean, products, pl.col('reordered') == 1, 'reorder_count')
+        elif name == 'top_first_added':
+            built[name] = _top(lines_clean, products, pl.col('add_to_cart_order') == 1,
+                               'first_added_count')
+        elif name == 'product_metrics':
+            built[name] = _metrics(lines_clean, 'product_id')
+        elif name == 'user_metrics':
+            users = orders_clean.select('order_id', 'user_id')
+            built[name] = _metrics(lines_clean.join(users, on='order_id', how='inner'), 'user_id')
+        else:
+            raise KeyError(name)
+    return built
+
+
+# Analysis name -> (index columns, value column) for results returned as a Series
+_SERIES = {
+    'checks': (['table', 'check'], 'count'),
+    'order_hour_counts': (['order_hour_of_day'], 'count'),
+    'order_dow_counts': (['order_dow'], 'count'),
+    'days_counts': (['days_since_prior_order'], 'count'),
+    'customer_order_counts': (['user_id'], 'order_number'),
+    'order_sizes': (['order_id'], 'items'),
+}
+
+_INDEXED = {'product_metrics': 'product_id', 'user_metrics': 'user_id'}
+
+
+def _to_pandas(name, frame):
+    frame = frame.to_pandas()
+    if name in _SERIES:
+        index, value = _SERIES[name]
+        return frame.set_index(index)[value]
+    if name == 'hour_dow_counts':
+        return hour_dow_frame(frame['order_hour_of_day'], frame['order_dow'], frame['count'])
+    if name in _INDEXED:
+        return frame.set_index(_INDEXED[name])
+    return frame
+
+
+def run(names, data_dir=None, streaming=False):
+    """Run the analyses ``names`` in one optimized collect.
+
+    ``streaming=True`` uses the streaming engine, which processes the csv
+    files in batches instead of loading them whole.
+    """
+    built = queries(names, data_dir)
+    engine = 'streaming' if streaming else 'auto'
+    frames = pl.collect_all(list(built.values()), engine=engine)
+    return {name: _to_pandas(name, frame) for name, frame in zip(built, frames)}
@@ -0,0 +1,328 @@
+"""Per-step timing and memory profile of a run.
+
+Wrap each logical step in :func:`step`::
+
+    with step('load orders') as s:
+        orders = s.output(load_table('orders'))
+
+Set ``INSTACART_PROFILE`` to switch it on. ``1`` (or ``true``, ``yes``,
+``on``) writes ``instacart_profile.json``; ``0``, ``false``, ``no`` and
+``off`` leave it off; any other value is the path of the JSON file.
+A Chrome trace (``<name>.trace.json``, open it in ``chrome://tracing`` or
+Perfetto) is written next to it when the process exits. When the variable
+is not set, :func:`step` returns a shared no-op context manager, so the
+instrumentation costs one global lookup per step.
+
+Each step records the following; allocation tracking slows Python-heavy
+code down noticeably, so set ``INSTACART_PROFILE_ALLOCATIONS=0`` to skip it:
+
+- wall and CPU seconds
+- how much the process' peak RSS grew
+- rows in and out when given
+- the peak of memory allocated during the step, from ``tracemalloc``
+
+Steps can be nested. Compare two profiles with::
+
+    python -m instacart.profiling compare base.json new.json --threshold 0.25
+
+It exits with status 1 when a step got slower or allocates more by more
+than the threshold.
+"""
+
+import argparse
+import atexit
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+ENV_VAR = 'INSTACART_PROFILE'
+
+ALLOCATIONS_ENV_VAR = 'INSTACART_PROFILE_ALLOCATIONS'
+
+DEFAULT_PATH = 'instacart_profile.json'
+
+# Values of the environment variables that switch a feature on or off
+_ON = ('1', 'true', 'yes', 'on')
+_OFF = ('', '0', 'false', 'no', 'off')
+
+
+def _peak_rss():
+    """Peak resident set size of this process in bytes, or None if unknown."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == 'darwin' else peak * 1024
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset
+    except (ImportError, AttributeError):
+        return None
+
+
+def _rows(value):
+    if value is None or isinstance(value, int):
+        return value
+    return len(value)
+
+
+@dataclass
+class StepRecord:
+    name: str
+    depth: int
+    start: float
+    wall: float = 0.0
+    cpu: float = 0.0
+    rss_peak_delta: int = None
+    rows_in: int = None
+    rows_out: int = None
+    # Peak of tracemalloc-traced memory above the level at the start of the step
+    allocated_peak: int = None
+    # Traced memory still held at the end of the step
+    allocated_net: int = None
+
+    def output(self, value):
+        """Record ``len(value)`` (or ``value`` itself if it is an int) as rows out and return it."""
+        self.rows_out = _rows(value)
+        return value
+
+
+class _NullRecord:
+    def output(self, value):
+        return value
+
+
+class _NullStep:
+    record = _NullRecord()
+
+    def __enter__(self):
+        return self.record
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STEP = _NullStep()
+
+
+class _Step:
+    def __init__(self, profiler, name, rows_in):
+        self.profiler = profiler
+        self.record = StepRecord(name, len(profiler.stack), 0.0, rows_in=_rows(rows_in))
+
+    def __enter__(self):
+        profiler = self.profiler
+        if profiler.track_allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            if profiler.stack:
+                parent = profiler.stack[-1]
+                parent.peak_seen = max(parent.peak_seen, peak)
+            tracemalloc.reset_peak()
+            self.traced_start = self.peak_seen = current
+        profiler.stack.append(self)
+        self.rss_start = _peak_rss()
+        self.cpu_start = time.process_time()
+        self.record.start = time.perf_counter() - profiler.origin
+        return self.record
+
+    def __exit__(self, *exc):
+        record = self.record
+        profiler = self.profiler
+        record.wall = time.perf_counter() - profiler.origin - record.start
+        record.cpu = time.process_time() - self.cpu_start
+        rss_end = _peak_rss()
+        if rss_end is not None:
+            record.rss_peak_delta = rss_end - self.rss_start
+        profiler.stack.pop()
+        if profiler.track_allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            self.peak_seen = max(self.peak_seen, peak)
+            record.allocated_peak = self.peak_seen - self.traced_start
+            record.allocated_net = current - self.traced_start
+            if profiler.stack:
+                parent = profiler.stack[-1]
+                parent.peak_seen = max(parent.peak_seen, self.peak_seen)
+            tracemalloc.reset_peak()
+        profiler.records.append(record)
+        return False
+
+
+class Profiler:
+    """Collects :class:`StepRecord` objects for one run."""
+
+    def __init__(self, track_allocations=True):
+        self.records = []
+        self.stack = []
+        self.origin = time.perf_counter()
+        self.started = time.time()
+        self.track_allocations = track_allocations
+        if track_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def step(self, name, rows_in=None):
+        return _Step(self, name, rows_in)
+
+    def to_dict(self):
+        return {
+            'run': {
+                'argv': sys.argv,
+                'started': self.started,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'total_seconds': time.perf_counter() - self.origin,
+            },
+            'steps': [asdict(r) for r in sorted(self.records, key=lambda r: r.start)],
+        }
+
+    def save(self, path):
+        """Write the JSON profile to ``path`` and the Chrome trace next to it."""
+        profile = self.to_dict()
+        with open(path, 'w') as f:
+            json.dump(profile, f, indent=1)
+        with open(trace_path(path), 'w') as f:
+            json.dump(chrome_trace(profile), f)
+        return path
+
+
+def trace_path(path):
+    root, _ = os.path.splitext(path)
+    return f'{root}.trace.json'
+
+
+def chrome_trace(profile):
+    """Convert a JSON profile to the Chrome trace event format."""
+    events = []
+    for record in profile['steps']:
+        args = {k: v for k, v in record.items()
+                if k not in ('name', 'start', 'wall', 'depth') and v is not None}
+        events.append({'name': record['name'], 'ph': 'X', 'pid': 1, 'tid': 1,
+                       'ts': record['start'] * 1e6, 'dur': record['wall'] * 1e6, 'args': args})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+_profiler = None
+_path = None
+_registered = False
+
+
+def enable(path=DEFAULT_PATH, track_allocations=True):
+    """Start profiling; the profile is written to ``path`` at exit."""
+    global _profiler, _path, _registered
+    if not _registered:
+        atexit.register(_write)
+        _registered = True
+    _profiler = Profiler(track_allocations)
+    _path = path
+    return _profiler
+
+
+def disable():
+    """Stop profiling and return the profiler that was running, if any."""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+
+def _write():
+    if _profiler is not None and _profiler.records:
+        _profiler.save(_path)
+
+
+def step(name, rows_in=None):
+    """Context manager timing the step ``name``; a no-op unless profiling is on."""
+    if _profiler is None:
+        return _NULL_STEP
+    return _profiler.step(name, rows_in)
+
+
+def load_profile(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _by_step(profile):
+    steps = pd.DataFrame(profile['steps'])
+    if steps.empty:
+        return pd.DataFrame(columns=['wall', 'cpu', 'allocated_peak', 'calls'])
+    steps['calls'] = 1
+    # None when allocations were not tracked
+    steps['allocated_peak'] = pd.to_numeric(steps['allocated_peak']).astype(float)
+    return steps.groupby('name', sort=False).agg(
+        wall=('wall', 'sum'), cpu=('cpu', 'sum'), allocated_peak=('allocated_peak', 'max'),
+        calls=('calls', 'sum'))
+
+
+def compare_profiles(base, new, threshold=0.25, min_seconds=0.01, min_bytes=1 << 20):
+    """Compare two profiles (dicts or paths) step by step.
+
+    A step regresses when its wall time grows by more than ``threshold``
+    (a fraction) and ``min_seconds``, or its allocation peak grows by more
+    than ``threshold`` and ``min_bytes``. Steps with the same name are
+    summed. Returns a DataFrame indexed by step name.
+    """
+    base = load_profile(base) if isinstance(base, str) else base
+    new = load_profile(new) if isinstance(new, str) else new
+    base, new = _by_step(base), _by_step(new)
+    # Steps in run order, with steps only the new profile has at the end
+    order = list(base.index) + [name for name in new.index if name not in base.index]
+    table = base.join(new, how='outer', lsuffix='_base', rsuffix='_new').reindex(order)
+    table['wall_ratio'] = table['wall_new'] / table['wall_base']
+    slower = ((table['wall_new'] > table['wall_base'] * (1 + threshold))
+              & (table['wall_new'] - table['wall_base'] > min_seconds))
+    grew = ((table['allocated_peak_new'] > table['allocated_peak_base'] * (1 + threshold))
+            & (table['allocated_peak_new'] - table['allocated_peak_base'] > min_bytes))
+    table['regressed'] = slower | grew
+    return table[['wall_base', 'wall_new', 'wall_ratio', 'cpu_base', 'cpu_new',
+                  'allocated_peak_base', 'allocated_peak_new', 'regressed']]
+
+
+def profile_path(value):
+    """Where a profile goes for an ``INSTACART_PROFILE`` value, or None when profiling is off."""
+    value = (value or '').strip()
+    if value.lower() in _OFF:
+        return None
+    return DEFAULT_PATH if value.lower() in _ON else value
+
+
+if profile_path(os.environ.get(ENV_VAR)):
+    enable(profile_path(os.environ[ENV_VAR]),
+           track_allocations=os.environ.get(ALLOCATIONS_ENV_VAR, '1').strip().lower() not in _OFF)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inspect and compare run profiles.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    show = commands.add_parser('show', help='print the steps of a profile')
+    show.add_argument('profile')
+    compare = commands.add_parser('compare', help='compare a profile against a baseline')
+    compare.add_argument('base')
+    compare.add_argument('new')
+    compare.add_argument('--threshold', type=float, default=0.25)
+    compare.add_argument('--min-seconds', type=float, default=0.01)
+    args = parser.parse_args(argv)
+
+    if args.command == 'show':
+        steps = pd.DataFrame(load_profile(args.profile)['steps'])
+        steps['name'] = ['  ' * d + n for d, n in zip(steps['depth'], steps['name'])]
+        print(steps.drop(columns=['depth']).to_string(index=False))
+        return
+    table = compare_profiles(args.base, args.new, args.threshold, args.min_seconds)
+    print(table.to_string())
+    regressed = table.index[table['regressed']].tolist()
+    if regressed:
+        print(f'Regressed: {", ".join(regressed)}')
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+"""Duplicate, missing-value and range checks computed in one pass per table.
+
+The notebook calls ``DataFrame.duplicated()`` once per question (full rows,
+``order_id``, ``order_id`` + ``product_id``, ``product_name``, lowercased
+``product_name``) and then ``drop_duplicates()`` on top. Every one of those
+calls hashes the whole table again.
+
+Here every column is factorized once into integer codes (categorical
+columns already are), and each duplicate check combines the codes of its
+columns arithmetically. A key built that way can be counted with
+``np.bincount``, so all checks together cost one hash pass per column plus
+some integer array maths. Because ``pd.factorize`` numbers keys in order of
+first appearance, the ``keep='first'`` mask needed to drop duplicates falls
+out of a running maximum with no second hash pass.
+"""
+
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class DuplicateCheck:
+    """Rows are duplicates when they agree on ``columns`` (``None`` means all columns)."""
+
+    name: str
+    columns: tuple = None
+    # Compare text case-insensitively
+    ignore_case: bool = False
+    # Leave rows with a missing value in ``columns`` out of the check
+    skip_missing: bool = False
+
+
+@dataclass(frozen=True)
+class RangeCheck:
+    """Values of ``column`` are expected to lie in ``[low, high]``."""
+
+    column: str
+    low: float
+    high: float
+
+
+@dataclass(frozen=True)
+class TableChecks:
+    duplicates: tuple = ()
+    ranges: tuple = ()
+
+
+# The questions the notebook asks about each table
+DEFAULT_CHECKS = {
+    'orders': TableChecks(
+        duplicates=(
+            DuplicateCheck('rows'),
+            DuplicateCheck('order_id', ('order_id',)),
+        ),
+        ranges=(
+            RangeCheck('order_hour_of_day', 0, 23),
+            RangeCheck('order_dow', 0, 6),
+        ),
+    ),
+    'order_products': TableChecks(
+        duplicates=(
+            DuplicateCheck('rows'),
+            DuplicateCheck('order_product', ('order_id', 'product_id')),
+        ),
+    ),
+    'products': TableChecks(
+        duplicates=(
+            DuplicateCheck('rows'),
+            DuplicateCheck('product_id', ('product_id',)),
+            DuplicateCheck('product_name', ('product_name',)),
+            DuplicateCheck('product_name_lower', ('product_name',), ignore_case=True),
+            DuplicateCheck('product_name_lower_non_missing', ('product_name',),
+                           ignore_case=True, skip_missing=True),
+        ),
+    ),
+    'aisles': TableChecks(
+        duplicates=(DuplicateCheck('rows'), DuplicateCheck('aisle_id', ('aisle_id',))),
+    ),
+    'departments': TableChecks(
+        duplicates=(DuplicateCheck('rows'), DuplicateCheck('department_id', ('department_id',))),
+    ),
+}
+
+
+@dataclass
+class DuplicateStats:
+    check: str
+    columns: tuple
+    # Rows sharing their key with at least one other row (duplicated(keep=False))
+    rows_involved: int
+    # Rows that drop_duplicates would remove (duplicated(keep='first'))
+    extra_rows: int
+    unique_keys: int
+
+
+@dataclass
+class RangeStats:
+    column: str
+    low: float
+    high: float
+    min: float
+    max: float
+    # Non-missing values outside [low, high]
+    violations: int
+
+
+@dataclass
+class QualityReport:
+    """Everything :func:`check_table` found out about one table."""
+
+    table: str
+    rows: int
+    nulls: dict
+    duplicates: dict
+    ranges: dict
+    # Dense key per row for each duplicate check, -1 for skipped rows
+    _keys: dict = field(default_factory=dict, repr=False)
+
+    def duplicated(self, check, keep='first'):
+        """Boolean mask like ``DataFrame.duplicated`` for duplicate check ``check``.
+
+        ``keep`` is ``'first'`` or ``False``; rows skipped by the check are
+        never flagged.
+        """
+        key = self._keys[check]
+        valid = key >= 0
+        if keep is False:
+            counts = np.bincount(key[valid])
+            mask = np.zeros(len(key), dtype=bool)
+            mask[valid] = counts[key[valid]] > 1
+            return mask
+        if keep != 'first':
+            raise ValueError("keep must be 'first' or False")
+        # Keys are numbered in order of first appearance, so a row is the
+        # first of its key exactly when it pushes the running maximum up.
+        running = np.maximum.accumulate(key)
+        first = np.empty(len(key), dtype=bool)
+        first[:1] = True
+        first[1:] = running[1:] > running[:-1]
+        return valid & ~first
+
+    def drop_duplicates(self, frame, check='rows'):
+        """Return ``frame`` without the rows flagged by ``duplicated(check)``."""
+        return frame[~self.duplicated(check)]
+
+    def summary(self):
+        """Return the duplicate and range results as one tidy DataFrame."""
+        rows = [
+            {'table': self.table, 'check': s.check, 'kind': 'duplicate',
+             'columns': ','.join(s.columns), 'failing_rows': s.rows_involved,
+             'extra_rows': s.extra_rows}
+            for s in self.duplicates.values()
+        ]
+        rows += [
+            {'table': self.table, 'check': f'{s.column} in [{s.low}, {s.high}]', 'kind': 'range',
+             'columns': s.column, 'failing_rows': s.violations, 'extra_rows': 0}
+            for s in self.ranges.values()
+        ]
+        return pd.DataFrame(rows)
+
+
+def _column_codes(series, ignore_case):
+    """Return ``(codes, cardinality)`` with missing values mapped to ``-1``."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        categories = series.cat.categories
+        if ignore_case:
+            # Lowercase each distinct value once and merge the categories
+            # that collide, instead of lowercasing every row.
+            lowered, _ = pd.factorize(categories.str.lower())
+            codes = np.where(codes >= 0, lowered[codes], -1)
+            return codes, int(lowered.max()) + 1 if len(lowered) else 0
+        return codes, len(categories)
+    if ignore_case:
+        series = series.str.lower()
+    codes, uniques = pd.factorize(series)
+    return codes, len(uniques)
+
+
+def _combine(codes_list):
+    """Turn per-column codes into one dense key numbered by first appearance."""
+    key = None
+    card = 1
+    for codes, width in codes_list:
+        # Missing values get their own code so they compare equal, as in pandas
+        codes = np.where(codes < 0, width, codes).astype(np.int64)
+        width += 1
+        if key is None:
+            key, card = codes, width
+            continue
+        if card * width >= 2 ** 62:
+            key, uniques = pd.factorize(key)
+            card = len(uniques)
+        key = key * width + codes
+        card *= width
+    dense, uniques = pd.factorize(key)
+    return dense, len(uniques)
+
+
+def _range_stats(series, check):
+    values = series.dropna().to_numpy()
+    if len(values) == 0:
+        return RangeStats(check.column, check.low, check.high, np.nan, np.nan, 0)
+    outside = (values < check.low) | (values > check.high)
+    return RangeStats(check.column, check.low, check.high,
+                      values.min().item(), values.max().item(), int(outside.sum()))
+
+
+def check_table(name, frame, checks=None):
+    """Run every configured check for table ``name`` and return a :class:`QualityReport`.
+
+    ``checks`` defaults to ``DEFAULT_CHECKS[name]``.
+    """
+    checks = checks or DEFAULT_CHECKS.get(name, TableChecks(duplicates=(DuplicateCheck('rows'),)))
+    n = len(frame)
+    codes = {}
+
+    def codes_for(column, ignore_case=False):
+        # Each (column, case) pair is factorized at most once
+        if (column, ignore_case) not in codes:
+            codes[column, ignore_case] = _column_codes(frame[column], ignore_case)
+        return codes[column, ignore_case]
+
+    nulls = {column: int((codes_for(column)[0] < 0).sum()) for column in frame.columns}
+
+    duplicates = {}
+    keys = {}
+    for check in checks.duplicates:
+        columns = tuple(frame.columns) if check.columns is None else check.columns
+        parts = [codes_for(c, check.ignore_case and not pd.api.types.is_numeric_dtype(frame[c]))
+                 for c in columns]
+        dense, unique = _combine(parts)
+        if check.skip_missing:
+            missing = np.zeros(n, dtype=bool)
+            for part, _ in parts:
+                missing |= part < 0
+            dense = np.where(missing, -1, dense)
+        valid = dense >= 0
+        counts = np.bincount(dense[valid], minlength=unique)
+        unique = int((counts > 0).sum())
+        duplicates[check.name] = DuplicateStats(
+            check.name, columns,
+            rows_involved=int(counts[counts > 1].sum()),
+            extra_rows=int(valid.sum()) - unique,
+            unique_keys=unique,
+        )
+        keys[check.name] = dense.astype(np.int32) if unique < 2 ** 31 else dense
+
+    ranges = {check.column: _range_stats(frame[check.column], check) for check in checks.ranges}
+    return QualityReport(name, n, nulls, duplicates, ranges, keys)
+
+
+def check_tables(frames, checks=None):
+    """Return ``{table: QualityReport}`` for every frame in ``frames``."""
+    checks = checks or {}
+    return {name: check_table(name, frame, checks.get(name)) for name, frame in frames.items()}
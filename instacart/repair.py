@@ -0,0 +1,116 @@
+"""Rebuild the ``add_to_cart_order`` values missing from large orders.
+
+The source data stops recording cart positions at 64, so every line past
+the 64th of an order has a missing ``add_to_cart_order``. The notebook
+writes the affected order ids to ``orders_with_missing_add_to_cart_order.csv``
+and casts the column to ``Int64`` with the gaps left in.
+
+:func:`repair_cart_positions` fills them in instead. With the lines grouped
+into one run per order by a :class:`~instacart.baskets.BasketLayout`, the
+missing lines of an order get the positions after its largest known one
+(65, 66, ... n), in row order, so the result is deterministic. The check
+that every order now holds exactly the positions ``1..size`` is one pass
+too: each line marks slot ``position - 1`` of its run, and every slot must
+be marked exactly once.
+
+With ``chunks`` the lines are split by ``order_id`` like
+:func:`~instacart.parallel.shard_layout`, so an order is never cut across
+chunks, and each chunk is repaired and checked on its own.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from instacart.baskets import BasketLayout
+from instacart.parallel import shard_layout
+
+
+@dataclass
+class CartRepair:
+    # Complete add_to_cart_order of every line, in row order
+    positions: np.ndarray
+    # Lines whose position was missing and has been filled in
+    repaired_lines: int
+    # Orders with at least one repaired line
+    repaired_orders: int
+    # Orders whose positions are not exactly 1..size, e.g. because of duplicate lines
+    invalid_orders: np.ndarray
+
+    @property
+    def valid(self):
+        return len(self.invalid_orders) == 0
+
+    def apply(self, order_products, column='add_to_cart_order'):
+        """Return ``order_products`` with ``column`` replaced by the repaired positions."""
+        result = order_products.copy(deep=False)
+        result[column] = self.positions
+        return result
+
+
+def invalid_runs(layout, positions):
+    """Boolean mask of the orders of ``layout`` whose ``positions`` are not 1..size.
+
+    ``positions`` holds one value per line, in row order.
+    """
+    if not len(layout):
+        return np.zeros(0, dtype=bool)
+    positions = layout.gather(positions)
+    sizes = layout.broadcast(layout.sizes)
+    in_range = (positions >= 1) & (positions <= sizes)
+    slots = layout.broadcast(layout.offsets[:-1]) + np.where(in_range, positions - 1, 0)
+    marks = np.bincount(slots[in_range], minlength=layout.lines)
+    good = in_range & (marks[slots] == 1)
+    return ~np.logical_and.reduceat(good, layout.offsets[:-1])
+
+
+def _repair(order_ids, cart, layout=None):
+    layout = layout or BasketLayout.from_order_ids(order_ids)
+    positions = layout.cart_positions(cart)
+    missing = layout.missing_cart_positions(cart)
+    return (positions, int(missing.sum()), int((missing > 0).sum()),
+            layout.order_ids[invalid_runs(layout, positions)])
+
+
+def repair_cart_positions(order_products, chunks=1, layout=None):
+    """Fill in the missing ``add_to_cart_order`` of ``order_products``; returns a :class:`CartRepair`.
+
+    ``layout`` is the :class:`~instacart.baskets.BasketLayout` of
+    ``order_products`` when one was already built. With ``chunks`` above
+    one the lines are repaired ``chunks`` groups of orders at a time, which
+    bounds the memory of the intermediate arrays.
+    """
+    order_ids = order_products['order_id'].to_numpy()
+    cart = order_products['add_to_cart_order'].to_numpy(dtype=np.float64, na_value=np.nan)
+    if chunks == 1:
+        positions, lines, orders, invalid = _repair(order_ids, cart, layout)
+        return CartRepair(positions, lines, orders, invalid)
+    order, bounds = shard_layout(order_ids, chunks)
+    positions = np.empty(len(order_ids), dtype=np.int64)
+    lines = orders = 0
+    invalid = []
+    for i in range(chunks):
+        rows = order[bounds[i]:bounds[i + 1]]
+        if not len(rows):
+            continue
+        chunk_positions, chunk_lines, chunk_orders, chunk_invalid = _repair(order_ids[rows], cart[rows])
+        positions[rows] = chunk_positions
+        lines += chunk_lines
+        orders += chunk_orders
+        invalid.append(chunk_invalid)
+    invalid = np.sort(np.concatenate(invalid)) if invalid else np.zeros(0, dtype=order_ids.dtype)
+    return CartRepair(positions, lines, orders, invalid)
+
+
+def repaired_order_products(order_products, chunks=1):
+    """``order_products`` with complete ``add_to_cart_order`` values.
+
+    Raises ``ValueError`` when an order does not end up with exactly the
+    positions ``1..size``, which means duplicate or out-of-range lines.
+    """
+    repair = repair_cart_positions(order_products, chunks)
+    if not repair.valid:
+        sample = ', '.join(map(str, repair.invalid_orders[:5]))
+        raise ValueError(f'{len(repair.invalid_orders)} orders do not have cart positions 1..size '
+                         f'after the repair, e.g. order_id {sample}')
+    return repair.apply(order_products)
@@ -0,0 +1,317 @@
+"""Approximate counting for order logs too large to hold in memory.
+
+Exact ``value_counts()`` on ``product_id`` and ``nunique()`` on
+``user_id``/``order_id`` need the whole column (or a hash table as large as
+the number of distinct values) in memory. The sketches here have a fixed
+size chosen up front. Each one can be built per chunk or per process and
+merged afterwards:
+
+- :class:`CountMinSketch` estimates the count of any product. An estimate
+  never undercounts, and with probability ``1 - delta`` it overcounts by at
+  most ``epsilon * N`` rows.
+- :class:`SpaceSaving` tracks the heaviest products. Each reported count
+  is an upper bound, and ``count - error`` is a lower bound.
+- :class:`HyperLogLog` estimates distinct users or orders with a relative
+  standard error of ``1.04 / sqrt(2 ** precision)``.
+
+:class:`OrderLogSketch` bundles them to reproduce the notebook's "top 20
+products" and "orders per customer" reports from streamed chunks.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from instacart.dimensions import DimensionStore
+from instacart.loader import iter_table
+
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def hash64(values, seed=0):
+    """SplitMix64 hash of integer ``values`` as ``uint64``."""
+    offset = ((seed + 1) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    x = np.asarray(values).astype(np.uint64) + np.uint64(offset)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _leading_zeros(x):
+    """Count leading zero bits of each ``uint64`` in ``x``."""
+    x = x.copy()
+    zeros = np.zeros(len(x), dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        empty = (x >> np.uint64(64 - shift)) == 0
+        zeros[empty] += shift
+        x[empty] <<= np.uint64(shift)
+    zeros[x == 0] = 64
+    return zeros
+
+
+class CountMinSketch:
+    """Count-Min sketch over integer keys.
+
+    ``width`` is rounded up to a power of two. For ``N`` counted rows an
+    estimate exceeds the true count by more than ``epsilon * N`` with
+    probability at most ``delta``, where ``epsilon = e / width`` and
+    ``delta = exp(-depth)``.
+    """
+
+    def __init__(self, width=1 << 16, depth=5, seed=0):
+        self.bits = max(1, math.ceil(math.log2(width)))
+        self.depth = depth
+        self.seed = seed
+        self.table = np.zeros((depth, 1 << self.bits), dtype=np.int64)
+        self.total = 0
+
+    @classmethod
+    def from_error(cls, epsilon=1e-4, delta=1e-3, seed=0):
+        """Size a sketch for the given additive error and failure probability."""
+        return cls(math.ceil(math.e / epsilon), math.ceil(math.log(1 / delta)), seed)
+
+    @property
+    def width(self):
+        return self.table.shape[1]
+
+    @property
+    def epsilon(self):
+        return math.e / self.width
+
+    @property
+    def delta(self):
+        return math.exp(-self.depth)
+
+    def _buckets(self, keys, row):
+        return (hash64(keys, self.seed + row) >> np.uint64(64 - self.bits)).astype(np.intp)
+
+    def update(self, keys, weights=None):
+        keys = np.asarray(keys)
+        for row in range(self.depth):
+            self.table[row] += np.bincount(self._buckets(keys, row), weights=weights,
+                                           minlength=self.width).astype(np.int64)
+        self.total += int(len(keys) if weights is None else np.sum(weights))
+        return self
+
+    def estimate(self, keys):
+        keys = np.asarray(keys)
+        rows = [self.table[row].take(self._buckets(keys, row)) for row in range(self.depth)]
+        return np.min(rows, axis=0)
+
+    def merge(self, other):
+        if self.table.shape != other.table.shape or self.seed != other.seed:
+            raise ValueError('Only sketches with the same width, depth and seed can be merged')
+        self.table += other.table
+        self.total += other.total
+        return self
+
+    def error_bound(self):
+        """Additive error that holds with probability ``1 - delta``."""
+        return self.epsilon * self.total
+
+
+class SpaceSaving:
+    """Space-Saving summary of the ``capacity`` heaviest keys.
+
+    For each tracked key, ``counts`` is an upper bound on its true count and
+    ``counts - errors`` is a lower bound. A key that is not tracked occurred
+    at most ``floor`` times. Chunks are folded in with the mergeable-summary
+    rule, so summaries built in different processes combine the same way.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.keys = np.array([], dtype=np.int64)
+        self.counts = np.array([], dtype=np.int64)
+        self.errors = np.array([], dtype=np.int64)
+        self.floor = 0
+        self.total = 0
+
+    def update(self, keys):
+        """Add one occurrence for every key in ``keys``."""
+        unique, counts = np.unique(np.asarray(keys, dtype=np.int64), return_counts=True)
+        chunk = SpaceSaving(self.capacity)
+        chunk.keys, chunk.counts = unique, counts
+        chunk.errors = np.zeros(len(unique), dtype=np.int64)
+        chunk.total = int(counts.sum())
+        return self.merge(chunk)
+
+    def merge(self, other):
+        keys = np.union1d(self.keys, other.keys)
+        counts = np.zeros(len(keys), dtype=np.int64)
+        errors = np.zeros(len(keys), dtype=np.int64)
+        for summary in (self, other):
+            # Keys a summary does not track may have occurred up to its floor
+            position = np.searchsorted(keys, summary.keys)
+            tracked = np.zeros(len(keys), dtype=bool)
+            tracked[position] = True
+            counts[~tracked] += summary.floor
+            errors[~tracked] += summary.floor
+            counts[position] += summary.counts
+            errors[position] += summary.errors
+        floor = self.floor + other.floor
+        if len(keys) > self.capacity:
+            keep = np.argpartition(-counts, self.capacity)[:self.capacity]
+            dropped = np.ones(len(keys), dtype=bool)
+            dropped[keep] = False
+            floor = max(floor, int(counts[dropped].max()))
+            keep.sort()
+            keys, counts, errors = keys[keep], counts[keep], errors[keep]
+        self.keys, self.counts, self.errors = keys, counts, errors
+        self.floor = floor
+        self.total += other.total
+        return self
+
+    def top(self, n):
+        """Return ``(keys, counts, errors)`` of the ``n`` largest tracked keys."""
+        order = np.lexsort((self.keys, -self.counts))[:n]
+        return self.keys[order], self.counts[order], self.errors[order]
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter with ``2 ** precision`` registers."""
+
+    def __init__(self, precision=14, seed=0):
+        self.precision = precision
+        self.seed = seed
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @property
+    def relative_error(self):
+        """Relative standard error of :meth:`estimate`."""
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def update(self, keys):
+        hashed = hash64(keys, self.seed)
+        index = (hashed >> np.uint64(64 - self.precision)).astype(np.intp)
+        rest = (hashed << np.uint64(self.precision)) & _MASK64
+        rank = np.minimum(_leading_zeros(rest) + 1, 64 - self.precision + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        if self.precision != other.precision or self.seed != other.seed:
+            raise ValueError('Only counters with the same precision and seed can be merged')
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        empty = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and empty:
+            # Linear counting is more accurate while many registers are empty
+            return m * math.log(m / empty)
+        return float(raw)
+
+
+class OrderLogSketch:
+    """Fixed-size summary of ``orders`` and ``order_products`` chunks.
+
+    Besides the sketches it keeps the largest ``order_number`` seen for
+    every user in a dense array indexed by ``user_id`` (4 bytes per user).
+    A customer's order count is that maximum, so the orders-per-customer
+    distribution is exact even when a chunk holds only part of a history,
+    and merging two sketches takes the element-wise maximum.
+    """
+
+    def __init__(self, cms_width=1 << 18, cms_depth=5, capacity=2000, precision=14, seed=0):
+        self.products = CountMinSketch(cms_width, cms_depth, seed)
+        self.heavy = SpaceSaving(capacity)
+        self.users = HyperLogLog(precision, seed)
+        self.orders = HyperLogLog(precision, seed + 1)
+        # Largest order_number per user_id, 0 for users never seen
+        self.user_orders = np.zeros(0, dtype=np.int32)
+
+    def update_orders(self, chunk):
+        user_ids = chunk['user_id'].to_numpy()
+        self.users.update(user_ids)
+        self.orders.update(chunk['order_id'].to_numpy())
+        if len(user_ids) == 0:
+            return self
+        largest = int(user_ids.max())
+        if largest >= len(self.user_orders):
+            self.user_orders = np.concatenate(
+                [self.user_orders, np.zeros(largest + 1 - len(self.user_orders), dtype=np.int32)])
+        np.maximum.at(self.user_orders, user_ids.astype(np.intp),
+                      chunk['order_number'].to_numpy().astype(np.int32))
+        return self
+
+    def update_order_products(self, chunk):
+        product_ids = chunk['product_id'].to_numpy()
+        self.products.update(product_ids)
+        self.heavy.update(product_ids)
+        return self
+
+    def merge(self, other):
+        self.products.merge(other.products)
+        self.heavy.merge(other.heavy)
+        self.users.merge(other.users)
+        self.orders.merge(other.orders)
+        if len(other.user_orders) > len(self.user_orders):
+            self.user_orders, other_orders = other.user_orders.copy(), self.user_orders
+        else:
+            other_orders = other.user_orders
+        np.maximum(self.user_orders[:len(other_orders)], other_orders,
+                   out=self.user_orders[:len(other_orders)])
+        return self
+
+    def top_products(self, n=20, products=None):
+        """Approximate top-``n`` products with guaranteed count bounds.
+
+        Candidates are the keys tracked by Space-Saving. They are ranked by
+        their Count-Min estimate clipped to the Space-Saving bounds
+        ``[count_lower, count_upper]``, which is usually much tighter than
+        either sketch alone. ``products`` (a products frame or a
+        :class:`~instacart.dimensions.DimensionStore`) adds ``product_name``.
+        """
+        keys, upper, errors = self.heavy.top(self.heavy.capacity)
+        lower = upper - errors
+        estimate = np.clip(self.products.estimate(keys), lower, upper) if len(keys) else upper
+        order = np.lexsort((keys, -estimate))[:n]
+        result = pd.DataFrame({
+            'product_id': keys[order],
+            'order_count': estimate[order],
+            'count_lower': lower[order],
+            'count_upper': upper[order],
+        })
+        if products is not None:
+            if not isinstance(products, DimensionStore):
+                products = DimensionStore.from_tables(products)
+            names = products.lookup(result['product_id'].to_numpy(), 'product_name')
+            result['product_name'] = np.asarray(names, dtype=object)
+        return result
+
+    def orders_per_customer(self):
+        """Number of customers by their number of orders (largest ``order_number``), exact."""
+        counts = np.bincount(self.user_orders)
+        counts = pd.Series(counts[1:], index=pd.RangeIndex(1, len(counts), name='orders'),
+                           name='customers')
+        return counts[counts > 0]
+
+    def distinct_users(self):
+        return self.users.estimate()
+
+    def distinct_orders(self):
+        return self.orders.estimate()
+
+    def error_bounds(self):
+        """The error guarantees of every estimate, for printing next to the reports."""
+        return {
+            'product_count_additive_error': self.products.error_bound(),
+            'product_count_confidence': 1 - self.products.delta,
+            'top_products_untracked_max_count': self.heavy.floor,
+            'distinct_relative_std_error': self.users.relative_error,
+        }
+
+
+def sketch_order_log(data_dir=None, chunksize=1_000_000, **sketch_options):
+    """Stream both order files from ``data_dir`` into an :class:`OrderLogSketch`."""
+    sketch = OrderLogSketch(**sketch_options)
+    for chunk in iter_table('orders', data_dir, chunksize=chunksize):
+        sketch.update_orders(chunk)
+    for chunk in iter_table('order_products', data_dir, chunksize=chunksize):
+        sketch.update_order_products(chunk)
+    return sketch
@@ -0,0 +1,222 @@
+"""The notebook's load -> clean -> validate -> aggregate -> report steps as stages.
+
+Run a single report without touching anything it does not depend on::
+
+    python -m instacart.stages wed_sat_hour_histogram --data-dir /path/to/csvs
+
+The first run loads ``instacart_orders.csv`` and nothing else. Later runs
+reuse every cached stage output, and re-run only stages whose code or
+inputs changed. See :mod:`instacart.pipeline`.
+"""
+
+import argparse
+import os
+
+from instacart import aggregates, catalog, cleaning, cooccurrence, features, quality, repair
+from instacart.baskets import BasketLayout
+from instacart.charts import (days_chart, dow_chart, hour_chart, order_size_chart,
+                              orders_per_customer_chart, wed_sat_hour_histogram)
+from instacart.cube import OrderCube
+from instacart.dimensions import DimensionStore
+from instacart.loader import DEFAULT_DATA_DIR, TABLES, load_table, table_path
+from instacart.pipeline import FileSource, Pipeline, Stage
+from instacart.topn import top_n_products
+
+
+def _loader(table):
+    def load(path):
+        return load_table(table, path=path)
+    load.__qualname__ = f'load_{table}'
+    return load
+
+
+# Validation
+
+def validate_orders(orders):
+    return quality.check_table('orders', orders)
+
+
+def validate_order_products(order_products):
+    return quality.check_table('order_products', order_products)
+
+
+def validate_products(products):
+    return quality.check_table('products', products)
+
+
+# Dimensions
+
+def dimensions(products, aisles, departments):
+    return DimensionStore.from_tables(products, aisles, departments)
+
+
+def product_catalog(products):
+    return catalog.find_duplicates(products)
+
+
+# Aggregates
+
+def order_cube(orders):
+    return OrderCube.build(orders)
+
+
+def order_hour_counts(order_cube):
+    return order_cube.marginal('order_hour_of_day')
+
+
+def order_dow_counts(order_cube):
+    return order_cube.marginal('order_dow')
+
+
+def days_counts(order_cube):
+    return order_cube.marginal('days_since_prior_order')
+
+
+def wed_sat_hours(order_cube):
+    # Orders per hour on Wednesday (3) and Saturday (6)
+    counts = order_cube.marginal('order_hour_of_day', 'order_dow', order_dow=[3, 6]).unstack()
+    counts.columns = ['Wednesday', 'Saturday']
+    return counts
+
+
+def department_orders_by_day(orders, order_products, dimensions):
+    cube = OrderCube.build(orders, order_products, dimensions)
+    return cube.marginal('department_id', 'order_dow', measure='department_orders',
+                         department_id=range(1, cube.departments)).unstack()
+
+
+def customer_order_counts(orders):
+    return orders.groupby('user_id')['order_number'].max()
+
+
+def order_products_repaired(order_products_cleaned):
+    return repair.repaired_order_products(order_products_cleaned)
+
+
+def basket_layout(order_products):
+    return BasketLayout.from_frame(order_products)
+
+
+def order_sizes(basket_layout):
+    return basket_layout.order_sizes()
+
+
+def top_20_products(order_products, dimensions):
+    return top_n_products(order_products, 20, products=dimensions)
+
+
+def top_20_reordered(order_products, dimensions):
+    return top_n_products(order_products, 20, where='reordered', products=dimensions,
+                          count_name='reorder_count')
+
+
+def top_20_first_added(order_products, dimensions):
+    return top_n_products(order_products, 20, where='first_in_cart', products=dimensions,
+                          count_name='first_added_count')
+
+
+def product_metrics(order_products):
+    return aggregates.reorder_metrics(order_products, 'product_id')
+
+
+def user_metrics(order_products, orders):
+    return aggregates.reorder_metrics(order_products, 'user_id', orders=orders)
+
+
+def user_features(orders_cleaned, order_products_cleaned):
+    return features.build_features(orders_cleaned, order_products_cleaned)
+
+
+def product_pairs(order_products):
+    return cooccurrence.analyze_baskets(order_products, min_support=0.001).pairs
+
+
+def _stage(func, inputs, outputs=None):
+    return Stage(func.__name__, func, tuple(inputs), tuple(outputs or (func.__name__,)))
+
+
+def default_stages():
+    """Return the stages of the notebook analysis.
+
+    Sources are ``<table>_csv`` for each table and ``report_dir``.
+    """
+    stages = [Stage(f'load_{t}', _loader(t), (f'{t}_csv',), (t,)) for t in TABLES]
+    stages += [
+        Stage('clean_orders', cleaning.clean_orders, ('orders',), ('orders_cleaned',)),
+        Stage('clean_order_products', cleaning.clean_order_products, ('order_products',),
+              ('order_products_cleaned',)),
+        Stage('clean_products', cleaning.clean_products, ('products',), ('products_cleaned',)),
+        _stage(validate_orders, ['orders'], ['orders_quality']),
+        _stage(validate_order_products, ['order_products'], ['order_products_quality']),
+        _stage(validate_products, ['products'], ['products_quality']),
+        _stage(dimensions, ['products', 'aisles', 'departments']),
+        _stage(product_catalog, ['products']),
+        # The notebook plots distributions of the raw orders table
+        _stage(order_cube, ['orders']),
+        _stage(order_hour_counts, ['order_cube']),
+        _stage(order_dow_counts, ['order_cube']),
+        _stage(days_counts, ['order_cube']),
+        _stage(wed_sat_hours, ['order_cube']),
+        _stage(department_orders_by_day, ['orders', 'order_products', 'dimensions']),
+        _stage(customer_order_counts, ['orders']),
+        _stage(order_products_repaired, ['order_products_cleaned']),
+        _stage(basket_layout, ['order_products']),
+        _stage(order_sizes, ['basket_layout']),
+        _stage(top_20_products, ['order_products', 'dimensions']),
+        _stage(top_20_reordered, ['order_products', 'dimensions']),
+        _stage(top_20_first_added, ['order_products', 'dimensions']),
+        _stage(product_metrics, ['order_products']),
+        _stage(user_metrics, ['order_products', 'orders']),
+        _stage(user_features, ['orders_cleaned', 'order_products_cleaned']),
+        _stage(product_pairs, ['order_products']),
+        _stage(hour_chart, ['order_hour_counts', 'report_dir']),
+        _stage(dow_chart, ['order_dow_counts', 'report_dir']),
+        _stage(days_chart, ['days_counts', 'report_dir']),
+        _stage(wed_sat_hour_histogram, ['wed_sat_hours', 'report_dir']),
+        _stage(orders_per_customer_chart, ['customer_order_counts', 'report_dir']),
+        _stage(order_size_chart, ['order_sizes', 'report_dir']),
+    ]
+    return stages
+
+
+REPORTS = ('hour_chart', 'dow_chart', 'days_chart', 'wed_sat_hour_histogram',
+           'orders_per_customer_chart', 'order_size_chart')
+
+
+def default_sources(data_dir=None, report_dir='reports'):
+    """Sources for :func:`default_stages`: one :class:`FileSource` per csv plus ``report_dir``."""
+    sources = {f'{t}_csv': FileSource(table_path(t, data_dir)) for t in TABLES}
+    sources['report_dir'] = os.path.abspath(report_dir)
+    return sources
+
+
+def build_pipeline(data_dir=None, cache_dir=None):
+    data_dir = data_dir or DEFAULT_DATA_DIR
+    cache_dir = cache_dir or os.path.join(data_dir, '.instacart_cache', 'stages')
+    return Pipeline(default_stages(), cache_dir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run stages of the Instacart analysis.')
+    parser.add_argument('targets', nargs='*', default=list(REPORTS),
+                        help='stage or output names (default: every chart)')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--report-dir', default='reports')
+    parser.add_argument('--cache-dir')
+    parser.add_argument('--force', nargs='*', default=(), help='stages to re-run even if cached')
+    args = parser.parse_args(argv)
+
+    pipeline = build_pipeline(args.data_dir, args.cache_dir)
+    values, summary = pipeline.run(args.targets, default_sources(args.data_dir, args.report_dir),
+                                   force=args.force)
+    for name in summary.ran:
+        print(f'ran     {name} ({summary.seconds[name]:.2f}s)')
+    for name in summary.cached:
+        print(f'cached  {name}')
+    for name, value in values.items():
+        if isinstance(value, str):
+            print(f'{name}: {value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""Compact in-memory representation of ``order_products``.
+
+An ``order_products`` line is four small integers, yet even the typed frame
+from :mod:`instacart.loader` costs 12 bytes per row before the index, and
+more once ``add_to_cart_order`` goes through ``float64`` or ``Int64``.
+:class:`OrderProductsStore` keeps the four columns as separate typed arrays:
+
+- ``order_id`` and ``product_id``: ``int32``
+- ``add_to_cart_order``: ``uint8``, with 0 standing for a missing position
+  (real positions start at 1)
+- ``reordered``: one bit per line, packed with ``np.packbits``
+
+That is 9.125 bytes per line. Slicing, boolean filters and ``take`` work
+on the arrays directly. :meth:`OrderProductsStore.to_pandas` hands the id
+and cart arrays to pandas without copying them, and
+:meth:`OrderProductsStore.to_arrow` also shares the packed ``reordered``
+bits, which is Arrow's own boolean layout. :meth:`OrderProductsStore.save`
+writes one ``.npy`` file per array, which :meth:`OrderProductsStore.load`
+memory-maps back.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+
+# Stored add_to_cart_order of a line whose position is missing
+MISSING_CART = 0
+
+COLUMNS = ('order_id', 'product_id', 'add_to_cart_order', 'reordered')
+
+
+def _pack(flags):
+    return np.packbits(np.asarray(flags, dtype=bool), bitorder='little')
+
+
+def _unpack(packed, start, stop):
+    """Flags ``start:stop`` of a packed bit array, as a bool array."""
+    first = start // 8
+    bits = np.unpackbits(packed[first:(stop + 7) // 8], bitorder='little')
+    return bits[start - first * 8:stop - first * 8].astype(bool)
+
+
+class OrderProductsStore:
+    """The four ``order_products`` columns as compact typed arrays."""
+
+    def __init__(self, order_id, product_id, add_to_cart_order, reordered, length=None):
+        self.order_id = order_id
+        self.product_id = product_id
+        # uint8 positions, MISSING_CART where unknown
+        self.add_to_cart_order = add_to_cart_order
+        # Bit i (little-endian within each byte) is the reordered flag of line i
+        self.reordered_bits = reordered
+        self.length = len(order_id) if length is None else length
+
+    @classmethod
+    def from_arrays(cls, order_id, product_id, add_to_cart_order, reordered):
+        """Build the store from four column arrays; NaN or missing cart positions are allowed."""
+        if isinstance(add_to_cart_order, pd.Series):
+            add_to_cart_order = add_to_cart_order.to_numpy(dtype=np.float64, na_value=np.nan)
+        cart = np.asarray(add_to_cart_order, dtype=np.float64)
+        known = ~np.isnan(cart)
+        if known.any() and (cart[known].min() < 1 or cart[known].max() > 255):
+            raise ValueError('add_to_cart_order must lie in 1..255 to fit the uint8 column')
+        return cls(np.asarray(order_id, dtype=np.int32), np.asarray(product_id, dtype=np.int32),
+                   np.where(known, cart, MISSING_CART).astype(np.uint8), _pack(reordered))
+
+    @classmethod
+    def from_frame(cls, order_products):
+        """Build the store from an ``order_products`` frame."""
+        return cls.from_arrays(*(order_products[column] for column in COLUMNS))
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def nbytes(self):
+        return (self.order_id.nbytes + self.product_id.nbytes + self.add_to_cart_order.nbytes
+                + self.reordered_bits.nbytes)
+
+    @property
+    def reordered(self):
+        """The reordered flags as a bool array (unpacked, so a copy)."""
+        return _unpack(self.reordered_bits, 0, self.length)
+
+    @property
+    def cart_missing(self):
+        """Boolean mask of the lines with a missing ``add_to_cart_order``."""
+        return self.add_to_cart_order == MISSING_CART
+
+    def __getitem__(self, key):
+        """Rows ``key``: a slice, a boolean mask or an array of row positions."""
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.length)
+            if step == 1:
+                stop = max(start, stop)
+                # Whole bytes can be shared when the slice starts on a byte boundary
+                bits = (self.reordered_bits[start // 8:(stop + 7) // 8] if start % 8 == 0
+                        else _pack(_unpack(self.reordered_bits, start, stop)))
+                return OrderProductsStore(self.order_id[start:stop], self.product_id[start:stop],
+                                          self.add_to_cart_order[start:stop], bits, stop - start)
+            key = np.arange(start, stop, step)
+        key = np.asarray(key)
+        if key.dtype == bool:
+            if len(key) != self.length:
+                raise IndexError(f'boolean mask of length {len(key)} for {self.length} rows')
+            key = np.flatnonzero(key)
+        return self.take(key)
+
+    def take(self, rows):
+        """Rows at the positions ``rows``, in that order; negative positions count from the end."""
+        rows = np.asarray(rows, dtype=np.intp)
+        rows = np.where(rows < 0, rows + self.length, rows)
+        if len(rows) and (rows.min() < 0 or rows.max() >= self.length):
+            raise IndexError(f'row positions out of range for {self.length} rows')
+        flags = (self.reordered_bits[rows >> 3] >> (rows & 7).astype(np.uint8)) & 1
+        return OrderProductsStore(self.order_id[rows], self.product_id[rows],
+                                  self.add_to_cart_order[rows], _pack(flags))
+
+    def filter(self, order_ids=None, product_ids=None, reordered=None):
+        """Lines of any of ``order_ids`` and of any of ``product_ids``, with that ``reordered`` flag."""
+        mask = np.ones(self.length, dtype=bool)
+        if order_ids is not None:
+            mask &= np.isin(self.order_id, order_ids)
+        if product_ids is not None:
+            mask &= np.isin(self.product_id, product_ids)
+        if reordered is not None:
+            mask &= self.reordered == bool(reordered)
+        return self[mask]
+
+    def to_pandas(self):
+        """DataFrame sharing the id and cart arrays with the store.
+
+        ``add_to_cart_order`` is a nullable ``UInt8`` column over the stored
+        positions; only its missing mask and ``reordered`` are new arrays.
+        """
+        cart = pd.arrays.IntegerArray(self.add_to_cart_order, self.cart_missing)
+        return pd.DataFrame({
+            'order_id': self.order_id,
+            'product_id': self.product_id,
+            'add_to_cart_order': cart,
+            'reordered': self.reordered.view(np.uint8),
+        }, copy=False)
+
+    def to_arrow(self):
+        """Arrow table sharing every buffer except the cart validity bitmap."""
+        if pa is None:
+            raise ImportError('Arrow conversion needs pyarrow: pip install pyarrow')
+        validity = pa.py_buffer(_pack(~self.cart_missing))
+        cart = pa.Array.from_buffers(pa.uint8(), self.length,
+                                     [validity, pa.py_buffer(self.add_to_cart_order)])
+        reordered = pa.Array.from_buffers(pa.bool_(), self.length,
+                                          [None, pa.py_buffer(self.reordered_bits)])
+        return pa.table({'order_id': pa.array(self.order_id), 'product_id': pa.array(self.product_id),
+                         'add_to_cart_order': cart, 'reordered': reordered})
+
+    def save(self, path):
+        """Write the store to folder ``path`` as one ``.npy`` file per array."""
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'order_id.npy'), self.order_id)
+        np.save(os.path.join(path, 'product_id.npy'), self.product_id)
+        np.save(os.path.join(path, 'add_to_cart_order.npy'), self.add_to_cart_order)
+        np.save(os.path.join(path, 'reordered_bits.npy'), self.reordered_bits)
+        with open(os.path.join(path, 'store.json'), 'w') as f:
+            json.dump({'rows': self.length}, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Open a store written by :meth:`save`, memory-mapped by default."""
+        with open(os.path.join(path, 'store.json')) as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+                  for name in ('order_id', 'product_id', 'add_to_cart_order', 'reordered_bits')]
+        return cls(*arrays, length=meta['rows'])
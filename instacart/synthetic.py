@@ -0,0 +1,233 @@
+"""Deterministic Instacart-shaped order files at any scale.
+
+The order tables are not in the repository, so this writes stand-ins that
+:mod:`instacart.loader` reads like the real ones. They have the same five
+csv files and the shapes the notebook looks at:
+
+- order hour and day of week follow the real skew (late morning, Sunday
+  and Monday busiest)
+- ``days_since_prior_order`` is 0..30 with spikes at weekly intervals and
+  at the 30 day cap, and missing for a customer's first order
+- order sizes have a long tail past 64 items; ``add_to_cart_order`` is
+  missing beyond 64, as in the real data
+- products are drawn from the real ``products.csv`` ids with Zipfian
+  popularity, and each customer keeps buying from a personal pool, so
+  ``reordered`` comes out near the real rate
+- a few exact duplicate rows are injected into both order tables, and some
+  product names get stray whitespace
+
+``scale=1`` is the size of the notebook's dataset (about 479k orders and
+4.5M order lines). The same ``seed`` and ``scale`` always give the same
+files, because every block of customers has its own random stream::
+
+    python -m instacart.synthetic /tmp/instacart_10x --scale 10
+"""
+
+import argparse
+import os
+import shutil
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from instacart.loader import SEP, TABLE_FILES, load_table
+
+# Folder holding products.csv, aisles.csv and departments.csv
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BASE_ORDERS = 478_967
+
+HOUR_WEIGHTS = np.array([0.7, 0.4, 0.2, 0.2, 0.2, 0.3, 0.9, 2.8, 5.3, 7.6, 8.4, 8.4,
+                         8.2, 8.2, 8.3, 8.3, 8.0, 6.7, 5.2, 4.0, 3.1, 2.5, 2.0, 1.4])
+
+# Sunday first, like order_dow
+DOW_WEIGHTS = np.array([19.5, 17.4, 13.0, 12.0, 11.7, 12.9, 13.8])
+
+CART_LIMIT = 64
+
+# Customers generated per block; each block has its own random stream
+USERS_PER_BLOCK = 50_000
+
+
+def _days_weights():
+    days = np.arange(31)
+    weights = 10 * np.exp(-days / 7) + 1
+    for day, boost in ((7, 2.2), (14, 1.6), (21, 1.4), (28, 1.3)):
+        weights[day] *= boost
+    weights[30] = 12
+    return weights
+
+
+def _normalized(weights):
+    return weights / weights.sum()
+
+
+@dataclass
+class SyntheticStats:
+    path: str
+    users: int
+    orders: int
+    order_products: int
+    duplicate_orders: int
+    duplicate_order_products: int
+
+
+class _Products:
+    """Zipfian sampler over the real product ids."""
+
+    def __init__(self, product_ids, exponent, offset, seed):
+        rng = np.random.default_rng([seed, 0])
+        # Popularity rank is a fixed random permutation of the ids
+        self.ids = rng.permutation(product_ids)
+        ranks = np.arange(1, len(self.ids) + 1)
+        # Zipf-Mandelbrot: the offset flattens the head, so the best seller
+        # gets under 2% of lines as in the real data
+        self.cumulative = np.cumsum(_normalized((ranks + offset) ** -exponent))
+
+    def sample(self, rng, size):
+        index = np.searchsorted(self.cumulative, rng.random(size), side='right')
+        return self.ids[np.minimum(index, len(self.ids) - 1)]
+
+
+def _order_sizes(rng, count):
+    sizes = 1 + rng.negative_binomial(1.6, 0.15, count)
+    # A small share of very large orders gives the tail past CART_LIMIT
+    large = rng.random(count) < 0.003
+    sizes[large] = CART_LIMIT + 1 + np.minimum(rng.pareto(2.0, large.sum()) * 20, 80).astype(int)
+    return sizes
+
+
+def _positions(line_orders):
+    """1-based position of each line within its run of equal ``line_orders``."""
+    bounds = np.flatnonzero(np.r_[True, line_orders[1:] != line_orders[:-1]])
+    lengths = np.diff(np.r_[bounds, len(line_orders)])
+    return np.arange(len(line_orders)) - np.repeat(bounds, lengths) + 1
+
+
+def _block(rng, first_user, users, first_order, products, pool_size, pool_share):
+    """Generate the orders and order lines of ``users`` consecutive customers."""
+    orders_per_user = np.minimum(1 + rng.geometric(0.3, users), 100)
+    user_ids = np.repeat(np.arange(first_user, first_user + users), orders_per_user)
+    count = len(user_ids)
+    # Most customers are seen part way through their history
+    start = np.where(rng.random(users) < 0.2, 1, rng.integers(2, 50, users))
+    starts = np.repeat(np.cumsum(orders_per_user) - orders_per_user, orders_per_user)
+    order_number = np.minimum(np.repeat(start, orders_per_user) + np.arange(count) - starts, 100)
+    days = rng.choice(31, count, p=_normalized(_days_weights())).astype(np.float32)
+    days[order_number == 1] = np.nan
+    orders = pd.DataFrame({
+        'order_id': np.arange(first_order, first_order + count, dtype=np.int64),
+        'user_id': user_ids,
+        'order_number': order_number,
+        'order_dow': rng.choice(7, count, p=_normalized(DOW_WEIGHTS)),
+        'order_hour_of_day': rng.choice(24, count, p=_normalized(HOUR_WEIGHTS)),
+        'days_since_prior_order': days,
+    })
+
+    sizes = _order_sizes(rng, count)
+    # Draw twice the lines needed, drop repeated products, then trim each
+    # order to its size; repeats are common in pools and popular products.
+    line_orders = np.repeat(np.arange(count), 2 * sizes)
+    line_users = user_ids[line_orders] - first_user
+    # Lines come either from the customer's pool or from the whole catalog
+    pools = products.sample(rng, users * pool_size).reshape(users, pool_size)
+    product_id = products.sample(rng, len(line_orders))
+    from_pool = rng.random(len(line_orders)) < pool_share
+    picks = rng.integers(0, pool_size, from_pool.sum())
+    product_id[from_pool] = pools[line_users[from_pool], picks]
+
+    keep = ~pd.Series(line_orders * (1 << 17) + product_id).duplicated().to_numpy()
+    cart = _positions(line_orders[keep])
+    keep[keep] = cart <= sizes[line_orders[keep]]
+    line_orders, line_users = line_orders[keep], line_users[keep]
+    product_id, from_pool = product_id[keep], from_pool[keep]
+
+    # Orders are generated in order_number order, so a repeat of (customer,
+    # product) is a reorder. Customers seen part way through their history
+    # bought their pool products before the first generated order.
+    reordered = pd.Series(line_users * (1 << 17) + product_id).duplicated().to_numpy()
+    reordered = reordered | (from_pool & (start[line_users] > 1))
+
+    cart = _positions(line_orders).astype(np.float64)
+    cart[cart > CART_LIMIT] = np.nan
+    order_products = pd.DataFrame({
+        'order_id': orders['order_id'].to_numpy()[line_orders],
+        'product_id': product_id,
+        'add_to_cart_order': cart,
+        'reordered': reordered.astype(np.uint8),
+    })
+    return orders, order_products
+
+
+def _with_duplicates(rng, frame, rate):
+    copies = frame.iloc[np.flatnonzero(rng.random(len(frame)) < rate)]
+    frame = pd.concat([frame, copies], ignore_index=True)
+    # The real files are in no particular order
+    return frame.iloc[rng.permutation(len(frame))], len(copies)
+
+
+def _write_dimensions(out_dir, source_dir, rng, whitespace_rate):
+    for table in ('aisles', 'departments'):
+        shutil.copyfile(os.path.join(source_dir, TABLE_FILES[table]),
+                        os.path.join(out_dir, TABLE_FILES[table]))
+    products = pd.read_csv(os.path.join(source_dir, TABLE_FILES['products']), sep=SEP, dtype=str)
+    padded = (rng.random(len(products)) < whitespace_rate) & products['product_name'].notna()
+    pads = np.array([' ', '  ', '\t'])
+    products.loc[padded, 'product_name'] = (pads[rng.integers(0, 3, padded.sum())]
+                                            + products.loc[padded, 'product_name']
+                                            + pads[rng.integers(0, 3, padded.sum())])
+    products.to_csv(os.path.join(out_dir, TABLE_FILES['products']), sep=SEP, index=False)
+
+
+def generate(out_dir, scale=1.0, seed=0, source_dir=None, zipf_exponent=1.0, zipf_offset=5,
+             pool_size=20, pool_share=0.65, duplicate_rate=5e-5, whitespace_rate=0.01):
+    """Write the five Instacart csv files to ``out_dir`` and return :class:`SyntheticStats`.
+
+    ``source_dir`` holds the real ``products.csv``, ``aisles.csv`` and
+    ``departments.csv`` (default: the repository root). The order tables are
+    written block by block, so memory use does not grow with ``scale``.
+    """
+    source_dir = source_dir or REPO_DIR
+    os.makedirs(out_dir, exist_ok=True)
+    _write_dimensions(out_dir, source_dir, np.random.default_rng([seed, 1]), whitespace_rate)
+    products = _Products(load_table('products', source_dir)['product_id'].to_numpy(),
+                         zipf_exponent, zipf_offset, seed)
+
+    # Expected orders per customer is 1 + 1 / 0.3
+    total_users = max(1, round(BASE_ORDERS * scale / (1 + 1 / 0.3)))
+    stats = SyntheticStats(out_dir, total_users, 0, 0, 0, 0)
+    paths = {t: os.path.join(out_dir, TABLE_FILES[t]) for t in ('orders', 'order_products')}
+    first_order = 1
+    for block, first_user in enumerate(range(1, total_users + 1, USERS_PER_BLOCK)):
+        rng = np.random.default_rng([seed, 2, block])
+        users = min(USERS_PER_BLOCK, total_users + 1 - first_user)
+        orders, order_products = _block(rng, first_user, users, first_order, products,
+                                        pool_size, pool_share)
+        first_order += len(orders)
+        stats.orders += len(orders)
+        stats.order_products += len(order_products)
+        orders, copies = _with_duplicates(rng, orders, duplicate_rate)
+        stats.duplicate_orders += copies
+        order_products, copies = _with_duplicates(rng, order_products, duplicate_rate)
+        stats.duplicate_order_products += copies
+        for table, frame in (('orders', orders), ('order_products', order_products)):
+            frame.to_csv(paths[table], sep=SEP, index=False, header=block == 0,
+                         mode='w' if block == 0 else 'a')
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write synthetic Instacart csv files.')
+    parser.add_argument('out_dir')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help=f'1 is the notebook dataset size ({BASE_ORDERS:,} orders)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--source-dir', help='folder with the real products, aisles and departments csv')
+    args = parser.parse_args(argv)
+    stats = generate(args.out_dir, args.scale, args.seed, args.source_dir)
+    print(stats)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+import pytest
+
+from instacart.synthetic import generate
+
+
+@pytest.fixture(scope='session')
+def synthetic_dir(tmp_path_factory):
+    """A small :mod:`instacart.synthetic` dataset, shared by every test module."""
+    path = tmp_path_factory.mktemp('synthetic')
+    generate(str(path), scale=0.005, seed=3, duplicate_rate=2e-3)
+    return str(path)
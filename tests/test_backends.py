@@ -0,0 +1,85 @@
+"""Every analysis backend returns the same results as the pandas reference.
+
+The fixture is the small :mod:`instacart.synthetic` dataset, which has
+duplicate rows in both order tables, plus rows written here for the edge
+cases: first orders with a missing ``days_since_prior_order``, and an order
+of more than 64 items whose later lines have no ``add_to_cart_order``.
+"""
+
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from instacart import cleaning
+from instacart.analysis import ANALYSES, BACKENDS, CART_LIMIT, TOP_N, compare_results, run_analyses
+from instacart.loader import SEP, TABLE_FILES, load_table
+
+# More lines than the source data records cart positions for
+LARGE_ORDER_ITEMS = CART_LIMIT + 16
+
+
+def _append(path, rows):
+    with open(path, 'a') as f:
+        for row in rows:
+            f.write(SEP.join('' if value is None else str(value) for value in row) + '\n')
+
+
+@pytest.fixture(scope='module')
+def data_dir(synthetic_dir, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('edge_cases'))
+    shutil.copytree(synthetic_dir, path, dirs_exist_ok=True)
+    orders = load_table('orders', path)
+    products = load_table('products', path)['product_id'].to_numpy()
+    user, order = int(orders['user_id'].max()) + 1, int(orders['order_id'].max()) + 1
+    # Two new customers: one with a single first order, one whose first order
+    # is followed by an order of LARGE_ORDER_ITEMS lines
+    _append(os.path.join(path, TABLE_FILES['orders']), [
+        (order, user, 1, 3, 2, None),
+        (order + 1, user + 1, 1, 0, 10, None),
+        (order + 2, user + 1, 2, 6, 23, 30.0),
+    ])
+    lines = [(order, products[0], 1.0, 0), (order + 1, products[1], 1.0, 0)]
+    lines += [(order + 2, products[i], float(i + 1) if i < CART_LIMIT else None, int(i % 3 == 0))
+              for i in range(LARGE_ORDER_ITEMS)]
+    _append(os.path.join(path, TABLE_FILES['order_products']), lines)
+    return path
+
+
+def test_fixture_has_the_edge_cases(data_dir):
+    orders = load_table('orders', data_dir)
+    order_products = load_table('order_products', data_dir)
+    first = orders['order_number'] == 1
+    assert first.any() and orders.loc[first, 'days_since_prior_order'].isna().all()
+    sizes = order_products.groupby('order_id').size()
+    assert sizes.max() >= LARGE_ORDER_ITEMS
+    assert order_products['add_to_cart_order'].isna().sum() >= LARGE_ORDER_ITEMS - CART_LIMIT
+    assert orders.duplicated().any() and order_products.duplicated().any()
+
+
+@pytest.fixture(scope='module')
+def expected(data_dir):
+    return run_analyses(data_dir=data_dir, backend='pandas')
+
+
+def test_pandas_reference_matches_the_notebook(data_dir, expected):
+    orders = cleaning.clean_orders(load_table('orders', data_dir))
+    order_products = cleaning.clean_order_products(load_table('order_products', data_dir))
+
+    assert set(expected) == set(ANALYSES)
+    pd.testing.assert_series_equal(expected['order_hour_counts'],
+                                   orders['order_hour_of_day'].value_counts().sort_index(),
+                                   check_names=False)
+    pd.testing.assert_series_equal(expected['customer_order_counts'],
+                                   orders.groupby('user_id')['order_number'].max(), check_names=False)
+    pd.testing.assert_series_equal(expected['order_sizes'],
+                                   order_products.groupby('order_id').size(), check_names=False)
+    top = order_products['product_id'].value_counts()
+    assert expected['top_products']['order_count'].tolist() == top.head(TOP_N).tolist()
+
+
+@pytest.mark.parametrize('backend', [b for b in BACKENDS if b != 'pandas'])
+def test_backend_matches_pandas(backend, data_dir, expected):
+    pytest.importorskip(backend)
+    assert compare_results(run_analyses(data_dir=data_dir, backend=backend), expected) == {}
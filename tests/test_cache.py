@@ -0,0 +1,66 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from instacart import cache
+
+pytest.importorskip('pyarrow')
+
+TABLES = ('orders', 'departments')
+
+
+@pytest.fixture
+def data_dir(synthetic_dir, tmp_path):
+    # A private copy, so tests can touch the csv files
+    path = tmp_path / 'data'
+    shutil.copytree(synthetic_dir, path)
+    return str(path)
+
+
+def _entries(cache_dir):
+    return sorted(name for name in os.listdir(cache_dir) if os.path.isdir(os.path.join(cache_dir, name)))
+
+
+def test_manifest_records_the_entry(data_dir, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    frames = cache.load_cleaned_tables(data_dir, TABLES, cache_dir)
+    [entry] = _entries(cache_dir)
+    with open(os.path.join(cache_dir, entry, 'manifest.json')) as f:
+        manifest = json.load(f)
+    assert manifest['entry'] == entry
+    assert manifest['tables'] == sorted(TABLES)
+    assert manifest['rows'] == {table: len(frame) for table, frame in frames.items()}
+
+
+def test_warm_start_reads_the_cache(data_dir, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    cold = cache.load_cleaned_tables(data_dir, TABLES, cache_dir)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('csv files parsed on a warm start')
+
+    monkeypatch.setattr(cache, 'load_tables', fail)
+    warm = cache.load_cleaned_tables(data_dir, TABLES, cache_dir)
+    for table in TABLES:
+        assert warm[table].equals(cold[table])
+
+
+def test_changed_source_prunes_only_its_own_entries(data_dir, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    other_dir = str(tmp_path / 'other')
+    shutil.copytree(data_dir, other_dir)
+    cache.load_cleaned_tables(data_dir, TABLES, cache_dir)
+    cache.load_cleaned_tables(other_dir, TABLES, cache_dir)
+    before = _entries(cache_dir)
+    assert len(before) == 2
+
+    with open(os.path.join(data_dir, 'departments.csv'), 'a') as f:
+        f.write('99;extra\n')
+    frames = cache.load_cleaned_tables(data_dir, TABLES, cache_dir)
+    after = _entries(cache_dir)
+    assert len(after) == 2
+    other = [name for name in before if name.startswith(cache.source_id(other_dir, TABLES))]
+    assert other and other[0] in after
+    assert frames['departments']['department_id'].max() == 99
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from instacart.cube import LINE_MEASURES, ORDER_MEASURES, OrderCube
+from instacart.dimensions import DimensionStore
+from instacart.loader import load_table
+
+
+@pytest.fixture(scope='module')
+def tables(synthetic_dir):
+    return (load_table('orders', synthetic_dir), load_table('order_products', synthetic_dir),
+            DimensionStore.from_data_dir(synthetic_dir))
+
+
+@pytest.fixture(scope='module')
+def full(tables):
+    return OrderCube.build(*tables)
+
+
+def _assert_same(cube, full):
+    for measure in ORDER_MEASURES + LINE_MEASURES:
+        assert np.array_equal(cube.measures[measure], full.measures[measure]), measure
+
+
+def test_counts_match_the_orders(tables, full):
+    orders, order_products, _ = tables
+    wednesday_2am = (orders['order_dow'] == 3) & (orders['order_hour_of_day'] == 2)
+    assert full.count(order_dow=3, order_hour_of_day=2) == wednesday_2am.sum()
+    assert full.marginal('order_dow').tolist() == orders['order_dow'].value_counts().sort_index().tolist()
+    assert full.count(days_since_prior_order=None) == orders['days_since_prior_order'].isna().sum()
+    assert full.count('items') == len(order_products)
+    assert full.unmatched_lines == 0
+
+
+def test_batches_in_any_order_match_one_build(tables, full, tmp_path):
+    orders, order_products, dimensions = tables
+    rng = np.random.default_rng(0)
+    order_batches = np.array_split(rng.permutation(len(orders)), 4)
+    line_batches = np.array_split(rng.permutation(len(order_products)), 4)
+    cube = OrderCube.empty()
+    for i in range(4):
+        # Lines come first, so some wait for orders of later batches
+        cube.update(order_products=order_products.iloc[line_batches[i]], dimensions=dimensions)
+        if i == 1:
+            assert cube.unmatched_lines > 0
+            cube.save(tmp_path)
+            cube = OrderCube.load(tmp_path)
+        cube.update(orders=orders.iloc[order_batches[i]])
+    assert cube.unmatched_lines == 0
+    _assert_same(cube, full)
+
+
+def test_lines_without_orders_wait(tables):
+    orders, order_products, dimensions = tables
+    cube = OrderCube.build(orders.iloc[:0], order_products, dimensions)
+    assert cube.unmatched_lines == len(order_products)
+    assert cube.count('items') == 0
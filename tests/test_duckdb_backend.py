@@ -0,0 +1,43 @@
+import shutil
+
+import pandas as pd
+import pytest
+
+from instacart.cleaning import clean_orders
+from instacart.loader import SEP, load_table, table_path
+
+pytest.importorskip('duckdb')
+
+from instacart import duckdb_backend  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def data_dir(synthetic_dir, tmp_path_factory):
+    # Repeat some order ids with different values after the first row, so
+    # which duplicate survives the cleaning shows in the results
+    path = tmp_path_factory.mktemp('conflicting')
+    shutil.copytree(synthetic_dir, path, dirs_exist_ok=True)
+    orders = load_table('orders', str(path))
+    repeats = orders.sample(50, random_state=0).copy()
+    repeats['order_hour_of_day'] = (repeats['order_hour_of_day'] + 7) % 24
+    repeats['order_dow'] = (repeats['order_dow'] + 1) % 7
+    pd.concat([orders, repeats]).to_csv(table_path('orders', str(path)), sep=SEP, index=False)
+    return str(path)
+
+
+def _clean_orders(con):
+    return con.execute('SELECT * FROM orders_clean ORDER BY order_id').df()
+
+
+def _assert_keeps_first(actual, data_dir):
+    expected = clean_orders(load_table('orders', data_dir)).sort_values('order_id', ignore_index=True)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+def test_orders_clean_keeps_the_first_row(data_dir):
+    _assert_keeps_first(_clean_orders(duckdb_backend.connect(data_dir, threads=4)), data_dir)
+
+
+def test_orders_clean_keeps_the_first_row_from_parquet(data_dir, tmp_path):
+    parquet_dir = duckdb_backend.export_parquet(data_dir, str(tmp_path), tables=('orders',))
+    _assert_keeps_first(_clean_orders(duckdb_backend.connect(data_dir, parquet_dir, threads=4)), data_dir)
@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+import pytest
+
+from instacart.incremental import IncrementalAggregates, SortedKeySet, verify
+from instacart.loader import load_table
+
+
+@pytest.fixture(scope='module')
+def tables(synthetic_dir):
+    return load_table('orders', synthetic_dir), load_table('order_products', synthetic_dir)
+
+
+def _batches(frame, count, seed):
+    rows = np.random.default_rng(seed).permutation(len(frame))
+    return [frame.iloc[part] for part in np.array_split(rows, count)]
+
+
+def test_batches_match_a_full_recompute(tables):
+    orders, order_products = tables
+    state = IncrementalAggregates()
+    # Lines arrive before their orders, and every batch is fed twice
+    for order_batch, line_batch in zip(_batches(orders, 4, 0), _batches(order_products, 4, 1)):
+        state.ingest(order_products=line_batch)
+        state.ingest(orders=order_batch)
+        assert state.ingest(order_batch, line_batch) == (0, 0)
+    assert len(state.pending) == 0
+    verify(state, orders, order_products)
+
+
+def test_save_and_load_resume(tables, tmp_path):
+    orders, order_products = tables
+    state = IncrementalAggregates()
+    order_batches, line_batches = _batches(orders, 3, 2), _batches(order_products, 3, 3)
+    for i in range(3):
+        state.ingest(orders=order_batches[i])
+        state.save(tmp_path)
+        state = IncrementalAggregates.load(tmp_path)
+        state.ingest(order_products=line_batches[i])
+    verify(state, orders, order_products)
+
+
+def test_save_writes_only_new_runs(tables, tmp_path):
+    orders, order_products = tables
+    state = IncrementalAggregates()
+    state.ingest(orders, order_products.iloc[:-10])
+    state.save(tmp_path)
+    before = {name: os.stat(tmp_path / name).st_mtime_ns
+              for name in os.listdir(tmp_path) if name.startswith('lines_')}
+
+    state.ingest(order_products=order_products.iloc[-10:])
+    state.save(tmp_path)
+    after = {name: os.stat(tmp_path / name).st_mtime_ns
+             for name in os.listdir(tmp_path) if name.startswith('lines_')}
+    assert {name: after[name] for name in before} == before
+    assert len(after) == len(before) + 1
+    verify(IncrementalAggregates.load(tmp_path), orders, order_products)
+
+
+def test_merged_runs_replace_their_files(tmp_path):
+    keys = SortedKeySet()
+    keys.add(np.arange(0, 10))
+    keys.save(tmp_path)
+    keys.prune()
+    keys.add(np.arange(10, 30))
+    files = keys.save(tmp_path)
+    keys.prune()
+    assert len(files) == 1 and sorted(os.listdir(tmp_path)) == files
+    loaded = SortedKeySet.load(tmp_path, files)
+    assert loaded.contains(np.array([0, 29, 30])).tolist() == [True, True, False]
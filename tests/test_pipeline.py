@@ -0,0 +1,103 @@
+import os
+import sys
+import textwrap
+
+import pytest
+
+from instacart.pipeline import Pipeline, Stage
+
+CALLS = []
+
+
+def double(x):
+    CALLS.append('double')
+    return 2 * x
+
+
+def plus_one(y):
+    CALLS.append('plus_one')
+    return y + 1
+
+
+def write_file(y, folder):
+    CALLS.append('write_file')
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, 'out.txt')
+    with open(path, 'w') as f:
+        f.write(str(y))
+    return path
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    CALLS.clear()
+    return Pipeline([
+        Stage('double', double, ('x',), ('y',)),
+        Stage('plus_one', plus_one, ('y',), ('z',)),
+        Stage('write_file', write_file, ('y', 'folder'), ('path',)),
+    ], str(tmp_path / 'cache'))
+
+
+def test_cached_stages_are_not_rerun(pipeline):
+    values, summary = pipeline.run('z', {'x': 3})
+    assert values == {'z': 7} and summary.ran == ['double', 'plus_one']
+    CALLS.clear()
+    values, summary = pipeline.run('z', {'x': 3})
+    # The input of a cached stage is not even read back
+    assert values == {'z': 7} and summary.ran == [] and summary.cached == ['plus_one']
+    assert CALLS == []
+
+
+def test_changed_source_reruns_downstream(pipeline):
+    pipeline.run('z', {'x': 3})
+    values, summary = pipeline.run('z', {'x': 4})
+    assert values == {'z': 9} and summary.ran == ['double', 'plus_one']
+
+
+def test_force(pipeline):
+    pipeline.run('z', {'x': 3})
+    _, summary = pipeline.run('z', {'x': 3}, force=('plus_one',))
+    assert summary.ran == ['plus_one'] and summary.cached == ['double']
+
+
+def test_missing_output_file_reruns_the_stage(pipeline, tmp_path):
+    sources = {'x': 3, 'folder': str(tmp_path / 'report')}
+    values, _ = pipeline.run('path', sources)
+    _, summary = pipeline.run('path', sources)
+    assert summary.ran == []
+    os.remove(values['path'])
+    values, summary = pipeline.run('path', sources)
+    assert summary.ran == ['write_file'] and os.path.exists(values['path'])
+
+
+def test_fingerprint_follows_package_helpers(tmp_path, monkeypatch):
+    package = tmp_path / 'stagepkg'
+    package.mkdir()
+    (package / '__init__.py').write_text('')
+    (package / 'helpers.py').write_text('SCALE = 2\n\n\ndef scale(x):\n    return SCALE * x\n')
+    (package / 'stages.py').write_text(textwrap.dedent('''
+        from stagepkg.helpers import scale
+
+
+        def _local(x):
+            return x + 1
+
+
+        def stage(x):
+            return scale(_local(x))
+
+
+        def other(x):
+            return x
+    '''))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    from stagepkg import stages
+    try:
+        stage, other = Stage('stage', stages.stage), Stage('other', stages.other)
+        before = stage.code_fingerprint(), other.code_fingerprint()
+        (package / 'helpers.py').write_text('SCALE = 30\n\n\ndef scale(x):\n    return SCALE * x\n')
+        after = stage.code_fingerprint(), other.code_fingerprint()
+        assert after[0] != before[0] and after[1] == before[1]
+    finally:
+        for name in [name for name in sys.modules if name.startswith('stagepkg')]:
+            del sys.modules[name]
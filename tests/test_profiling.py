@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from instacart import profiling
+
+
+@pytest.mark.parametrize('value', ['', '0', 'false', 'No', 'OFF', ' off '])
+def test_off_values_disable_profiling(value):
+    assert profiling.profile_path(value) is None
+
+
+@pytest.mark.parametrize('value', ['1', 'true', 'YES', 'on'])
+def test_on_values_use_the_default_path(value):
+    assert profiling.profile_path(value) == profiling.DEFAULT_PATH
+
+
+def test_other_values_are_paths():
+    assert profiling.profile_path('run/profile.json') == 'run/profile.json'
+
+
+def test_import_with_profiling_off_writes_nothing(tmp_path):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, INSTACART_PROFILE='0', PYTHONPATH=root)
+    code = ('import tracemalloc, instacart.profiling as p\n'
+            'assert p._profiler is None and not tracemalloc.is_tracing()\n'
+            'with p.step("x"): pass\n')
+    subprocess.run([sys.executable, '-c', code], cwd=tmp_path, env=env, check=True)
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from instacart.baskets import BasketLayout
+from instacart.cleaning import clean_order_products
+from instacart.loader import load_table
+from instacart.repair import invalid_runs, repair_cart_positions, repaired_order_products
+
+
+@pytest.fixture(scope='module')
+def order_products(synthetic_dir):
+    return clean_order_products(load_table('order_products', synthetic_dir))
+
+
+def _expected_positions(order_products):
+    # Missing positions follow the largest known one of their order, in row order
+    cart = order_products['add_to_cart_order'].astype('Float64')
+    last = cart.groupby(order_products['order_id']).transform('max').fillna(0)
+    rank = cart.isna().astype(int).groupby(order_products['order_id']).cumsum()
+    return np.where(cart.isna(), last + rank, cart.fillna(0)).astype(np.int64)
+
+
+def test_repair_fills_positions_past_64(order_products):
+    repair = repair_cart_positions(order_products)
+    missing = order_products['add_to_cart_order'].isna()
+    assert missing.any()
+    assert repair.valid
+    assert repair.repaired_lines == missing.sum()
+    assert repair.repaired_orders == order_products.loc[missing, 'order_id'].nunique()
+    assert np.array_equal(repair.positions, _expected_positions(order_products))
+
+
+@pytest.mark.parametrize('chunks', [2, 5])
+def test_chunks_give_the_same_repair(order_products, chunks):
+    single = repair_cart_positions(order_products)
+    chunked = repair_cart_positions(order_products, chunks=chunks)
+    assert np.array_equal(chunked.positions, single.positions)
+    assert (chunked.repaired_lines, chunked.repaired_orders) == (single.repaired_lines,
+                                                                single.repaired_orders)
+
+
+def test_invalid_runs():
+    layout = BasketLayout.from_order_ids(np.array([3, 1, 3, 2, 1, 2, 4]))
+    # order 1: 2, 1 valid; order 2: 1, 1 repeated; order 3: 1, 3 gap; order 4: 1 valid
+    positions = np.array([1, 2, 3, 1, 1, 1, 1])
+    assert layout.order_ids[invalid_runs(layout, positions)].tolist() == [2, 3]
+
+
+def test_duplicate_lines_are_rejected(order_products):
+    doubled = pd.concat([order_products, order_products.iloc[:1]], ignore_index=True)
+    repair = repair_cart_positions(doubled, chunks=3)
+    assert repair.invalid_orders.tolist() == [order_products['order_id'].iloc[0]]
+    with pytest.raises(ValueError):
+        repaired_order_products(doubled)
+    repaired = repaired_order_products(order_products, chunks=2)
+    assert repaired['add_to_cart_order'].notna().all()
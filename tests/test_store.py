@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from instacart.loader import load_table
+from instacart.store import OrderProductsStore
+
+
+@pytest.fixture(scope='module')
+def order_products(synthetic_dir):
+    return load_table('order_products', synthetic_dir)
+
+
+@pytest.fixture(scope='module')
+def store(order_products):
+    return OrderProductsStore.from_frame(order_products)
+
+
+def _assert_rows(result, frame):
+    expected = frame.reset_index(drop=True)
+    assert np.array_equal(result.order_id, expected['order_id'].to_numpy())
+    assert np.array_equal(result.product_id, expected['product_id'].to_numpy())
+    assert np.array_equal(result.reordered, expected['reordered'].to_numpy() == 1)
+    pd.testing.assert_series_equal(result.to_pandas()['add_to_cart_order'].astype('Int64'),
+                                   expected['add_to_cart_order'].astype('Int64'))
+
+
+def test_round_trip(store, order_products):
+    assert len(store) == len(order_products)
+    assert store.cart_missing.any()
+    _assert_rows(store, order_products)
+
+
+@pytest.mark.parametrize('rows', [[0, 5, 3], [-3, -9], [-1, 0, 17, -2]])
+def test_take(store, order_products, rows):
+    _assert_rows(store.take(rows), order_products.iloc[rows])
+    _assert_rows(store[np.array(rows)], order_products.iloc[rows])
+
+
+def test_take_out_of_range(store):
+    with pytest.raises(IndexError):
+        store.take([len(store)])
+    with pytest.raises(IndexError):
+        store.take([-len(store) - 1])
+
+
+@pytest.mark.parametrize('key', [slice(8, 40), slice(3, 29), slice(-20, None), slice(5, 60, 7),
+                                 slice(10, 2)])
+def test_slices(store, order_products, key):
+    _assert_rows(store[key], order_products.iloc[key])
+
+
+def test_boolean_mask(store, order_products):
+    mask = order_products['reordered'].to_numpy() == 1
+    _assert_rows(store[mask], order_products[mask])
+
+
+def test_save_and_load(store, order_products, tmp_path):
+    store.save(tmp_path)
+    _assert_rows(OrderProductsStore.load(tmp_path)[-100:], order_products.iloc[-100:])